@@ -1,4 +1,4 @@
-from flask import Flask, request, render_template, jsonify, flash, redirect, url_for, session
+from flask import Flask, request, render_template, jsonify, flash, redirect, url_for, session, Response, stream_with_context
 import os
 import time
 import json
@@ -9,9 +9,17 @@ import numpy as np
 import io
 import base64
 from werkzeug.utils import secure_filename
-from pdf_processing import extract_text
-from llm_integration import extract_with_llm
-from evaluation import evaluate_extraction, load_ground_truth, compare_models
+from pdf_processing import page_cache
+from llm_integration import extract_with_llm, result_cache
+from evaluation import evaluate_extraction, load_ground_truth, compare_all_models
+from ollama_client import generation_metrics
+import model_registry
+import model_manager
+import resilience
+import dispatcher
+from jobs import submit_job, get_job, wait_for_update, queue_stats, JobQueueFull, DONE, FAILED
+from batch import run_batch, within_roots
+from pipeline import get_pipeline
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
@@ -26,13 +34,34 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['GROUND_TRUTH_FOLDER'] = GROUND_TRUTH_FOLDER
 app.config['RESULTS_FOLDER'] = RESULTS_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB limit
+# Directories /api/batch may read CVs from and write its output to (os.pathsep-separated)
+app.config['BATCH_ROOTS'] = [path for path in os.environ.get(
+    'CV_EXTRACTOR_BATCH_ROOTS', os.pathsep.join([UPLOAD_FOLDER, RESULTS_FOLDER])).split(os.pathsep) if path]
+# Most text worker processes and LLM worker threads one /api/batch job may start
+app.config['BATCH_MAX_TEXT_WORKERS'] = int(os.environ.get('CV_EXTRACTOR_BATCH_MAX_TEXT_WORKERS', 4))
+app.config['BATCH_MAX_LLM_WORKERS'] = int(os.environ.get('CV_EXTRACTOR_BATCH_MAX_LLM_WORKERS', 8))
 
 # LLM and OCR model configuration
-LLM_MODELS = ['phi', 'llama3', 'mistral']  # Use 'phi' to match Ollama's model name
-MODEL_DISPLAY_NAMES = {'phi': 'Phi-2', 'llama3': 'LLaMA 3', 'mistral': 'Mistral'}  # Display names for UI
+LLM_MODELS = model_registry.model_ids()  # Registry ids, see model_registry.MODELS
+MODEL_DISPLAY_NAMES = model_registry.display_names()  # Display names for UI
+DEFAULT_LLM_MODEL = model_registry.default_model()
 OCR_MODELS = ['llava', 'mistral-vision']  # Available OCR-capable multimodal models
 DEFAULT_OCR_MODEL = 'llava'
 
+# Share of the overall progress bar (start %, end %) given to each pipeline stage
+PROGRESS_STAGES = {
+    'text_extraction': (0, 15),
+    'ocr': (15, 38),
+    'normalization': (38, 40),
+    'llm_generation': (40, 95),
+    'json_repair': (95, 99),
+}
+
+# Load the configured models in the background so the first extraction does not pay for it
+# (not again when the pipeline's worker processes import this module as __mp_main__)
+if __name__ != '__mp_main__':
+    model_manager.preload_async()
+
 # Create necessary directories if they don't exist
 for folder in [UPLOAD_FOLDER, GROUND_TRUTH_FOLDER, RESULTS_FOLDER]:
     if not os.path.exists(folder):
@@ -43,7 +72,8 @@ def allowed_file(filename):
 
 @app.route('/')
 def index():
-    return render_template('index.html', llm_models=LLM_MODELS, ocr_models=OCR_MODELS, default_ocr=DEFAULT_OCR_MODEL)
+    return render_template('index.html', llm_models=LLM_MODELS, model_display_names=MODEL_DISPLAY_NAMES,
+                           ocr_models=OCR_MODELS, default_ocr=DEFAULT_OCR_MODEL)
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -52,7 +82,7 @@ def upload_file():
         return redirect(request.url)
     
     file = request.files['file']
-    model = request.form.get('model', 'phi')  # Default to phi instead of phi2
+    model = request.form.get('model', DEFAULT_LLM_MODEL)
     use_ocr = 'use_ocr' in request.form  # This checks if the checkbox was checked
     ocr_model = request.form.get('ocr_model', DEFAULT_OCR_MODEL)
     
@@ -79,7 +109,7 @@ def upload_file():
 @app.route('/process')
 def process_file():
     file_path = session.get('file_path')
-    model = session.get('model', 'phi')  # Default to phi
+    model = session.get('model', DEFAULT_LLM_MODEL)
     use_ocr = session.get('use_ocr', False)
     ocr_model = session.get('ocr_model', DEFAULT_OCR_MODEL)
     
@@ -93,51 +123,221 @@ def process_file():
                           use_ocr=use_ocr,
                           ocr_model=ocr_model)
 
+# Snapshot of a job as sent to the browser
+def job_progress(job):
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'stage': job['stage'],
+        'message': job['message'],
+        'seq': job['seq'],
+        'error': job['error'],
+    }
+
 @app.route('/progress')
-def progress():
-    # Simulate progress updates (in a real app, this would track actual processing progress)
-    return jsonify(progress=50)
+@app.route('/progress/<job_id>')
+def progress(job_id=None):
+    job_id = job_id or session.get('job_id')
+    job = get_job(job_id) if job_id else None
+    if job is None:
+        return jsonify(progress=0, status='unknown', error='No extraction job found.'), 404
+    return jsonify(job_progress(job))
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    # Server-Sent Events stream: one event per progress change until the job finishes
+    def generate():
+        last_seq = -1
+        while True:
+            job = wait_for_update(job_id, last_seq)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Unknown or expired job id.'})}\n\n"
+                return
+            if job['seq'] != last_seq:
+                last_seq = job['seq']
+                yield f"data: {json.dumps(job_progress(job))}\n\n"
+            else:
+                # Keep idle connections open through proxies
+                yield ": keep-alive\n\n"
+            if job['status'] in (DONE, FAILED):
+                return
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Turn per-stage (done, total) reports into overall job progress
+def stage_progress(progress_callback):
+    if progress_callback is None:
+        return None
+    
+    def report(stage, done, total, message=''):
+        start, end = PROGRESS_STAGES.get(stage, (0, 100))
+        fraction = min(1.0, done / total) if total else 0.0
+        progress_callback(start + (end - start) * fraction, stage, message)
+    
+    return report
+
+# Run the full pdf_processing -> llm_integration pipeline for one CV (executed by a job worker).
+# The shared ExtractionPipeline parses the next CVs while this one is in LLM generation.
+def process_cv(file_path, model, use_ocr, ocr_model, results_folder, progress_callback=None):
+    outcome = {'model': model, 'warning': None}
+    report = stage_progress(progress_callback)
+
+    # Safely extract structured information using the selected LLM
+    def run_llm(text, llm_progress, sections=None):
+        # One budget for the LLM stage, retries and fallbacks included; queueing and OCR before it do not count
+        deadline = resilience.make_deadline()
+        try:
+            return extract_with_llm(text, model, progress_callback=llm_progress, deadline=deadline,
+                                    sections=sections)
+        except Exception as e:
+            # If the selected model fails, try the default model as fallback
+            if model != DEFAULT_LLM_MODEL:
+                outcome['warning'] = f'Selected model {model} failed, using {DEFAULT_LLM_MODEL} as backup. Error: {str(e)}'
+                outcome['model'] = DEFAULT_LLM_MODEL
+                return extract_with_llm(text, DEFAULT_LLM_MODEL, progress_callback=llm_progress,
+                                        deadline=deadline, sections=sections)
+            raise
+    
+    # Extract text from the PDF in the pipeline's text stage, then run the LLM in its LLM stage
+    extracted_data = get_pipeline().submit(file_path, run_llm, use_ocr=use_ocr, ocr_model=ocr_model,
+                                           progress_callback=report).result()['result']
+    model = outcome['model']
+    
+    # Save the extracted data
+    result_filename = os.path.basename(file_path).rsplit('.', 1)[0] + '_' + model + '.json'
+    result_path = os.path.join(results_folder, result_filename)
+    
+    with open(result_path, 'w') as f:
+        json.dump(extracted_data, f, indent=4)
+    
+    return {'result_path': result_path, 'model': model, 'warning': outcome['warning']}
 
 @app.route('/extract', methods=['POST'])
 def extract():
     file_path = session.get('file_path')
-    model = session.get('model', 'phi')  # Default to phi
+    model = session.get('model', DEFAULT_LLM_MODEL)
     use_ocr = session.get('use_ocr', False)
     ocr_model = session.get('ocr_model', DEFAULT_OCR_MODEL)
     
     if not file_path or not os.path.exists(file_path):
         return jsonify(error='File not found. Please upload a file first.')
     
+    # Queue the extraction; the request returns immediately and the client polls the job
     try:
-        # Extract text from the PDF
-        text = extract_text(file_path, use_mistral_ocr=use_ocr, ocr_model=ocr_model)
-        
-        # Safely extract structured information using the selected LLM
-        try:
-            extracted_data = extract_with_llm(text, model)
-        except Exception as e:
-            # If the selected model fails, try phi2 as fallback
-            if model != 'phi':
-                flash(f'Selected model {model} failed, using phi as backup. Error: {str(e)}')
-                model = 'phi'
-                extracted_data = extract_with_llm(text, model)
-            else:
-                raise e
-        
-        # Save the extracted data
-        result_filename = os.path.basename(file_path).rsplit('.', 1)[0] + '_' + model + '.json'
-        result_path = os.path.join(app.config['RESULTS_FOLDER'], result_filename)
-        
-        with open(result_path, 'w') as f:
-            json.dump(extracted_data, f, indent=4)
-        
-        # Store the result path in session
-        session['result_path'] = result_path
-        
-        return jsonify(success=True, redirect=url_for('show_results'))
-    
-    except Exception as e:
-        return jsonify(error=str(e))
+        job_id = submit_job(process_cv, file_path, model, use_ocr, ocr_model, app.config['RESULTS_FOLDER'])
+    except JobQueueFull as e:
+        return jsonify(error=str(e)), 503
+    
+    session['job_id'] = job_id
+    return jsonify(success=True, job_id=job_id,
+                   status_url=url_for('job_status', job_id=job_id),
+                   events_url=url_for('job_events', job_id=job_id)), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify(error='Unknown or expired job id.'), 404
+    
+    response = job_progress(job)
+    
+    if job['status'] == DONE:
+        result = job['result']
+        # Store the result path in session so /results can show it
+        session['result_path'] = result['result_path']
+        if result['warning']:
+            flash(result['warning'])
+        response.update(success=True, model=result['model'], redirect=url_for('show_results'))
+    elif job['status'] == FAILED:
+        response['error'] = job['error']
+    
+    return jsonify(response)
+
+@app.route('/jobs')
+def jobs_overview():
+    return jsonify(queue_stats())
+
+# The part of a glob pattern before its first wildcard, e.g. 'uploads/2024' for 'uploads/2024*/*.pdf'
+def glob_base(pattern):
+    for index, char in enumerate(pattern):
+        if char in '*?[':
+            return os.path.dirname(pattern[:index]) or '.'
+    return pattern
+
+# A worker count from a JSON request, kept between 1 and maximum; raises ValueError for anything but an integer
+def worker_option(options, name, default, maximum):
+    value = options.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'"{name}" must be an integer.')
+    return max(1, min(value, maximum))
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    options = request.get_json(silent=True) or {}
+    source = options.get('source')
+    model = options.get('model', DEFAULT_LLM_MODEL)
+    ocr_model = options.get('ocr_model', DEFAULT_OCR_MODEL)
+
+    if not source or not isinstance(source, str):
+        return jsonify(error='"source" (directory, glob or manifest) is required.'), 400
+    if model not in LLM_MODELS:
+        return jsonify(error=f'Invalid model name: {model}. Available models: {", ".join(LLM_MODELS)}'), 400
+    if ocr_model not in OCR_MODELS:
+        return jsonify(error=f'Invalid OCR model: {ocr_model}. Available models: {", ".join(OCR_MODELS)}'), 400
+    for flag in ('use_ocr', 'retry_failed'):
+        if not isinstance(options.get(flag, False), bool):
+            return jsonify(error=f'"{flag}" must be true or false.'), 400
+    try:
+        text_workers = worker_option(options, 'text_workers', 2, app.config['BATCH_MAX_TEXT_WORKERS'])
+        llm_workers = worker_option(options, 'llm_workers', 2, app.config['BATCH_MAX_LLM_WORKERS'])
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    # Passing the output of an earlier batch resumes it
+    output = options.get('output') or os.path.join(app.config['RESULTS_FOLDER'],
+                                                   f"batch_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+    roots = app.config['BATCH_ROOTS']
+    if not within_roots(glob_base(source), roots):
+        return jsonify(error=f'"source" must be inside one of the batch directories: {", ".join(roots)}'), 400
+    if not isinstance(output, str) or not output.endswith('.jsonl') or not within_roots(output, roots):
+        return jsonify(error=f'"output" must be a .jsonl file inside one of the batch directories: {", ".join(roots)}'), 400
+    try:
+        job_id = submit_job(run_batch, source, output, model=model, roots=roots,
+                            use_ocr=options.get('use_ocr', False), ocr_model=ocr_model,
+                            text_workers=text_workers, llm_workers=llm_workers,
+                            retry_failed=options.get('retry_failed', False))
+    except JobQueueFull as e:
+        return jsonify(error=str(e)), 503
+
+    return jsonify(success=True, job_id=job_id, output=output,
+                   status_url=url_for('api_batch_status', job_id=job_id),
+                   events_url=url_for('job_events', job_id=job_id)), 202
+
+@app.route('/api/batch/<job_id>')
+def api_batch_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify(error='Unknown or expired job id.'), 404
+
+    response = job_progress(job)
+    if job['status'] == DONE:
+        response['summary'] = job['result']
+    return jsonify(response)
+
+@app.route('/metrics')
+def metrics():
+    return jsonify(
+        jobs=queue_stats(),
+        pipeline=get_pipeline().stats(),
+        models=model_manager.status(),
+        resilience=resilience.status(),
+        dispatch=dispatcher.stats(),
+        result_cache=result_cache.stats.as_dict() if result_cache is not None else None,
+        page_cache=page_cache.stats.as_dict() if page_cache is not None else None,
+        generation=generation_metrics(),
+    )
 
 @app.route('/results')
 def show_results():
@@ -203,12 +403,8 @@ def evaluation_dashboard():
     
     # Initialize results storage
     all_comparisons = []
-    overall_results = {
-        'llama3': {'precision': 0.0, 'recall': 0.0, 'f1': 0.0},
-        'mistral': {'precision': 0.0, 'recall': 0.0, 'f1': 0.0},
-        'phi': {'precision': 0.0, 'recall': 0.0, 'f1': 0.0}
-    }
-    field_results = {field: {'llama3': 0.0, 'mistral': 0.0, 'phi': 0.0} 
+    overall_results = {model: {'precision': 0.0, 'recall': 0.0, 'f1': 0.0} for model in LLM_MODELS}
+    field_results = {field: {model: 0.0 for model in LLM_MODELS}
                     for field in ['name', 'email', 'phone', 'education', 'experience', 'skills']}
     
     # List of CVs we've evaluated
@@ -285,10 +481,8 @@ def evaluation_dashboard():
             evaluated_cvs.add(base_name)
             
             # Compare models and store results
-            comparison = compare_models(ground_truth, 
-                                       model_results.get('llama3', {}), 
-                                       model_results.get('mistral', {}), 
-                                       model_results.get('phi', {}))
+            comparison = compare_all_models(ground_truth,
+                                            {model: model_results.get(model, {}) for model in LLM_MODELS})
             
             all_comparisons.append({
                 'cv_name': base_name,
@@ -361,35 +555,20 @@ def evaluation_dashboard():
     
     # Create the combined results structure for the template
     comparison_results = {
-        'llama3': {
-            'overall': overall_results['llama3'],
-            'fields': {field: {
-                'precision': 0, 
-                'recall': 0, 
-                'f1': field_results[field]['llama3']
-            } for field in field_results}
-        },
-        'mistral': {
-            'overall': overall_results['mistral'],
-            'fields': {field: {
-                'precision': 0, 
-                'recall': 0, 
-                'f1': field_results[field]['mistral']
-            } for field in field_results}
-        },
-        'phi': {
-            'overall': overall_results['phi'],
+        model: {
+            'overall': overall_results[model],
             'fields': {field: {
                 'precision': 0, 
                 'recall': 0, 
-                'f1': field_results[field]['phi']
+                'f1': field_results[field][model]
             } for field in field_results}
         }
+        for model in LLM_MODELS
     }
     
     # Calculate field-level precision and recall for the average comparison
     if all_comparisons:
-        for model_key in ['llama3', 'mistral', 'phi']:
+        for model_key in LLM_MODELS:
             for field in field_results:
                 total_precision = 0
                 total_recall = 0
@@ -414,7 +593,8 @@ def evaluation_dashboard():
                            comparison_results=comparison_results,
                            all_comparisons=all_comparisons,
                            num_cvs_evaluated=len(evaluated_cvs),
-                           active_models=active_models)
+                           active_models=active_models,
+                           model_display_names=MODEL_DISPLAY_NAMES)
 
 def generate_precision_chart_from_values(models, precision_values):
     plt.figure(figsize=(8, 5))
@@ -0,0 +1,275 @@
+import glob
+import json
+import os
+import threading
+import time
+from concurrent.futures import wait
+from llm_integration import extract_with_llm
+from pipeline import ExtractionPipeline, StageError, LLM_STAGE
+import model_registry
+import model_manager
+
+# File types a batch picks up from a directory or glob
+BATCH_EXTENSIONS = ('.pdf', '.png')
+# Parsed documents that may wait for an LLM worker; bounds memory use
+BATCH_QUEUE_SIZE = int(os.environ.get('CV_EXTRACTOR_BATCH_QUEUE', 16))
+# Record statuses in the output file
+OK = 'ok'
+FAILED = 'failed'
+# How every record line starts
+RECORD_PREFIX = b'{"file": '
+
+
+def within_roots(path, roots):
+    """
+    Whether a path, after resolving symlinks and "..", lies inside one of the root directories.
+
+    Args:
+        path (str): Any path
+        roots (list): Allowed directories
+
+    Returns:
+        bool
+    """
+    resolved = os.path.realpath(path)
+    for root in roots:
+        root = os.path.realpath(root)
+        if resolved == root or resolved.startswith(root.rstrip(os.sep) + os.sep):
+            return True
+    return False
+
+
+def collect_inputs(source, roots=None):
+    """
+    Resolve a batch source to the list of files to process.
+
+    Args:
+        source (str): A directory (searched recursively), a glob pattern, or a
+            manifest file listing one path per line (.txt) or one {"path": ...}
+            object per line (.jsonl). Relative manifest paths are resolved
+            against the manifest's directory.
+        roots (list, optional): Directories the files must lie in; files outside
+            them (e.g. reached through "..", a symlink or a manifest entry) are left out
+
+    Returns:
+        list: Absolute file paths, in a stable order
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(BATCH_EXTENSIONS):
+                    paths.append(os.path.join(root, name))
+    elif os.path.isfile(source) and not source.lower().endswith(BATCH_EXTENSIONS):
+        base = os.path.dirname(os.path.abspath(source))
+        paths = []
+        with open(source, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                path = json.loads(line)['path'] if line.startswith('{') else line
+                paths.append(path if os.path.isabs(path) else os.path.join(base, path))
+    elif os.path.isfile(source):
+        paths = [source]
+    else:
+        paths = sorted(path for path in glob.glob(source, recursive=True)
+                       if path.lower().endswith(BATCH_EXTENSIONS))
+
+    # Manifests may list a file twice; keep the first occurrence
+    seen = set()
+    unique = []
+    for path in map(os.path.abspath, paths):
+        if roots is not None and not within_roots(path, roots):
+            print(f"Skipping {path}: outside the batch directories")
+            continue
+        if path not in seen:
+            seen.add(path)
+            unique.append(path)
+    return unique
+
+
+def load_checkpoint(output_path, retry_failed=False):
+    """
+    Read the files already processed by an earlier run of the same batch.
+
+    The output file is the checkpoint: each processed file is appended as one
+    JSON line. A line cut short by a crash is removed so that appending can
+    resume cleanly, but only once every complete line has been checked to be
+    a batch record; any other file is left untouched.
+
+    Args:
+        output_path (str): The batch output file (JSON Lines)
+        retry_failed (bool): Whether files recorded as failed should be processed again
+
+    Returns:
+        set: Absolute paths that do not need processing
+
+    Raises:
+        ValueError: If the file exists but is not the output of a batch
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, 'rb') as f:
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+
+    records = []
+    for line in data[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict) or not isinstance(record.get('file'), str):
+            raise ValueError(f"{output_path} is not a batch output file; refusing to resume into it")
+        records.append(record)
+
+    if end < len(data):
+        # Records start with their "file" key (see run_batch); anything else is not a cut-off record
+        if not data[end:].startswith(RECORD_PREFIX):
+            raise ValueError(f"{output_path} is not a batch output file; refusing to resume into it")
+        # Drop a trailing partial record left by an interrupted write
+        print(f"Discarding incomplete last record in {output_path}")
+        with open(output_path, 'rb+') as f:
+            f.truncate(end)
+
+    for record in records:
+        if record.get('status') == OK or not retry_failed:
+            done.add(record['file'])
+    return done
+
+
+class BatchWriter:
+    """Append batch records to a JSON Lines file, one durable line per document."""
+
+    def __init__(self, output_path):
+        directory = os.path.dirname(output_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._file = open(output_path, 'a')
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def run_batch(source, output_path, model=None, use_ocr=False, ocr_model='llava',
+              text_workers=2, llm_workers=2, queue_size=None, retry_failed=False,
+              progress_callback=None, stop_event=None, roots=None):
+    """
+    Extract CV data from many files, writing one JSON line per file as it finishes.
+
+    Files go through an ExtractionPipeline: text extraction processes feed a
+    bounded queue read by LLM workers, so parsed documents wait for the LLM
+    instead of piling up in memory. Files already in the output file are
+    skipped, which makes an interrupted run resumable by running it again with
+    the same output path.
+
+    Args:
+        source (str): Directory, glob pattern or manifest, see collect_inputs
+        output_path (str): JSON Lines file receiving the results
+        model (str, optional): Registry id of the extraction model, the default model if not given
+        use_ocr (bool): Whether to use the multimodal OCR model for scanned pages
+        ocr_model (str): OCR model used when use_ocr is set
+        text_workers (int): Documents whose text is extracted at the same time
+        llm_workers (int): Documents sent to the LLM at the same time
+        queue_size (int, optional): Extracted documents that may wait for an LLM worker
+        retry_failed (bool): Process files recorded as failed in the output again
+        progress_callback (callable, optional): Called as progress_callback(percent, stage, message)
+        stop_event (threading.Event, optional): Set to stop after the documents in flight
+        roots (list, optional): Directories the input files must lie in, see collect_inputs
+
+    Returns:
+        dict: Counts of files found, skipped, succeeded and failed, plus the elapsed time
+    """
+    model = model or model_registry.default_model()
+    model_registry.get_model(model)
+    files = collect_inputs(source, roots)
+    done = load_checkpoint(output_path, retry_failed)
+    pending = [path for path in files if path not in done]
+    stop_event = stop_event or threading.Event()
+    summary = {
+        'files': len(files),
+        'skipped': len(files) - len(pending),
+        'succeeded': 0,
+        'failed': 0,
+        'output': output_path,
+    }
+    print(f"Batch: {len(files)} files, {summary['skipped']} already done, {len(pending)} to process")
+
+    if pending:
+        # Load the model before the clock starts; it stays pinned for the whole run
+        model_manager.preload([model])
+
+    started = time.time()
+    counts_lock = threading.Lock()
+    writer = BatchWriter(output_path)
+    pipeline = ExtractionPipeline(text_workers=text_workers, llm_workers=llm_workers,
+                                  queue_size=queue_size if queue_size is not None else BATCH_QUEUE_SIZE)
+    futures = []
+
+    def run_llm(text, llm_progress, sections=None):
+        return extract_with_llm(text, model, sections=sections)
+
+    def finish(path, future):
+        record = {'file': path, 'model': model}
+        try:
+            outcome = future.result()
+        except StageError as e:
+            print(f"{e.stage} failed for {path}: {e.error}")
+            record.update(status=FAILED, stage=e.stage, error=e.error)
+        else:
+            result = outcome['result']
+            record.update(result=result, text_time=round(outcome['text_time'], 3),
+                          llm_time=round(outcome['llm_time'], 3))
+            if outcome['normalization']:
+                record.update(tokens_before=outcome['normalization']['tokens_before'],
+                              tokens_after=outcome['normalization']['tokens_after'])
+            if isinstance(result, dict) and 'error' in result:
+                record.update(status=FAILED, stage=LLM_STAGE, error=result['error'])
+            else:
+                record['status'] = OK
+        record['finished_at'] = time.time()
+        writer.write(record)
+        with counts_lock:
+            summary['succeeded' if record['status'] == OK else 'failed'] += 1
+            processed = summary['succeeded'] + summary['failed']
+        if progress_callback:
+            progress_callback(100.0 * processed / len(pending), 'batch',
+                              f"{processed}/{len(pending)} files processed")
+
+    try:
+        for path in pending:
+            if stop_event.is_set():
+                break
+            # Blocks while the pipeline is full, so files are read only as fast as the LLM keeps up
+            future = pipeline.submit(path, run_llm, use_ocr=use_ocr, ocr_model=ocr_model)
+            future.add_done_callback(lambda f, path=path: finish(path, f))
+            futures.append(future)
+        wait(futures)
+    except KeyboardInterrupt:
+        print("Interrupted, finishing the documents in flight (Ctrl+C again to abort)...")
+        stop_event.set()
+        wait(futures)
+        raise
+    finally:
+        pipeline.shutdown()
+        writer.close()
+
+    summary['elapsed'] = round(time.time() - started, 3)
+    summary['stopped'] = stop_event.is_set()
+    print(f"Batch finished: {summary['succeeded']} succeeded, {summary['failed']} failed, "
+          f"{summary['skipped']} skipped in {summary['elapsed']}s")
+    return summary
@@ -0,0 +1,413 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# CVs, and their expected extractions, the benchmarks run on
+CORPUS_DIR = 'ground_truth'
+GROUND_TRUTH_FILE = os.path.join(CORPUS_DIR, 'ground_truth.json')
+# Model outputs the evaluation benchmark scores (results/<cv>_<model>.json)
+RESULTS_DIR = 'results'
+# Where benchmark runs are written, apart from the model results
+BENCHMARKS_DIR = 'benchmarks'
+# Benchmark run compared against; write it with --save-baseline on the reference machine
+BASELINE_FILE = 'benchmark_baseline.json'
+# Relative change from the baseline that counts as a regression
+TOLERANCE = 0.25
+# Metrics compared against the baseline
+LOWER_IS_BETTER = ('mean', 'p95', 'alloc_peak_kb')
+HIGHER_IS_BETTER = ('throughput',)
+# Timings below this many seconds are too noisy to flag
+MIN_COMPARED_TIME = 0.001
+
+STAGES = ('text', 'ocr', 'normalization', 'repair', 'evaluation', 'pipeline')
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process and of its finished or waited-for children.
+
+    Returns:
+        dict: 'self' and 'children' in MB, None where the platform does not tell
+    """
+    if resource is None:
+        return {'self': None, 'children': None}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1),
+    }
+
+
+def summarize(times, wall_time=None):
+    """
+    Latency and throughput figures of a list of per-item durations.
+
+    Args:
+        times (list): Seconds per item
+        wall_time (float, optional): Elapsed time of the whole run, when items ran concurrently
+
+    Returns:
+        dict: Items, wall time, mean, p50, p95, min, max and items per second
+    """
+    if not times:
+        return {'items': 0}
+    ordered = sorted(times)
+    wall_time = sum(times) if wall_time is None else wall_time
+    return {
+        'items': len(times),
+        'wall_time': round(wall_time, 6),
+        'mean': round(statistics.mean(times), 6),
+        'p50': round(ordered[len(ordered) // 2], 6),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 6),
+        'min': round(ordered[0], 6),
+        'max': round(ordered[-1], 6),
+        'throughput': round(len(times) / wall_time, 3) if wall_time > 0 else None,
+    }
+
+
+def traced(run):
+    """
+    Run once more under tracemalloc, separately from the timed runs it would slow down.
+
+    Returns:
+        dict: Peak traced allocation and memory still allocated afterwards, in KB
+    """
+    tracemalloc.start()
+    try:
+        run()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'alloc_peak_kb': round(peak / 1024, 1), 'alloc_retained_kb': round(current / 1024, 1)}
+
+
+def measure(func, items, iterations):
+    """
+    Time func(item) for every item, `iterations` times over, then trace its allocations.
+
+    Returns:
+        dict: summarize() figures, errors, allocations (see traced) and peak RSS
+    """
+    times = []
+    errors = []
+    for _ in range(iterations):
+        for item in items:
+            started = time.perf_counter()
+            try:
+                func(item)
+            except Exception as e:
+                errors.append(f"{item}: {type(e).__name__}: {e}")
+            times.append(time.perf_counter() - started)
+
+    def run_once():
+        for item in items:
+            try:
+                func(item)
+            except Exception:
+                pass
+
+    result = summarize(times)
+    result.update(iterations=iterations, errors=len(errors), **traced(run_once), peak_rss_mb=peak_rss_mb())
+    if errors:
+        result['first_error'] = errors[0]
+    return result
+
+
+def corpus(extension):
+    return sorted(glob.glob(os.path.join(CORPUS_DIR, 'cv_*' + extension)))
+
+
+def bench_text(options):
+    import pdf_processing
+    files = corpus('.pdf')
+    return measure(lambda path: pdf_processing.extract_text(path, use_mistral_ocr=False), files, options.iterations)
+
+
+def bench_ocr(options):
+    import pytesseract
+    import pdf_processing
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception as e:
+        return {'skipped': f"Tesseract is not available: {e}"}
+    files = corpus('.png')
+    return measure(lambda path: pdf_processing.extract_text(path, use_mistral_ocr=False), files, options.iterations)
+
+
+def bench_normalization(options):
+    import normalization
+    import pdf_processing
+    texts = [pdf_processing.extract_text(path, use_mistral_ocr=False) for path in corpus('.pdf')]
+    result = measure(normalization.normalize_document, texts, options.iterations)
+    reports = [normalization.normalize_document(text)[1] for text in texts]
+    result.update(tokens_before=sum(report['tokens_before'] for report in reports),
+                  tokens_after=sum(report['tokens_after'] for report in reports))
+    return result
+
+
+def repair_inputs(records):
+    """Broken model outputs for each record: Phi's fragments, Python-style quotes, trailing commas, truncation."""
+    from fake_ollama import malformed_json
+    inputs = []
+    for record in records:
+        valid = json.dumps(record, indent=2)
+        inputs.append(malformed_json(record))
+        inputs.append(str(record))
+        inputs.append(valid.replace('"\n  ]', '",\n  ]').replace('\n}', ',\n}'))
+        inputs.append(valid[:int(len(valid) * 0.7)])
+    return inputs
+
+
+def bench_repair(options):
+    import llm_integration
+    with open(GROUND_TRUTH_FILE, 'r') as f:
+        records = list(json.load(f).values())
+
+    # The path run_extraction takes with a model's raw output
+    def parse(raw):
+        return llm_integration.parse_structured_response(raw) or llm_integration.repair_response(raw)
+
+    return measure(parse, repair_inputs(records), options.iterations)
+
+
+def bench_evaluation(options):
+    import evaluation
+    ground_truth = evaluation.load_ground_truth(GROUND_TRUTH_FILE)
+    cases = []
+    for name, truth in sorted(ground_truth.items()):
+        stem = name.rsplit('.', 1)[0]
+        outputs = {}
+        for model in ('llama3', 'mistral', 'phi'):
+            path = os.path.join(RESULTS_DIR, f"{stem}_{model}.json")
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    outputs[model] = json.load(f)
+        if len(outputs) == 3:
+            cases.append((truth, outputs))
+    if not cases:
+        return {'skipped': f"No model results in {RESULTS_DIR}"}
+    return measure(lambda case: evaluation.compare_models(case[0], case[1]['llama3'], case[1]['mistral'],
+                                                          case[1]['phi']),
+                   cases, options.iterations)
+
+
+def bench_pipeline(options):
+    """
+    Full pipeline latency: text extraction processes feeding LLM workers, against Ollama or the fake server.
+
+    Every CV of the corpus is submitted `iterations` times; latency runs from
+    submission to the extraction result, so it includes queueing.
+    """
+    import evaluation
+    import ollama_client
+    from llm_integration import extract_with_llm
+    from pipeline import ExtractionPipeline
+    files = corpus('.pdf') + (corpus('.png') if options.ocr_available else [])
+    ground_truth = evaluation.load_ground_truth(GROUND_TRUTH_FILE)
+
+    def llm_func(text, callback, sections):
+        return extract_with_llm(text, options.model, sections=sections, use_cache=False)
+
+    def run_round(pipeline):
+        submitted = []
+        started = time.perf_counter()
+        for path in files:
+            submitted.append((path, time.perf_counter(), pipeline.submit(path, llm_func)))
+        outcomes = []
+        for path, submitted_at, future in submitted:
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcomes.append((path, None, e))
+                continue
+            outcomes.append((path, time.perf_counter() - submitted_at, outcome))
+        return outcomes, time.perf_counter() - started
+
+    pipeline = ExtractionPipeline(text_workers=options.text_workers, llm_workers=options.llm_workers)
+    try:
+        run_round(pipeline)  # Warm-up: worker processes start, models load
+        ollama_client.reset_generation_metrics()
+        latencies, text_times, llm_times, f1_scores = [], [], [], []
+        errors = 0
+        wall_time = 0.0
+        for _ in range(options.iterations):
+            outcomes, elapsed = run_round(pipeline)
+            wall_time += elapsed
+            for path, latency, outcome in outcomes:
+                if latency is None or 'error' in outcome['result']:
+                    errors += 1
+                    continue
+                latencies.append(latency)
+                text_times.append(outcome['text_time'])
+                llm_times.append(outcome['llm_time'])
+                truth = ground_truth.get(os.path.basename(path))
+                if truth:
+                    f1_scores.append(evaluation.evaluate_extraction(truth, outcome['result'])['overall']['f1'])
+        result = summarize(latencies, wall_time)
+        result.update(iterations=options.iterations, errors=errors,
+                      stages={'text_extraction': summarize(text_times), 'llm_generation': summarize(llm_times)},
+                      f1=round(statistics.mean(f1_scores), 4) if f1_scores else None,
+                      generation=ollama_client.generation_metrics(),
+                      **traced(lambda: run_round(pipeline)), peak_rss_mb=peak_rss_mb())
+        return result
+    finally:
+        pipeline.shutdown()
+
+
+BENCHMARKS = {
+    'text': bench_text,
+    'ocr': bench_ocr,
+    'normalization': bench_normalization,
+    'repair': bench_repair,
+    'evaluation': bench_evaluation,
+    'pipeline': bench_pipeline,
+}
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Find the benchmarks that got worse than the baseline.
+
+    Args:
+        results (dict): This run, as written by main
+        baseline (dict): An earlier run
+        tolerance (float): Relative change allowed
+
+    Returns:
+        list: One dict per regressed metric with the benchmark, metric, baseline and current value
+    """
+    regressions = []
+    for name, current in results['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if not previous or 'skipped' in current or 'skipped' in previous:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            if metric in ('mean', 'p95') and old < MIN_COMPARED_TIME:
+                continue
+            change = (new - old) / old
+            if (metric in LOWER_IS_BETTER and change > tolerance) or (metric in HIGHER_IS_BETTER and change < -tolerance):
+                regressions.append({'benchmark': name, 'metric': metric, 'baseline': old, 'current': new,
+                                    'change': round(change, 3)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmark', description='Benchmark text extraction, JSON repair, '
+                                     'evaluation and the full pipeline on the ground truth corpus')
+    parser.add_argument('stages', nargs='*', help=f"Benchmarks to run: {', '.join(STAGES)} (default: all)")
+    parser.add_argument('-n', '--iterations', type=int, default=5, help='Passes over the corpus per benchmark (default: %(default)s)')
+    parser.add_argument('-o', '--output', help='JSON results file (default: benchmarks/benchmark_<timestamp>.json)')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Run to compare against (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true', help='Also write this run to the baseline file')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='Relative slowdown reported as a regression (default: %(default)s)')
+    parser.add_argument('--model', help='Extraction model of the pipeline benchmark (default: the default model)')
+    parser.add_argument('--ollama', help='Benchmark the pipeline against this Ollama URL instead of fake_ollama')
+    parser.add_argument('--speed', type=float, default=10.0,
+                        help='Speed-up of the fake Ollama server over its model profiles (default: %(default)s)')
+    parser.add_argument('--text-workers', type=int, default=2, help='Pipeline text extraction processes (default: %(default)s)')
+    parser.add_argument('--llm-workers', type=int, default=4, help='Pipeline LLM workers (default: %(default)s)')
+    parser.add_argument('-v', '--verbose', action='store_true', help="Show the application's own output")
+    args = parser.parse_args(argv)
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(sorted(unknown))}")
+    stages = [stage for stage in STAGES if stage in (args.stages or STAGES)]
+
+    # Caches would turn every pass after the first into a lookup
+    os.environ['CV_EXTRACTOR_CACHE'] = 'off'
+    os.environ['OLLAMA_PRELOAD_MODELS'] = 'none'
+    server = None
+    if 'pipeline' in stages:
+        if args.ollama:
+            os.environ['OLLAMA_API_URL'] = args.ollama.rstrip('/') + '/api/generate'
+        else:
+            import fake_ollama
+            server = fake_ollama.start_server(speed=args.speed)
+            os.environ['OLLAMA_API_URL'] = server.url + '/api/generate'
+    # The application modules read the settings above when first imported
+    import model_registry
+    args.model = args.model or model_registry.default_model()
+    args.ocr_available = 'ocr' in stages
+
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'iterations': args.iterations, 'model': args.model, 'ollama': args.ollama or 'fake_ollama',
+                     'speed': None if args.ollama else args.speed, 'text_workers': args.text_workers,
+                     'llm_workers': args.llm_workers},
+        'benchmarks': {},
+    }
+    try:
+        for stage in stages:
+            print(f"Running {stage} benchmark...")
+            output = sys.stdout if args.verbose else open(os.devnull, 'w')
+            try:
+                with contextlib.redirect_stdout(output):
+                    result = BENCHMARKS[stage](args)
+            except Exception as e:
+                result = {'skipped': f"{type(e).__name__}: {e}"}
+            finally:
+                if output is not sys.stdout:
+                    output.close()
+            if stage == 'ocr' and 'skipped' in result:
+                args.ocr_available = False
+            results['benchmarks'][stage] = result
+            if 'skipped' in result:
+                print(f"  skipped: {result['skipped']}")
+            elif not result['items']:
+                print(f"  no item completed ({result.get('errors', 0)} errors)")
+            else:
+                print(f"  {result['items']} items, mean {result['mean'] * 1000:.2f} ms, p95 {result['p95'] * 1000:.2f} ms, "
+                      f"{result['throughput']} items/s, allocations peak {result['alloc_peak_kb']} KB")
+    finally:
+        if server is not None:
+            results['fake_ollama'] = server.stats()
+            server.stop()
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        results['comparison'] = {'baseline': args.baseline, 'baseline_created_at': baseline.get('created_at'),
+                                 'tolerance': args.tolerance, 'regressions': regressions}
+        for regression in regressions:
+            print(f"REGRESSION {regression['benchmark']} {regression['metric']}: "
+                  f"{regression['baseline']} -> {regression['current']} ({regression['change']:+.0%})")
+        if not regressions:
+            print(f"No regressions against {args.baseline}")
+    else:
+        regressions = []
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+
+    output = args.output or os.path.join(BENCHMARKS_DIR, f"benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {output}")
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline written to {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
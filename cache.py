@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Where persistent caches live unless told otherwise
+CACHE_DIR = os.environ.get('CV_EXTRACTOR_CACHE_DIR', 'cache')
+
+
+def normalize_text(text):
+    """
+    Normalize text before hashing so whitespace-only differences share a cache entry.
+
+    Args:
+        text (str): Raw text
+
+    Returns:
+        str: The text with every run of whitespace collapsed to a single space
+    """
+    return " ".join(text.split())
+
+
+def make_cache_key(*parts):
+    """
+    Build a content-addressed cache key from any JSON-serializable values.
+
+    Args:
+        *parts: Values that together identify a cached computation
+
+    Returns:
+        str: A SHA-256 hex digest
+    """
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters shared by all cache backends."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+
+    def record(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def as_dict(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'sets': self.sets,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class MemoryCache:
+    """
+    In-process LRU cache with optional TTL.
+
+    Args:
+        max_entries (int): Least recently used entries are evicted beyond this size
+        ttl (float, optional): Seconds an entry stays valid, None for no expiry
+    """
+
+    def __init__(self, max_entries=256, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or time.time() - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats.record('hits')
+                    return value
+                del self._entries[key]
+                self.stats.record('evictions')
+        self.stats.record('misses')
+        return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.record('evictions')
+        self.stats.record('sets')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """
+    Persistent cache stored in a SQLite file, values are JSON-encoded.
+
+    Args:
+        path (str): Location of the database file
+        max_entries (int): Least recently used entries are evicted beyond this size
+        ttl (float, optional): Seconds an entry stays valid, None for no expiry
+    """
+
+    def __init__(self, path, max_entries=10000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+            'stored_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT value, stored_at FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                value, stored_at = row
+                if self.ttl is None or now - stored_at <= self.ttl:
+                    self._conn.execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+                    self._conn.commit()
+                    self.stats.record('hits')
+                    return json.loads(value)
+                self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                self._conn.commit()
+                self.stats.record('evictions')
+        self.stats.record('misses')
+        return None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now, now)
+            )
+            evicted = 0
+            if self.ttl is not None:
+                evicted += self._conn.execute('DELETE FROM cache WHERE stored_at < ?', (now - self.ttl,)).rowcount
+            overflow = len(self) - self.max_entries
+            if overflow > 0:
+                evicted += self._conn.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)',
+                    (overflow,)
+                ).rowcount
+            self._conn.commit()
+        self.stats.record('sets')
+        if evicted:
+            self.stats.record('evictions', evicted)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM cache')
+            self._conn.commit()
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+class TieredCache:
+    """
+    A fast cache in front of a slower persistent one.
+
+    Hits in the persistent tier are copied into the fast tier. The stats
+    count a lookup as a hit if either tier had the value.
+
+    Args:
+        front: The fast cache, usually a MemoryCache
+        back: The persistent cache, usually a SQLiteCache
+    """
+
+    def __init__(self, front, back):
+        self.front = front
+        self.back = back
+        self.stats = CacheStats()
+
+    def get(self, key):
+        value = self.front.get(key)
+        if value is None:
+            value = self.back.get(key)
+            if value is not None:
+                self.front.set(key, value)
+        self.stats.record('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key, value):
+        self.front.set(key, value)
+        self.back.set(key, value)
+        self.stats.record('sets')
+
+    def clear(self):
+        self.front.clear()
+        self.back.clear()
+
+    def __len__(self):
+        return len(self.back)
+
+
+def create_cache(name, memory_entries=256, disk_entries=10000, ttl=None, persistent=True):
+    """
+    Create the standard memory + SQLite cache for a named use.
+
+    Set CV_EXTRACTOR_CACHE=memory to keep caches in-process only, or
+    CV_EXTRACTOR_CACHE=off to disable caching entirely.
+
+    Args:
+        name (str): File name (without extension) of the SQLite database
+        memory_entries (int): Size of the in-memory LRU tier
+        disk_entries (int): Size of the SQLite tier
+        ttl (float, optional): Seconds an entry stays valid, None for no expiry
+        persistent (bool): Whether to add the SQLite tier at all
+
+    Returns:
+        A cache object with get/set/clear and a 'stats' attribute, or None if caching is disabled
+    """
+    mode = os.environ.get('CV_EXTRACTOR_CACHE', 'disk').lower()
+    if mode == 'off':
+        return None
+
+    memory = MemoryCache(max_entries=memory_entries, ttl=ttl)
+    if mode == 'memory' or not persistent:
+        return memory
+
+    try:
+        disk = SQLiteCache(os.path.join(CACHE_DIR, f'{name}.sqlite'), max_entries=disk_entries, ttl=ttl)
+    except sqlite3.Error as e:
+        print(f"Could not open persistent cache '{name}', using memory only: {e}")
+        return memory
+    return TieredCache(memory, disk)
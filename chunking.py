@@ -0,0 +1,267 @@
+import os
+import re
+import model_registry
+from model_registry import NUM_PREDICT
+
+# Upper bound on CV tokens per chunk, even for models with a large context: smaller chunks are
+# extracted concurrently and keep every generation short (0 uses the whole context budget)
+MAX_CHUNK_TOKENS = int(os.environ.get('CV_EXTRACTOR_MAX_CHUNK_TOKENS', 3000))
+# Chunks of one CV extracted at the same time (the dispatcher still limits each model)
+CHUNK_WORKERS = int(os.environ.get('CV_EXTRACTOR_CHUNK_WORKERS', 4))
+# Tokens always left for the answer; a fixed num_predict of 2048 does not fit a 2048-token context
+MIN_OUTPUT_TOKENS = 512
+# Chunks smaller than this are joined to their neighbour rather than extracted on their own
+MIN_CHUNK_TOKENS = 50
+
+# Section headings commonly found in CVs, matched on whole lines (case-insensitive, optional colon)
+SECTION_HEADINGS = {
+    'summary', 'profile', 'professional summary', 'about me', 'objective', 'contact', 'contact information',
+    'education', 'academic background', 'qualifications', 'experience', 'work experience',
+    'professional experience', 'employment', 'employment history', 'work history', 'internships',
+    'skills', 'technical skills', 'core competencies', 'competencies', 'languages', 'projects',
+    'certifications', 'certificates', 'awards', 'achievements', 'publications', 'volunteering',
+    'interests', 'hobbies', 'references', 'activities', 'training', 'courses',
+}
+
+# Words, numbers and single punctuation marks; a rough stand-in for a BPE tokenizer
+TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text):
+    """
+    Estimate how many tokens a model's tokenizer produces for a text.
+
+    BPE tokenizers split long words into pieces of about four characters, so
+    every word counts as one token per four letters (at least one), digits as
+    one token per three, and every punctuation mark as a token of its own.
+    The estimate is deliberately on the high side.
+
+    Args:
+        text (str): Any text
+
+    Returns:
+        int: Estimated token count
+    """
+    tokens = 0
+    for piece in TOKEN_PATTERN.findall(text):
+        if piece[0].isalpha():
+            tokens += (len(piece) + 3) // 4
+        elif piece[0].isdigit():
+            tokens += (len(piece) + 2) // 3
+        else:
+            tokens += 1
+    return tokens
+
+
+def prompt_overhead(model_id):
+    """Tokens of a model's prompt around the CV text (system prompt and template)."""
+    spec = model_registry.get_model(model_id)
+    return estimate_tokens(spec['system_prompt']) + estimate_tokens(spec['prompt_template'].replace('{text}', ''))
+
+
+def output_reserve(model_id):
+    """Tokens of a model's context kept free for the generated JSON."""
+    context_length = model_registry.get_model(model_id)['context_length']
+    return max(MIN_OUTPUT_TOKENS, min(NUM_PREDICT, context_length // 4))
+
+
+def chunk_budget(model_id):
+    """
+    CV tokens one request to the model can hold.
+
+    Returns:
+        int: The model's context length minus the prompt around the CV and the
+        output reserve, capped at MAX_CHUNK_TOKENS
+    """
+    context_length = model_registry.get_model(model_id)['context_length']
+    budget = context_length - prompt_overhead(model_id) - output_reserve(model_id)
+    if MAX_CHUNK_TOKENS:
+        budget = min(budget, MAX_CHUNK_TOKENS)
+    return max(MIN_CHUNK_TOKENS * 2, budget)
+
+
+def num_predict_for(model_id, prompt_tokens, limit=NUM_PREDICT):
+    """
+    Generation limit that keeps prompt and answer inside the model's context.
+
+    Args:
+        model_id (str): Registry id of the model
+        prompt_tokens (int): Estimated tokens of the whole prompt
+        limit (int): The num_predict the request would otherwise use
+
+    Returns:
+        int: At most limit, at least MIN_OUTPUT_TOKENS
+    """
+    context_length = model_registry.get_model(model_id)['context_length']
+    return max(MIN_OUTPUT_TOKENS, min(limit, context_length - prompt_tokens))
+
+
+def is_heading(line):
+    """Whether a line looks like a CV section heading."""
+    stripped = line.strip().rstrip(':').strip()
+    if not stripped or len(stripped) > 40:
+        return False
+    if stripped.lower() in SECTION_HEADINGS:
+        return True
+    # Short all-caps lines such as "WORK EXPERIENCE" or "LANGUAGES & TOOLS"
+    words = stripped.split()
+    return len(words) <= 4 and stripped.isupper() and sum(c.isalpha() for c in stripped) >= 3
+
+
+def split_sections(text):
+    """
+    Split CV text at section headings.
+
+    Returns:
+        list: Section texts in order; the first one holds everything before the
+        first heading (usually the name and contact details)
+    """
+    sections = []
+    current = []
+    for line in text.splitlines():
+        if is_heading(line) and any(l.strip() for l in current):
+            sections.append('\n'.join(current))
+            current = []
+        current.append(line)
+    if any(l.strip() for l in current):
+        sections.append('\n'.join(current))
+    return sections
+
+
+def _split_oversized(section, budget):
+    # Split a section that alone exceeds the budget: at blank lines, then lines, then words
+    for separator in ('\n\n', '\n', ' '):
+        parts = section.split(separator)
+        if len(parts) > 1:
+            break
+    else:
+        return [section]
+    pieces = []
+    current = []
+    current_tokens = 0
+    for part in parts:
+        tokens = estimate_tokens(part)
+        if current and current_tokens + tokens > budget:
+            pieces.append(separator.join(current))
+            current, current_tokens = [], 0
+        current.append(part)
+        current_tokens += tokens
+    if current:
+        pieces.append(separator.join(current))
+    result = []
+    for piece in pieces:
+        if estimate_tokens(piece) > budget and piece != section:
+            result.extend(_split_oversized(piece, budget))
+        else:
+            result.append(piece)
+    return result
+
+
+def chunk_text(text, budget):
+    """
+    Split CV text into chunks of at most `budget` estimated tokens.
+
+    Whole sections are packed into a chunk while they fit, so a section is only
+    cut when it is longer than a chunk on its own. Text that fits the budget is
+    returned as a single chunk.
+
+    Args:
+        text (str): The CV text
+        budget (int): Maximum estimated tokens per chunk, see chunk_budget
+
+    Returns:
+        list: Chunk texts in document order
+    """
+    if estimate_tokens(text) <= budget:
+        return [text]
+
+    pieces = []
+    for section in split_sections(text):
+        if estimate_tokens(section) > budget:
+            pieces.extend(_split_oversized(section, budget))
+        else:
+            pieces.append(section)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > budget:
+            chunks.append('\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        # A short tail is better extracted together with the chunk before it, if there is room
+        if chunks and current_tokens < MIN_CHUNK_TOKENS and estimate_tokens(chunks[-1]) + current_tokens <= budget:
+            chunks[-1] = chunks[-1] + '\n' + '\n'.join(current)
+        else:
+            chunks.append('\n'.join(current))
+    return chunks
+
+
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def _scalar_score(field, value):
+    # How plausible a value is for a scalar field; 0 means unusable
+    value = value.strip()
+    if not value:
+        return 0
+    if field == 'email':
+        return 2 if EMAIL_PATTERN.match(value) else 1
+    if field == 'phone':
+        digits = sum(c.isdigit() for c in value)
+        return 2 if 7 <= digits <= 15 else 1
+    if field == 'name':
+        # A name is a few words without digits or an @
+        if '@' in value or any(c.isdigit() for c in value):
+            return 1
+        return 2 if 1 <= len(value.split()) <= 5 else 1
+    return 1
+
+
+def _dedupe_key(item):
+    return re.sub(r"[\W_]+", " ", item).strip().casefold()
+
+
+def merge_results(results, fields=('name', 'email', 'phone'), list_fields=('education', 'experience', 'skills')):
+    """
+    Combine the extractions of a CV's chunks into one result.
+
+    List fields are concatenated in chunk order without duplicates (compared
+    ignoring case, punctuation and spacing). For a scalar field the most
+    plausible value wins; among equally plausible ones the earliest chunk
+    wins, since names and contact details come first in a CV.
+
+    Args:
+        results (list): Extraction results in chunk order; results carrying an
+            "error" are ignored
+
+    Returns:
+        dict: The merged result
+    """
+    usable = [result for result in results if isinstance(result, dict) and 'error' not in result]
+    merged = {}
+    for field in fields:
+        best, best_score = "", 0
+        for result in usable:
+            value = result.get(field)
+            score = _scalar_score(field, value) if isinstance(value, str) else 0
+            if score > best_score:
+                best, best_score = value.strip(), score
+        merged[field] = best
+    for field in list_fields:
+        seen = set()
+        items = []
+        for result in usable:
+            for item in result.get(field) or []:
+                if not isinstance(item, str):
+                    continue
+                key = _dedupe_key(item)
+                if key and key not in seen:
+                    seen.add(key)
+                    items.append(item.strip())
+        merged[field] = items
+    return merged
@@ -0,0 +1,181 @@
+import os
+import re
+
+# Fields the rule-based extractor fills
+CONTACT_FIELDS = ('name', 'email', 'phone')
+# Confidence from which a rule-based value is trusted over the LLM, and the LLM is not asked for the field
+CONFIDENCE_THRESHOLD = float(os.environ.get('CV_EXTRACTOR_CONTACT_CONFIDENCE', 0.8))
+# The name is looked for in this many non-empty lines at the top of the CV
+NAME_LINES = 6
+# Contact details further down than this many lines are less likely to be the candidate's own
+HEADER_LINES = 15
+
+EMAIL_PATTERN = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}")
+# Optional country code and area code in brackets, then digits with space, dot or dash separators
+PHONE_PATTERN = re.compile(r"(?<![\w+(])(?:(?:\+|00)?\d{1,4}[ .-]?)?(?:\(\d{1,4}\)[ .-]?)?\d{1,5}(?:[ .-]?\d{1,5}){1,6}(?!\w)")
+PHONE_LABEL_PATTERN = re.compile(r"\b(?:phone|tel(?:ephone)?|mobile|mob|cell|gsm|t[ée]l[ée]phone|portable)\b|☎|📞",
+                                 re.IGNORECASE)
+# Identifiers written like phone numbers: a digit run right after one of these labels is not a phone
+ID_LABEL_PATTERN = re.compile(r"\b(?:id|siret|siren|ssn|nif|nie|iban|vat|tva|passport|licen[cs]e|no|n°|nr|num(?:[ée]ro)?|number)"
+                              r"\.?\s*[:#]?\s*$", re.IGNORECASE)
+YEAR_RANGE_PATTERN = re.compile(r"^(?:19|20)\d{2}\s*[-.]\s*(?:19|20)\d{2}$")
+DATE_PATTERN = re.compile(r"^\d{1,4}[./-]\d{1,2}[./-]\d{1,4}$")
+NAME_LABEL_PATTERN = re.compile(r"^\s*(?:full\s+)?name\s*[:\-]\s*(.+)$", re.IGNORECASE)
+NAME_WORD_PATTERN = re.compile(r"^[^\W\d_]+(?:[-'’.][^\W\d_]*)*$")
+# Words that make a top line a title or heading rather than a name
+NOT_NAME_WORDS = {
+    'curriculum', 'vitae', 'resume', 'résumé', 'cv', 'profile', 'contact', 'summary', 'objective',
+    'address', 'email', 'phone', 'mobile', 'linkedin', 'github', 'portfolio', 'experience', 'education',
+    'skills', 'engineer', 'developer', 'manager', 'student', 'intern', 'analyst', 'consultant', 'designer',
+    'scientist', 'architect', 'specialist', 'director', 'officer', 'assistant', 'coordinator', 'administrator',
+    'technician', 'teacher', 'researcher',
+}
+
+
+def _field(value='', confidence=0.0):
+    return {'value': value, 'confidence': round(confidence, 2)}
+
+
+def find_email(lines):
+    """The candidate's email address: the first one in the CV, surer when it is the only one."""
+    found = []
+    for index, line in enumerate(lines):
+        for match in EMAIL_PATTERN.finditer(line):
+            email = match.group(0).rstrip('.')
+            if email.lower() not in (e.lower() for e, _ in found):
+                found.append((email, index))
+    if not found:
+        return _field()
+    email, index = found[0]
+    confidence = 0.99 if len(found) == 1 else 0.9
+    if index >= HEADER_LINES:
+        confidence -= 0.1
+    return _field(email, confidence)
+
+
+def find_phone(lines):
+    """
+    The candidate's phone number: a labelled number first, otherwise the first one near the top.
+
+    Only a phone label or a leading "+" and country code make a number
+    confident; a bare digit run could as well be an identifier, and one right
+    after an ID, SIRET or number label is skipped.
+    """
+    best = None
+    for index, line in enumerate(lines):
+        for match in PHONE_PATTERN.finditer(line):
+            number = match.group(0).strip()
+            digits = sum(c.isdigit() for c in number)
+            if not 7 <= digits <= 15 or YEAR_RANGE_PATTERN.match(number) or DATE_PATTERN.match(number):
+                continue
+            labelled = PHONE_LABEL_PATTERN.search(line)
+            if not labelled and ID_LABEL_PATTERN.search(line[:match.start()]):
+                continue
+            if labelled or number.startswith('+'):
+                confidence = 0.95
+            elif index < HEADER_LINES:
+                confidence = 0.75
+            else:
+                confidence = 0.6
+            if best is None or confidence > best['confidence']:
+                best = _field(number, confidence)
+            if confidence >= 0.95:
+                return best
+    return best or _field()
+
+
+def _looks_like_name(line):
+    words = line.split()
+    if not 2 <= len(words) <= 4 or len(line) > 60:
+        return False
+    if any(word.lower().strip('.,') in NOT_NAME_WORDS for word in words):
+        return False
+    # Every word is letters only (with inner hyphens or apostrophes) and starts with a capital
+    return all(NAME_WORD_PATTERN.match(word) and word[0].isupper() for word in words)
+
+
+def find_name(lines, email=''):
+    """
+    The candidate's name from the first lines of the CV.
+
+    A "Name: ..." line is taken as is; otherwise the first short line of
+    capitalised words is used. Such a guess is only confident when it is the
+    very first line and its words also appear in the email address.
+    """
+    top = [line.strip() for line in lines if line.strip()][:NAME_LINES]
+    for line in top:
+        match = NAME_LABEL_PATTERN.match(line)
+        if match and _looks_like_name(match.group(1).strip()):
+            return _field(match.group(1).strip(), 0.95)
+    for position, line in enumerate(top):
+        # Names sometimes share the first line with a title, e.g. "Jane Doe | Data Engineer"
+        candidate = re.split(r"\s*[|•·–—,]\s*", line)[0].strip()
+        if not _looks_like_name(candidate):
+            continue
+        confidence = 0.75 if position == 0 else 0.65
+        if len(candidate.split()) == 4:
+            confidence -= 0.1
+        local_part = email.split('@')[0].lower()
+        if local_part and any(len(word) > 2 and word.lower() in local_part for word in candidate.split()):
+            confidence += 0.1
+        if candidate.isupper():
+            # Names in capitals are common in CV headers; present them in title case
+            candidate = candidate.title()
+        return _field(candidate, min(confidence, 0.98))
+    return _field()
+
+
+def extract_contact_fields(text):
+    """
+    Extract name, email and phone from CV text with precompiled patterns.
+
+    Args:
+        text (str): Output of pdf_processing.extract_text
+
+    Returns:
+        dict: For each of CONTACT_FIELDS, {'value': str, 'confidence': float from 0 to 1}
+        (an empty value with confidence 0 when nothing was found)
+    """
+    lines = text.splitlines()
+    email = find_email(lines)
+    return {
+        'name': find_name(lines, email['value']),
+        'email': email,
+        'phone': find_phone(lines),
+    }
+
+
+def is_confident(fields, threshold=None):
+    """Whether every contact field was found with at least the threshold confidence."""
+    threshold = CONFIDENCE_THRESHOLD if threshold is None else threshold
+    return all(fields[field]['confidence'] >= threshold for field in CONTACT_FIELDS)
+
+
+def apply_contact_fields(result, fields, threshold=None):
+    """
+    Fill an extraction result's contact fields from the rule-based ones.
+
+    A confident rule-based value replaces the LLM's; a less confident one only
+    fills a field the LLM left empty. The result also gets a 'confidence' entry
+    per contact field; values kept from the LLM cannot be scored and get 0.5.
+
+    Args:
+        result (dict): Extraction result, possibly carrying an "error"
+        fields (dict): Output of extract_contact_fields
+
+    Returns:
+        dict: The same result, updated
+    """
+    threshold = CONFIDENCE_THRESHOLD if threshold is None else threshold
+    confidence = {}
+    for field in CONTACT_FIELDS:
+        found = fields[field]
+        llm_value = result.get(field) if isinstance(result.get(field), str) else ''
+        if found['value'] and (found['confidence'] >= threshold or not llm_value.strip()):
+            result[field] = found['value']
+            confidence[field] = found['confidence']
+        else:
+            result[field] = llm_value
+            confidence[field] = 0.5 if llm_value.strip() else 0.0
+    result['confidence'] = confidence
+    return result
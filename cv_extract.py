@@ -0,0 +1,54 @@
+import argparse
+import json
+import os
+import sys
+import time
+import model_registry
+
+
+def batch_command(args):
+    from batch import run_batch
+
+    output = args.output or os.path.join('results', f"batch_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+
+    def report(percent, stage, message=''):
+        print(f"[{percent:5.1f}%] {message}")
+
+    try:
+        summary = run_batch(args.source, output, model=args.model, use_ocr=args.ocr, ocr_model=args.ocr_model,
+                            text_workers=args.text_workers, llm_workers=args.llm_workers,
+                            queue_size=args.queue_size, retry_failed=args.retry_failed,
+                            progress_callback=report)
+    except KeyboardInterrupt:
+        print(f"Stopped. Run the same command with --output {output} to resume.")
+        return 130
+    print(json.dumps(summary, indent=4))
+    return 1 if summary['failed'] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Extract structured data from CVs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch = subparsers.add_parser('batch', help='Process a directory, glob or manifest of CVs',
+                                  description='Process many CVs, appending one JSON line per CV to the output. '
+                                              'Rerunning with the same --output resumes an interrupted run.')
+    batch.add_argument('source', help='Directory, glob pattern (quote it) or manifest file (.txt or .jsonl)')
+    batch.add_argument('-o', '--output', help='JSON Lines output file, also the resume checkpoint '
+                                              '(default: results/batch_<timestamp>.jsonl)')
+    batch.add_argument('-m', '--model', default=model_registry.default_model(), choices=model_registry.model_ids(),
+                       help='Extraction model (default: %(default)s)')
+    batch.add_argument('--ocr', action='store_true', help='Use the multimodal OCR model for scanned pages')
+    batch.add_argument('--ocr-model', default='llava', help='OCR model used with --ocr (default: %(default)s)')
+    batch.add_argument('--text-workers', type=int, default=2, help='Documents parsed at the same time (default: %(default)s)')
+    batch.add_argument('--llm-workers', type=int, default=2, help='Documents sent to the LLM at the same time (default: %(default)s)')
+    batch.add_argument('--queue-size', type=int, help='Parsed documents that may wait for an LLM worker')
+    batch.add_argument('--retry-failed', action='store_true', help='Process files that failed in an earlier run again')
+    batch.set_defaults(func=batch_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+import model_registry
+
+# Generations sent to one model at the same time; match Ollama's OLLAMA_NUM_PARALLEL.
+# A registry entry's 'concurrency' overrides it for that model.
+MODEL_CONCURRENCY = int(os.environ.get('CV_EXTRACTOR_MODEL_CONCURRENCY', os.environ.get('OLLAMA_NUM_PARALLEL', 4)))
+# Seconds requests for a model are collected before they are released together (0 releases them at once)
+DISPATCH_WINDOW = float(os.environ.get('CV_EXTRACTOR_DISPATCH_WINDOW', 0.05))
+
+
+class QueueTimeout(Exception):
+    """No slot of the model became free before the caller's timeout."""
+
+
+class ModelDispatcher:
+    """
+    Gate in front of one model that lets requests through in groups.
+
+    The first waiting request opens a collection window of DISPATCH_WINDOW
+    seconds; the requests that arrived by its end (or as soon as they fill
+    every free slot) are released together, so Ollama receives them at the
+    same time and can schedule them into its parallel slots. At most
+    `concurrency` requests hold a slot at any time.
+
+    Args:
+        model_id (str): Registry id of the model
+        concurrency (int): Requests that may run at the same time
+        window (float): Collection window in seconds
+    """
+
+    def __init__(self, model_id, concurrency, window=DISPATCH_WINDOW):
+        self.model_id = model_id
+        self.concurrency = max(1, concurrency)
+        self.window = window
+        self._waiting = []
+        self._running = 0
+        self._window_ends = None
+        self._condition = threading.Condition()
+        self._stats = {'requests': 0, 'batches': 0, 'max_waiting': 0, 'max_batch_size': 0,
+                       'queue_time': 0.0, 'batch_sizes': {}}
+        self._thread = threading.Thread(target=self._dispatch, name=f'dispatch-{model_id}', daemon=True)
+        self._thread.start()
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while not self._waiting:
+                    self._condition.wait()
+                # Collect until the window closes or the waiting requests fill every free slot
+                while (len(self._waiting) < self.concurrency - self._running
+                       and time.time() < self._window_ends):
+                    self._condition.wait(self._window_ends - time.time())
+                while self._running >= self.concurrency:
+                    self._condition.wait()
+                size = min(len(self._waiting), self.concurrency - self._running)
+                if size == 0:
+                    continue  # Every waiting request timed out meanwhile
+                group, self._waiting = self._waiting[:size], self._waiting[size:]
+                self._running += size
+                self._window_ends = time.time() + self.window if self._waiting else None
+                now = time.time()
+                self._stats['batches'] += 1
+                self._stats['max_batch_size'] = max(self._stats['max_batch_size'], size)
+                self._stats['batch_sizes'][size] = self._stats['batch_sizes'].get(size, 0) + 1
+                for waiter in group:
+                    self._stats['queue_time'] += now - waiter['queued_at']
+                    waiter['released'] = True
+                    waiter['event'].set()
+
+    def acquire(self, timeout=None):
+        """
+        Wait until this request is released in a group.
+
+        Args:
+            timeout (float, optional): Seconds to wait at most
+
+        Raises:
+            QueueTimeout: If no slot was granted in time
+        """
+        waiter = {'event': threading.Event(), 'queued_at': time.time(), 'released': False}
+        with self._condition:
+            if not self._waiting:
+                self._window_ends = time.time() + self.window
+            self._waiting.append(waiter)
+            self._stats['requests'] += 1
+            self._stats['max_waiting'] = max(self._stats['max_waiting'], len(self._waiting))
+            self._condition.notify_all()
+        if waiter['event'].wait(timeout):
+            return
+        with self._condition:
+            # The slot may have been granted between the timeout and taking the lock
+            if waiter['released']:
+                return
+            self._waiting.remove(waiter)
+        raise QueueTimeout(f"No free {self.model_id} slot within {timeout:.1f}s")
+
+    def release(self):
+        with self._condition:
+            self._running -= 1
+            self._condition.notify_all()
+
+    def stats(self):
+        """
+        Queue and batching figures for tuning OLLAMA_NUM_PARALLEL.
+
+        Returns:
+            dict: Concurrency limit, requests running and waiting, the deepest
+            queue seen, batch count and sizes, and the average queue time
+        """
+        with self._condition:
+            stats = dict(self._stats, batch_sizes=dict(self._stats['batch_sizes']))
+            stats.update(concurrency=self.concurrency, running=self._running, waiting=len(self._waiting))
+        released = sum(size * count for size, count in stats['batch_sizes'].items())
+        stats['avg_batch_size'] = released / stats['batches'] if stats['batches'] else None
+        stats['avg_queue_time'] = stats.pop('queue_time') / released if released else None
+        return stats
+
+
+_dispatchers = {}
+_lock = threading.Lock()
+
+
+def get_dispatcher(model_id):
+    """
+    Return the dispatcher of a registry model, creating it on first use.
+
+    Returns:
+        ModelDispatcher: Limited to the entry's 'concurrency', or MODEL_CONCURRENCY
+    """
+    with _lock:
+        if model_id not in _dispatchers:
+            concurrency = model_registry.get_model(model_id).get('concurrency') or MODEL_CONCURRENCY
+            _dispatchers[model_id] = ModelDispatcher(model_id, concurrency)
+        return _dispatchers[model_id]
+
+
+@contextmanager
+def slot(model_id, timeout=None):
+    """
+    Hold one of the model's slots for the duration of a generation.
+
+    Args:
+        model_id (str): Registry id of the model
+        timeout (float, optional): Seconds to wait for the slot at most
+
+    Raises:
+        QueueTimeout: If no slot became free in time
+    """
+    dispatcher = get_dispatcher(model_id)
+    dispatcher.acquire(timeout)
+    try:
+        yield
+    finally:
+        dispatcher.release()
+
+
+def stats():
+    """
+    Dispatch figures of every model used so far, as shown in /metrics.
+
+    Returns:
+        dict: ModelDispatcher.stats() per registry id
+    """
+    with _lock:
+        dispatchers = dict(_dispatchers)
+    return {model_id: dispatcher.stats() for model_id, dispatcher in sorted(dispatchers.items())}
@@ -322,9 +322,26 @@ def evaluate_extraction(ground_truth, extracted_data):
         "overall": overall_metrics
     }
 
+def compare_all_models(ground_truth, model_results):
+    """
+    Compare the extraction results of any number of models.
+    
+    Args:
+        ground_truth (dict): The ground truth data
+        model_results (dict): The extraction results keyed by model id
+        
+    Returns:
+        dict: A dictionary containing metrics for each model
+    """
+    comparison = {}
+    for model_name, results in model_results.items():
+        processed = preprocess_model_results(results, model_name=model_name)
+        comparison[model_name] = evaluate_extraction(ground_truth, processed)
+    return comparison
+
 def compare_models(ground_truth, llama3_results, mistral_results, phi2_results):
     """
-    Compare the extraction results of the three models.
+    Compare the extraction results of the three original models.
     
     Args:
         ground_truth (dict): The ground truth data
@@ -335,20 +352,11 @@ def compare_models(ground_truth, llama3_results, mistral_results, phi2_results):
     Returns:
         dict: A dictionary containing metrics for each model
     """
-    # Preprocess each model's results
-    llama3_processed = preprocess_model_results(llama3_results, model_name="llama3")
-    mistral_processed = preprocess_model_results(mistral_results, model_name="mistral")
-    phi2_processed = preprocess_model_results(phi2_results, model_name="phi")
-    
-    llama3_metrics = evaluate_extraction(ground_truth, llama3_processed)
-    mistral_metrics = evaluate_extraction(ground_truth, mistral_processed)
-    phi2_metrics = evaluate_extraction(ground_truth, phi2_processed)
-    
-    return {
-        "llama3": llama3_metrics,
-        "mistral": mistral_metrics,
-        "phi": phi2_metrics
-    }
+    return compare_all_models(ground_truth, {
+        "llama3": llama3_results,
+        "mistral": mistral_results,
+        "phi": phi2_results
+    })
 
 def save_evaluation_results(results, output_file):
     """
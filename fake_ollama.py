@@ -0,0 +1,595 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import select
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# CV records the fake models answer with, in the ground truth format ({file name: record})
+DEFAULT_RESPONSES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ground_truth', 'ground_truth.json')
+# Models the server has "pulled": the application's extraction models and the OCR model
+DEFAULT_MODELS = ('phi', 'llama3', 'mistral', 'llava')
+# Seconds a model stays loaded when a request does not send keep_alive (Ollama's default)
+DEFAULT_KEEP_ALIVE = 300
+
+# Behaviour of every model; MODEL_PROFILES, command-line options and a --profiles file override it in that order.
+#   latency:               Time before prompt evaluation starts, drawn from a distribution
+#                          (fixed, uniform, normal, lognormal or exponential) with this mean and stddev
+#   prompt_tokens_per_sec: Prompt evaluation rate; a system prompt unchanged since the model's last
+#                          request is not evaluated again, like Ollama's KV cache reuse
+#   tokens_per_sec:        Generation rate
+#   load_time:             Seconds to load the model when it is not resident
+#   num_parallel:          Requests the model runs at the same time (OLLAMA_NUM_PARALLEL); others wait
+#   error_rate:            Share of requests answered with HTTP 500
+#   timeout_rate:          Share of requests that stall for stall_time seconds halfway through the answer
+#   malformed_rate:        Share of extractions answered with Phi-style broken JSON
+DEFAULT_PROFILE = {
+    'latency': {'distribution': 'fixed', 'mean': 0.05, 'stddev': 0.0},
+    'prompt_tokens_per_sec': 500.0,
+    'tokens_per_sec': 40.0,
+    'load_time': 2.0,
+    'num_parallel': 4,
+    'error_rate': 0.0,
+    'timeout_rate': 0.0,
+    'stall_time': 3600.0,
+    'malformed_rate': 0.0,
+}
+# Rough relative speeds of the models the application uses, keyed by Ollama model name without tag
+MODEL_PROFILES = {
+    'phi': {'prompt_tokens_per_sec': 900.0, 'tokens_per_sec': 60.0, 'load_time': 1.0, 'malformed_rate': 0.3},
+    'mistral': {'tokens_per_sec': 30.0, 'load_time': 3.0},
+    'llama3': {'tokens_per_sec': 25.0, 'load_time': 4.0},
+    'llava': {'tokens_per_sec': 30.0, 'load_time': 4.0},
+}
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'lognormal', 'exponential')
+
+CV_FIELDS = ('name', 'email', 'phone', 'education', 'experience', 'skills')
+LIST_FIELDS = ('education', 'experience', 'skills')
+# A token of the fake models, and one streamed chunk: a word or up to four characters of it,
+# with the whitespace before it
+TOKEN_SPLIT_PATTERN = re.compile(r"\s*\S{1,4}|\s+")
+DURATION_PATTERN = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, None: 1}
+
+
+def model_tag(name):
+    """Ollama's full name of a model: 'llama3' is 'llama3:latest'."""
+    return name if ':' in name else name + ':latest'
+
+
+def count_tokens(text):
+    return len(TOKEN_SPLIT_PATTERN.findall(text))
+
+
+def keep_alive_seconds(value):
+    """
+    Seconds a keep_alive value keeps a model loaded.
+
+    Returns:
+        float: The duration, or None for "forever" (negative values)
+    """
+    if value is None:
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        match = DURATION_PATTERN.match(str(value).strip())
+        if not match:
+            return DEFAULT_KEEP_ALIVE
+        seconds = float(match.group(1)) * DURATION_UNITS[match.group(2)]
+    return None if seconds < 0 else seconds
+
+
+def sample_latency(rng, spec):
+    """
+    Draw one latency in seconds from a profile's latency distribution.
+
+    Args:
+        rng (random.Random): Source of randomness
+        spec (dict): 'distribution', 'mean' and 'stddev' in seconds
+
+    Returns:
+        float: Never negative
+    """
+    distribution = spec.get('distribution', 'fixed')
+    mean = spec.get('mean', 0.0)
+    stddev = spec.get('stddev', 0.0)
+    if distribution == 'fixed' or mean <= 0:
+        value = mean
+    elif distribution == 'uniform':
+        half_width = stddev * math.sqrt(3)
+        value = rng.uniform(mean - half_width, mean + half_width)
+    elif distribution == 'normal':
+        value = rng.gauss(mean, stddev)
+    elif distribution == 'lognormal':
+        sigma = math.sqrt(math.log(1 + (stddev / mean) ** 2))
+        value = rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+    elif distribution == 'exponential':
+        value = rng.expovariate(1 / mean)
+    else:
+        raise ValueError(f"Unknown latency distribution: {distribution}")
+    return max(0.0, value)
+
+
+def load_responses(path):
+    """
+    Read the CV records the fake models answer with.
+
+    Args:
+        path (str): JSON file, either an object of records (like ground_truth.json) or a list of them
+
+    Returns:
+        list: Records with the CV_FIELDS
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+    records = list(data.values()) if isinstance(data, dict) else list(data)
+    return [record for record in records if isinstance(record, dict)]
+
+
+def malformed_json(data):
+    """
+    Phi-2's broken answer for extracted data: prose around the JSON and list
+    items split into object fragments, as repaired by evaluation.preprocess_model_results.
+    """
+    broken = {}
+    for field, value in data.items():
+        if isinstance(value, list):
+            fragments = []
+            for item in value:
+                fragments.extend(["{", f'"entry": "{item}",', f'"type": "{field}"', "}"])
+            broken[field] = fragments
+        else:
+            broken[field] = value
+    return ("Here is the extracted information in JSON format:\n\n" + json.dumps(broken, indent=2)
+            + "\n\nLet me know if you need any other information from the CV.")
+
+
+def cv_as_text(record):
+    """The text an OCR model reads from a CV page."""
+    lines = [record.get(field, '') for field in ('name', 'email', 'phone')]
+    for field in LIST_FIELDS:
+        lines.append(field.capitalize() + ':')
+        lines.extend('• ' + item for item in record.get(field, []))
+    return "\n".join(line for line in lines if line)
+
+
+class FakeOllama(ThreadingHTTPServer):
+    """
+    HTTP server answering like Ollama, for benchmarks and tests without a GPU.
+
+    Implements /api/generate and /api/chat (streaming and not), /api/tags,
+    /api/ps and /api/version. Extractions are answered with the response
+    record that best matches the prompt text, restricted to the fields of the
+    request's JSON schema; requests with images get the record as OCR text.
+    Timing follows the model's profile (see DEFAULT_PROFILE) and is reported
+    in the final chunk like Ollama does (load, prompt eval and eval durations).
+
+    Args:
+        address (tuple): (host, port) to listen on; port 0 picks a free one
+        overrides (dict, optional): Profile fields applied to every model
+        profiles (dict, optional): Profile fields per model name, applied last
+        responses (str, optional): Response records file, DEFAULT_RESPONSES if not given
+        models (list, optional): Models the server has "pulled", DEFAULT_MODELS if not given
+        seed (int): Seed of the random draws, for reproducible runs
+        speed (float): Divides every simulated duration; reported durations are the scaled ones
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 11434), overrides=None, profiles=None, responses=None,
+                 models=None, seed=0, speed=1.0):
+        super().__init__(address, FakeOllamaHandler)
+        self.overrides = overrides or {}
+        self.profiles = profiles or {}
+        self.records = load_responses(responses or DEFAULT_RESPONSES)
+        self.models = sorted({model_tag(name) for name in models or DEFAULT_MODELS})
+        self.speed = speed
+        self.stopped = threading.Event()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._loaded = {}        # Tag -> time the model is unloaded (None: never)
+        self._load_locks = {}
+        self._slots = {}
+        self._cached_system = {}  # Tag -> system prompt in the model's KV cache
+        self._stats = {'requests': 0, 'completed': 0, 'cancelled': 0, 'loads': 0, 'errors_injected': 0,
+                       'timeouts_injected': 0, 'malformed_injected': 0, 'prompt_tokens': 0, 'eval_tokens': 0}
+
+    @property
+    def url(self):
+        """Base URL of the server, e.g. for OLLAMA_API_URL=<url>/api/generate."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def profile(self, name):
+        """The effective profile of a model."""
+        base = name.split(':')[0]
+        profile = dict(DEFAULT_PROFILE)
+        for layer in (MODEL_PROFILES.get(base, {}), self.overrides, self.profiles.get(base, {})):
+            for key, value in layer.items():
+                profile[key] = dict(profile[key], **value) if key == 'latency' else value
+        return profile
+
+    def handle_error(self, request, client_address):
+        # Clients drop connections all the time (streams stopped at the end of the JSON, timeouts)
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    def has_model(self, name):
+        return model_tag(name) in self.models
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def chance(self, rate):
+        """Whether an event with the given probability happens this time."""
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < rate
+
+    def latency(self, spec):
+        with self._lock:
+            return sample_latency(self._rng, spec) / self.speed
+
+    def sleep(self, seconds):
+        """Wait, returning early once the server stops."""
+        if seconds > 0:
+            self.stopped.wait(seconds)
+
+    def slot(self, name, profile):
+        """Semaphore limiting the model to its num_parallel requests."""
+        tag = model_tag(name)
+        with self._lock:
+            if tag not in self._slots:
+                self._slots[tag] = threading.BoundedSemaphore(max(1, profile['num_parallel']))
+            return self._slots[tag]
+
+    def _expire(self):
+        now = time.time()
+        for tag, expires_at in list(self._loaded.items()):
+            if expires_at is not None and expires_at <= now:
+                del self._loaded[tag]
+                self._cached_system.pop(tag, None)
+
+    def load(self, name, profile):
+        """
+        Make a model resident, taking its load_time when it is not.
+
+        Returns:
+            float: Seconds spent loading
+        """
+        tag = model_tag(name)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(tag, threading.Lock())
+        with load_lock:
+            with self._lock:
+                self._expire()
+                if tag in self._loaded:
+                    return 0.0
+            seconds = profile['load_time'] / self.speed
+            self.sleep(seconds)
+            with self._lock:
+                self._loaded[tag] = time.time() + DEFAULT_KEEP_ALIVE
+                self._stats['loads'] += 1
+            return seconds
+
+    def keep(self, name, keep_alive):
+        """Keep a model loaded for its request's keep_alive from now on (0 unloads it)."""
+        seconds = keep_alive_seconds(keep_alive)
+        tag = model_tag(name)
+        with self._lock:
+            if seconds == 0:
+                self._loaded.pop(tag, None)
+                self._cached_system.pop(tag, None)
+            else:
+                self._loaded[tag] = None if seconds is None else time.time() + seconds
+
+    def prompt_tokens(self, name, system, prompt):
+        """Tokens the model has to evaluate, skipping a system prompt still in its KV cache."""
+        tag = model_tag(name)
+        with self._lock:
+            cached = system and self._cached_system.get(tag) == system
+            self._cached_system[tag] = system
+        return count_tokens(prompt) + (0 if cached else count_tokens(system or ''))
+
+    def match_record(self, prompt):
+        """The response record with the most values found in the prompt, or an empty one."""
+        prompt = prompt.casefold()
+        best, best_score = {}, 0
+        for record in self.records:
+            score = 0
+            for field in CV_FIELDS:
+                values = record.get(field) if field in LIST_FIELDS else [record.get(field)]
+                score += sum(1 for value in values or [] if isinstance(value, str) and value
+                             and value.casefold() in prompt)
+            if score > best_score:
+                best, best_score = record, score
+        return best
+
+    def answer(self, name, prompt, output_format, images, profile):
+        """The text a model generates for a request."""
+        if images:
+            if not self.records:
+                return ""
+            digest = hashlib.sha256(images[0].encode()).digest()
+            return cv_as_text(self.records[digest[0] % len(self.records)])
+        record = self.match_record(prompt)
+        fields = CV_FIELDS
+        if isinstance(output_format, dict) and output_format.get('properties'):
+            fields = list(output_format['properties'])
+        data = {field: record.get(field, [] if field in LIST_FIELDS else "") for field in fields}
+        if self.chance(profile['malformed_rate']):
+            self.count('malformed_injected')
+            return malformed_json(data)
+        return json.dumps(data, indent=2)
+
+    def ps(self):
+        with self._lock:
+            self._expire()
+            loaded = dict(self._loaded)
+        models = []
+        for tag, expires_at in sorted(loaded.items()):
+            expires = datetime.fromtimestamp(expires_at, timezone.utc) if expires_at else datetime.max.replace(tzinfo=timezone.utc)
+            models.append({'name': tag, 'model': tag, 'size': 0, 'size_vram': 0, 'digest': '',
+                           'expires_at': expires.isoformat()})
+        return {'models': models}
+
+    def stats(self):
+        """
+        Requests served and faults injected so far.
+
+        Returns:
+            dict: Counters, plus the models currently loaded
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['loaded'] = [model['name'] for model in self.ps()['models']]
+        return stats
+
+    def stop(self):
+        """Stop serving and release requests that are sleeping."""
+        self.stopped.set()
+        self.shutdown()
+        self.server_close()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeOllama'
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown benchmark output
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, body):
+        line = (json.dumps(body) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def _client_gone(self):
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        try:
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def _stall(self, seconds):
+        # Hang like a stuck runner until the client gives up (or the stall ends)
+        ends = time.time() + seconds
+        while time.time() < ends and not self.server.stopped.is_set():
+            if self._client_gone():
+                raise ConnectionResetError("Client closed the connection")
+            self.server.sleep(min(0.1, ends - time.time()))
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/api/tags':
+            self._send_json(200, {'models': [{'name': tag, 'model': tag, 'modified_at': _now(), 'size': 0,
+                                              'digest': '', 'details': {'format': 'gguf'}}
+                                             for tag in self.server.models]})
+        elif path == '/api/ps':
+            self._send_json(200, self.server.ps())
+        elif path == '/api/version':
+            self._send_json(200, {'version': '0.0.0-fake'})
+        elif path == '/':
+            data = b"Ollama is running"
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': 'invalid JSON body'})
+            return
+        if path not in ('/api/generate', '/api/chat'):
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            self._generate(body, chat=path == '/api/chat')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream, which cancels the generation in Ollama
+            self.server.count('cancelled')
+            self.close_connection = True
+
+    def _generate(self, body, chat):
+        server = self.server
+        name = body.get('model', '')
+        if not server.has_model(name):
+            self._send_json(404, {'error': f"model '{name}' not found, try pulling it first"})
+            return
+        server.count('requests')
+        profile = server.profile(name)
+        if chat:
+            messages = body.get('messages') or []
+            system = "\n".join(m.get('content', '') for m in messages if m.get('role') == 'system')
+            user = [m for m in messages if m.get('role') == 'user']
+            prompt = user[-1].get('content', '') if user else ''
+            images = user[-1].get('images') if user else None
+        else:
+            system = body.get('system') or ''
+            prompt = body.get('prompt') or ''
+            images = body.get('images')
+
+        queued_at = time.time()
+        with server.slot(name, profile):
+            if not prompt and not images:
+                # An empty request only loads (or with keep_alive 0, unloads) the model
+                load = server.load(name, profile)
+                server.keep(name, body.get('keep_alive'))
+                reason = 'unload' if keep_alive_seconds(body.get('keep_alive')) == 0 else 'load'
+                final = {'model': name, 'created_at': _now(), 'done': True, 'done_reason': reason,
+                         'load_duration': int(load * 1e9), 'total_duration': int((time.time() - queued_at) * 1e9)}
+                final.update({'message': {'role': 'assistant', 'content': ''}} if chat else {'response': ''})
+                self._send_json(200, final)
+                return
+            if server.chance(profile['error_rate']):
+                server.count('errors_injected')
+                self._send_json(500, {'error': 'injected failure: model runner has unexpectedly stopped'})
+                return
+
+            load = server.load(name, profile)
+            server.sleep(server.latency(profile['latency']))
+            prompt_tokens = server.prompt_tokens(name, system, prompt)
+            prompt_eval = prompt_tokens / profile['prompt_tokens_per_sec'] / server.speed
+            server.sleep(prompt_eval)
+            pieces = TOKEN_SPLIT_PATTERN.findall(server.answer(name, prompt, body.get('format'), images, profile))
+            stall_at = len(pieces) // 2 if server.chance(profile['timeout_rate']) else None
+            if stall_at is not None:
+                server.count('timeouts_injected')
+            token_time = 1 / profile['tokens_per_sec'] / server.speed
+            stream = body.get('stream', True)
+
+            def content(text):
+                return {'message': {'role': 'assistant', 'content': text}} if chat else {'response': text}
+
+            eval_started = time.time()
+            if stream:
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+            for index, piece in enumerate(pieces):
+                if index == stall_at:
+                    self._stall(profile['stall_time'] / server.speed)
+                server.sleep(token_time)
+                if stream:
+                    self._write_chunk(dict(model=name, created_at=_now(), done=False, **content(piece)))
+            eval_duration = time.time() - eval_started
+            server.keep(name, body.get('keep_alive'))
+
+        final = dict(model=name, created_at=_now(), done=True, done_reason='stop',
+                     total_duration=int((time.time() - queued_at) * 1e9), load_duration=int(load * 1e9),
+                     prompt_eval_count=prompt_tokens, prompt_eval_duration=int(prompt_eval * 1e9),
+                     eval_count=len(pieces), eval_duration=int(eval_duration * 1e9),
+                     **content("" if stream else "".join(pieces)))
+        if stream:
+            self._write_chunk(final)
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        else:
+            self._send_json(200, final)
+        server.count('completed')
+        server.count('prompt_tokens', prompt_tokens)
+        server.count('eval_tokens', len(pieces))
+
+
+def start_server(host='127.0.0.1', port=0, **options):
+    """
+    Run a FakeOllama in a background thread.
+
+    Args:
+        host (str): Interface to listen on
+        port (int): Port, 0 for any free one
+        **options: FakeOllama arguments
+
+    Returns:
+        FakeOllama: The running server; call stop() when done
+    """
+    server = FakeOllama((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='fake-ollama', daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='fake-ollama', description='Serve a stand-in for Ollama with simulated '
+                                     'latency, token rates and failures, for benchmarks and tests')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=11434, help='Port to listen on (default: %(default)s)')
+    parser.add_argument('--models', nargs='+', default=list(DEFAULT_MODELS),
+                        help='Models the server offers (default: %(default)s)')
+    parser.add_argument('--responses', default=DEFAULT_RESPONSES, help='CV records to answer with (default: ground truth)')
+    parser.add_argument('--profiles', help='JSON file of profile fields per model name, e.g. {"phi": {"error_rate": 0.1}}')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random draws (default: %(default)s)')
+    parser.add_argument('--speed', type=float, default=1.0, help='Run every simulated duration this many times faster')
+    parser.add_argument('--latency', type=float, help='Mean seconds before prompt evaluation starts')
+    parser.add_argument('--latency-stddev', type=float, help='Standard deviation of that latency')
+    parser.add_argument('--latency-distribution', choices=LATENCY_DISTRIBUTIONS, help='Distribution of that latency')
+    parser.add_argument('--prompt-tokens-per-sec', type=float, help='Prompt evaluation rate of every model')
+    parser.add_argument('--tokens-per-sec', type=float, help='Generation rate of every model')
+    parser.add_argument('--load-time', type=float, help='Seconds to load a model that is not resident')
+    parser.add_argument('--num-parallel', type=int, help='Requests each model runs at the same time')
+    parser.add_argument('--error-rate', type=float, help='Share of requests failing with HTTP 500')
+    parser.add_argument('--timeout-rate', type=float, help='Share of requests stalling halfway through the answer')
+    parser.add_argument('--stall-time', type=float, help='Seconds a stalled request hangs')
+    parser.add_argument('--malformed-rate', type=float, help='Share of extractions answered with broken JSON')
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    latency = {key: value for key, value in (('mean', args.latency), ('stddev', args.latency_stddev),
+                                             ('distribution', args.latency_distribution)) if value is not None}
+    if latency:
+        overrides['latency'] = latency
+    for key in ('prompt_tokens_per_sec', 'tokens_per_sec', 'load_time', 'num_parallel', 'error_rate',
+                'timeout_rate', 'stall_time', 'malformed_rate'):
+        if getattr(args, key) is not None:
+            overrides[key] = getattr(args, key)
+    profiles = None
+    if args.profiles:
+        with open(args.profiles, 'r') as f:
+            profiles = json.load(f)
+
+    server = FakeOllama((args.host, args.port), overrides=overrides, profiles=profiles,
+                        responses=args.responses, models=args.models, seed=args.seed, speed=args.speed)
+    print(f"Fake Ollama listening on {server.url} with models {', '.join(server.models)}")
+    print(f"Point the application at it with OLLAMA_API_URL={server.url}/api/generate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stopped.set()
+        server.server_close()
+        print(json.dumps(server.stats(), indent=4))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
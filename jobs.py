@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of extraction jobs in flight at the same time; the pipeline (see pipeline.py) limits each stage
+MAX_WORKERS = int(os.environ.get('CV_EXTRACTOR_WORKERS', 8))
+# Number of jobs that may wait for a free worker before new ones are rejected
+MAX_QUEUED_JOBS = int(os.environ.get('CV_EXTRACTOR_MAX_QUEUED', 100))
+# Finished jobs are kept this long (seconds) so clients can collect the result
+JOB_TTL = int(os.environ.get('CV_EXTRACTOR_JOB_TTL', 3600))
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='cv-job')
+_jobs = {}
+_jobs_lock = threading.Lock()
+# Notified whenever a job changes so event streams can wake up
+_jobs_changed = threading.Condition(_jobs_lock)
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue already holds MAX_QUEUED_JOBS pending jobs."""
+
+
+def _purge_expired_jobs():
+    # Caller must hold _jobs_lock
+    now = time.time()
+    expired = [job_id for job_id, job in _jobs.items()
+               if job['finished_at'] and now - job['finished_at'] > JOB_TTL]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def _touch(job):
+    # Caller must hold _jobs_lock
+    job['seq'] += 1
+    job['updated_at'] = time.time()
+    _jobs_changed.notify_all()
+
+
+def _run_job(job_id, func, args, kwargs):
+    with _jobs_lock:
+        job = _jobs[job_id]
+        job['status'] = RUNNING
+        job['stage'] = 'started'
+        job['started_at'] = time.time()
+        _touch(job)
+
+    def progress_callback(percent, stage, message=''):
+        update_progress(job_id, percent, stage, message)
+
+    try:
+        result = func(*args, progress_callback=progress_callback, **kwargs)
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        with _jobs_lock:
+            job['status'] = FAILED
+            job['error'] = str(e)
+            job['finished_at'] = time.time()
+            _touch(job)
+        return
+
+    with _jobs_lock:
+        job['status'] = DONE
+        job['progress'] = 100
+        job['stage'] = 'done'
+        job['result'] = result
+        job['finished_at'] = time.time()
+        _touch(job)
+
+
+def submit_job(func, *args, **kwargs):
+    """
+    Queue func(*args, **kwargs) to run on the worker pool.
+
+    func is also given a progress_callback(percent, stage, message='') keyword
+    argument that it can call to publish progress for the job.
+
+    Args:
+        func (callable): The work to run in the background
+        *args, **kwargs: Arguments passed to func
+
+    Returns:
+        str: The id of the new job
+
+    Raises:
+        JobQueueFull: If too many jobs are already waiting
+    """
+    with _jobs_lock:
+        _purge_expired_jobs()
+        pending = sum(1 for job in _jobs.values() if job['status'] == QUEUED)
+        if pending >= MAX_QUEUED_JOBS:
+            raise JobQueueFull(f"{pending} jobs are already waiting, try again later")
+
+        job_id = uuid.uuid4().hex
+        _jobs[job_id] = {
+            'id': job_id,
+            'status': QUEUED,
+            'progress': 0,
+            'stage': QUEUED,
+            'message': '',
+            'seq': 0,
+            'created_at': time.time(),
+            'updated_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None,
+        }
+
+    _executor.submit(_run_job, job_id, func, args, kwargs)
+    return job_id
+
+
+def get_job(job_id):
+    """
+    Return a snapshot of a job, or None if the id is unknown or expired.
+
+    Args:
+        job_id (str): The id returned by submit_job
+
+    Returns:
+        dict: A copy of the job record
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def update_progress(job_id, percent, stage, message=''):
+    """
+    Record the current progress of a running job.
+
+    Args:
+        job_id (str): The id of the job
+        percent (float): Overall completion between 0 and 100
+        stage (str): Name of the pipeline stage currently running
+        message (str, optional): Human readable detail for the stage
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None or job['status'] != RUNNING:
+            return
+        # Never move the bar backwards, stages may report out of order
+        job['progress'] = max(job['progress'], min(100, round(percent, 1)))
+        job['stage'] = stage
+        job['message'] = message
+        _touch(job)
+
+
+def wait_for_update(job_id, last_seq, timeout=15):
+    """
+    Block until a job changes after last_seq or the timeout expires.
+
+    Args:
+        job_id (str): The id of the job
+        last_seq (int): The 'seq' value of the snapshot the caller already has
+        timeout (float): Maximum number of seconds to wait
+
+    Returns:
+        dict: A copy of the job record, or None if the id is unknown or expired
+    """
+    deadline = time.time() + timeout
+    with _jobs_lock:
+        while True:
+            job = _jobs.get(job_id)
+            if job is None or job['seq'] > last_seq or job['finished_at']:
+                return dict(job) if job else None
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return dict(job)
+            _jobs_changed.wait(remaining)
+
+
+def queue_stats():
+    """
+    Count jobs by state.
+
+    Returns:
+        dict: Number of jobs in each state plus the worker pool size
+    """
+    with _jobs_lock:
+        stats = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for job in _jobs.values():
+            stats[job['status']] += 1
+    stats['workers'] = MAX_WORKERS
+    return stats
@@ -0,0 +1,166 @@
+import os
+import re
+from collections import Counter
+import fitz  # PyMuPDF
+from pdf_processing import NATIVE, PAGE_TEXT_THRESHOLD, classify_page
+
+# Split PDFs into typed sections from their layout so each field is extracted from its own section
+# (CV_EXTRACTOR_LAYOUT_SECTIONS=0 sends the whole text instead)
+LAYOUT_SECTIONS = os.environ.get('CV_EXTRACTOR_LAYOUT_SECTIONS', '1') == '1'
+# A line at least this much larger than the body text is styled as a heading
+HEADING_SIZE_RATIO = 1.15
+# Headings are short
+HEADING_MAX_CHARS = 40
+HEADING_MAX_WORDS = 5
+# PyMuPDF span flag for bold text
+BOLD_FLAG = 16
+
+# Section types
+HEADER = 'header'  # Everything before the first heading: name and contact details
+OTHER = 'other'    # Sections none of the extracted fields need (summary, interests, references, ...)
+
+# Keywords of section headings by section type, checked in this order; the list fields of an
+# extracted CV double as section types
+SECTION_KEYWORDS = (
+    ('education', ('education', 'academic', 'qualification', 'degree', 'diploma', 'formation', 'studies',
+                   'certification', 'certificate', 'course', 'training')),
+    ('experience', ('experience', 'employment', 'work history', 'career', 'internship', 'project',
+                    'volunteer', 'positions')),
+    ('skills', ('skill', 'competenc', 'technolog', 'tools', 'languages', 'expertise', 'proficienc',
+                'stack')),
+    (OTHER, ('summary', 'profile', 'objective', 'about', 'interest', 'hobbies', 'reference', 'award',
+             'achievement', 'publication', 'contact', 'personal')),
+)
+
+
+def section_type(text):
+    """
+    The section type a heading announces.
+
+    Returns:
+        str: 'education', 'experience', 'skills' or OTHER, or None if the text
+        is not a known heading
+    """
+    normalized = re.sub(r"[^\w&/ ]+", " ", text.lower()).strip()
+    for kind, keywords in SECTION_KEYWORDS:
+        if any(keyword in normalized for keyword in keywords):
+            return kind
+    return None
+
+
+def page_lines(page):
+    """
+    Text lines of a page with their style, in reading order of the content stream.
+
+    Returns:
+        list: Dicts with 'text', 'size' (largest font size on the line), 'bold'
+        (every span bold) and 'chars' (non-blank characters)
+    """
+    lines = []
+    for block in page.get_text("dict")["blocks"]:
+        if block.get("type") != 0:
+            continue  # Image block
+        for line in block["lines"]:
+            spans = [span for span in line["spans"] if span["text"].strip()]
+            if not spans:
+                continue
+            lines.append({
+                'text': "".join(span["text"] for span in line["spans"]).strip(),
+                'size': max(span["size"] for span in spans),
+                'bold': all(span["flags"] & BOLD_FLAG for span in spans),
+                'chars': sum(len(span["text"].strip()) for span in spans),
+            })
+    return lines
+
+
+def body_style(lines):
+    """
+    The font size and boldness most of the text is set in.
+
+    Returns:
+        tuple: (size, bold), weighted by the number of characters
+    """
+    sizes = Counter()
+    bold_chars = 0
+    total = 0
+    for line in lines:
+        sizes[round(line['size'], 1)] += line['chars']
+        total += line['chars']
+        if line['bold']:
+            bold_chars += line['chars']
+    size = sizes.most_common(1)[0][0] if sizes else 0.0
+    return size, total > 0 and bold_chars > total / 2
+
+
+def is_heading(line, body_size, body_bold):
+    """
+    Whether a line starts a section.
+
+    It has to name a known section (see SECTION_KEYWORDS), be short, and stand
+    out from the body text: larger, bold where the body is not, or in capitals.
+    """
+    text = line['text'].rstrip(':').strip()
+    if not text or len(text) > HEADING_MAX_CHARS or len(text.split()) > HEADING_MAX_WORDS:
+        return False
+    if text.endswith('.') or section_type(text) is None:
+        return False
+    larger = body_size and line['size'] >= body_size * HEADING_SIZE_RATIO
+    bold = line['bold'] and not body_bold
+    capitals = text.isupper() and sum(c.isalpha() for c in text) >= 3
+    return bool(larger or bold or capitals)
+
+
+def segment_lines(lines):
+    """
+    Group styled lines into typed sections.
+
+    Returns:
+        list: Dicts with 'type', 'heading' and 'text', in document order; the
+        first has type HEADER when there is text before the first heading
+    """
+    body_size, body_bold = body_style(lines)
+    sections = []
+    current = {'type': HEADER, 'heading': '', 'lines': []}
+    for line in lines:
+        if is_heading(line, body_size, body_bold):
+            if current['lines'] or current['type'] != HEADER:
+                sections.append(current)
+            current = {'type': section_type(line['text']), 'heading': line['text'], 'lines': []}
+        else:
+            current['lines'].append(line['text'])
+    sections.append(current)
+    return [{'type': section['type'], 'heading': section['heading'], 'text': "\n".join(section['lines'])}
+            for section in sections if section['lines'] or section['heading']]
+
+
+def segment_pdf(file_path):
+    """
+    Split a CV into typed sections using the font size and weight of its text.
+
+    Only documents whose every page is read from its text layer alone
+    (pdf_processing.classify_page) are segmented: scanned pages carry no font
+    information, and the OCR text added to mixed pages would be missing from
+    the sections.
+
+    Args:
+        file_path (str): Path of the CV
+
+    Returns:
+        list: Sections as returned by segment_lines, or None when the file is not
+        a PDF, a page is OCR'd, or no section heading was recognised
+    """
+    if not file_path.lower().endswith('.pdf'):
+        return None
+    lines = []
+    with fitz.open(file_path) as doc:
+        for page in doc:
+            page_text_lines = page_lines(page)
+            if sum(line['chars'] for line in page_text_lines) <= PAGE_TEXT_THRESHOLD:
+                return None  # Scanned page
+            if classify_page(page, page.get_text()) != NATIVE:
+                return None  # Mixed page: OCR adds text the sections would not hold
+            lines.extend(page_text_lines)
+    sections = segment_lines(lines)
+    if not any(section['type'] not in (HEADER, OTHER) for section in sections):
+        return None
+    return sections
@@ -4,886 +4,691 @@ import requests
 import json
 import time
 import re
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cache import create_cache, make_cache_key, normalize_text
+import ollama_client
+from ollama_client import DEFAULT_TIMEOUT
+import model_registry
+import model_manager
+import resilience
+import dispatcher
+import chunking
+import contact_fields
+import layout
+from model_registry import NUM_PREDICT, GENERATION_OPTIONS
 
-# Base URL for Ollama API
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
-# Timeout settings
-DEFAULT_TIMEOUT = 300  # 5 minutes as a default
+# Stop generating once a complete top-level JSON object has been streamed (OLLAMA_STOP_AT_JSON_END=0 disables)
+STOP_AT_JSON_END = os.environ.get('OLLAMA_STOP_AT_JSON_END', '1') == '1'
+# Bump whenever the prompts or the response post-processing change, so cached results are not reused
+PROMPT_VERSION = 5
 
-# Function to extract CV data using LLaMA 3 via Ollama
-def run_llama3_extraction(text, timeout=DEFAULT_TIMEOUT):
-    prompt = f"""
-    EXTRACT INFORMATION FROM THIS CV AND FORMAT AS JSON.
-    
-    CRITICAL INSTRUCTIONS (FOLLOW PRECISELY):
-    1. YOU MUST RETURN ONLY A VALID JSON OBJECT WITH DOUBLE QUOTES
-    2. DO NOT RETURN ANY PYTHON CODE, FUNCTIONS, OR CLASSES
-    3. DO NOT USE CODE BLOCKS OR MARKDOWN FORMAT. NO ```
-    4. DO NOT RETURN IMPORT STATEMENTS
-    5. DO NOT SUGGEST CODE OR FUNCTIONS TO PROCESS THE CV
-    6. YOUR ENTIRE RESPONSE SHOULD BE *JUST* THE JSON OBJECT
-    7. ONLY EXTRACT REAL DATA FROM THE CV TEXT
-    8. DO NOT USE PLACEHOLDERS OR EXAMPLE DATA
-    9. FIELDS MISSING FROM THE CV SHOULD BE EMPTY STRINGS OR ARRAYS
+# JSON schema of an extracted CV; sent to Ollama to constrain generation and used to validate responses
+CV_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "email": {"type": "string"},
+        "phone": {"type": "string"},
+        "education": {"type": "array", "items": {"type": "string"}},
+        "experience": {"type": "array", "items": {"type": "string"}},
+        "skills": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["name", "email", "phone", "education", "experience", "skills"]
+}
+# Fields requested from the model when contact_fields already found name, email and phone
+LIST_FIELDS = ["education", "experience", "skills"]
+# How generation is constrained: "schema" sends CV_SCHEMA as Ollama's format (Ollama >= 0.5),
+# "json" only forces valid JSON (older Ollama), "off" leaves the output unconstrained
+STRUCTURED_OUTPUT = os.environ.get('OLLAMA_STRUCTURED_OUTPUT', 'schema').lower()
+
+# Values copied from the prompt's example instead of the CV. Only the exact placeholders count: real
+# values may well start with "Real " or "Actual " ("Real Estate Agent").
+EXAMPLE_VALUES = {
+    "John Smith", "john@example.com", "123-456-7890", "Extracted Name Here", "actual.email@fromcv.com",
+    "Real name from CV", "Real email from CV", "Real phone from CV",
+    "Actual education entry", "Actual experience entry", "Actual skill",
+} | {f"Real {item} {number}" for item in ("skill", *LIST_FIELDS) for number in (1, 2)}
+
+# CV_SCHEMA restricted to some fields (all of them by default)
+def cv_schema(fields=None):
+    if fields is None:
+        return CV_SCHEMA
+    return {
+        "type": "object",
+        "properties": {field: CV_SCHEMA["properties"][field] for field in fields},
+        "required": list(fields)
+    }
+
+# The value of Ollama's "format" parameter for the configured structured output mode
+def output_format(fields=None):
+    if STRUCTURED_OUTPUT == "schema":
+        return cv_schema(fields)
+    if STRUCTURED_OUTPUT == "json":
+        return "json"
+    return None
+
+# Check extracted data against CV_SCHEMA (or only some of its fields); returns a list of problems (empty when valid)
+def validate_cv_data(data, fields=None):
+    if not isinstance(data, dict):
+        return ["response is not a JSON object"]
+    errors = []
+    for field in fields or CV_SCHEMA["required"]:
+        expected = CV_SCHEMA["properties"][field]["type"]
+        if field not in data:
+            errors.append(f"missing field '{field}'")
+        elif expected == "string" and not isinstance(data[field], str):
+            errors.append(f"'{field}' is not a string")
+        elif expected == "array" and (not isinstance(data[field], list)
+                                      or not all(isinstance(item, str) for item in data[field])):
+            errors.append(f"'{field}' is not a list of strings")
+    return errors
+
+# True if the model echoed the prompt's example data instead of extracting from the CV
+def is_example_data(data):
+    for field in CV_SCHEMA["required"]:
+        values = data.get(field, [])
+        for value in (values if isinstance(values, list) else [values]):
+            if isinstance(value, str) and value.strip() in EXAMPLE_VALUES:
+                return True
+    return False
+
+# Fast path for constrained output: parse the response as-is and accept it if it matches the schema.
+# Returns None when the response needs the repair chain. Fields that were not requested are left empty.
+def parse_structured_response(extracted_text, fields=None):
+    try:
+        data = json.loads(extracted_text)
+    except ValueError:
+        return None
+    errors = validate_cv_data(data, fields)
+    if errors:
+        print(f"Response does not match the CV schema: {'; '.join(errors)}")
+        return None
+    if is_example_data(data):
+        return None
+    if fields is not None:
+        return {field: data[field] if field in fields else ([] if field in LIST_FIELDS else "")
+                for field in CV_SCHEMA["required"]}
+    return {field: data[field] for field in CV_SCHEMA["required"]}
+
+# Cache of successful extractions, keyed by (normalized text, model, prompt, options, prompt version)
+RESULT_CACHE_TTL = float(os.environ.get('CV_EXTRACTOR_RESULT_CACHE_TTL', 7 * 24 * 3600))
+result_cache = create_cache('llm_results', ttl=RESULT_CACHE_TTL)
+
+# Cache key for one extraction request
+def result_cache_key(text, model_name):
+    return make_cache_key(normalize_text(text), model_name, model_registry.model_fingerprint(model_name),
+                          PROMPT_VERSION, STRUCTURED_OUTPUT)
+
+# Store a successful extraction in the result cache
+def _cache_result(text, model_name, result):
+    if result_cache is not None and isinstance(result, dict) and "error" not in result:
+        result_cache.set(result_cache_key(text, model_name), result)
+
+# Kinds of failed extraction, in the "error_type" of a result. Timeouts, connection and HTTP errors mean the
+# model is unavailable and count against its circuit breaker; bad output is worth retrying on the same model.
+# A busy model (no dispatcher slot came free in time) is up but saturated: it does not count against the
+# breaker, the request moves on to the next model instead.
+ERROR_TIMEOUT = "timeout"
+ERROR_CONNECTION = "connection"
+ERROR_HTTP = "http"
+ERROR_OUTPUT = "output"
+ERROR_CANCELLED = "cancelled"
+ERROR_BUSY = "busy"
+AVAILABILITY_ERRORS = {ERROR_TIMEOUT, ERROR_CONNECTION, ERROR_HTTP}
+
+# Hedged extraction: race the next fallback model against a slow preferred one (CV_EXTRACTOR_HEDGE=1).
+# Lower latency at the cost of running two generations at once.
+HEDGE = os.environ.get('CV_EXTRACTOR_HEDGE', '0') == '1'
+
+# Report progress of a pipeline stage if the caller asked for it
+def _report(progress_callback, stage, done, total, message=""):
+    if progress_callback:
+        progress_callback(stage, done, total, message)
+
+# Read the generated text from a streamed Ollama /api/generate response.
+# Generation is cut off as soon as a complete JSON object has arrived, so we do not wait for trailing chatter.
+def _read_response_text(response, model_name, progress_callback=None, deadline=None, cancel_event=None):
+    def on_token(tokens):
+        if tokens % 10 == 0:
+            _report(progress_callback, "llm_generation", tokens, NUM_PREDICT, f"{tokens} tokens generated")
     
-    Expected fields:
-    - name: The person's full name 
-    - email: Email address from the CV
-    - phone: Phone number from the CV
-    - education: List of education entries
-    - experience: List of work experiences
-    - skills: List of skills mentioned
+    text, stats = ollama_client.read_stream(response, stop_at_json_end=STOP_AT_JSON_END, on_token=on_token,
+                                            deadline=deadline, cancel_event=cancel_event)
+    ollama_client.record_generation(model_name, stats)
+    ttft = f"{stats['time_to_first_token']:.2f}s" if stats['time_to_first_token'] is not None else "n/a"
+    rate = f"{stats['tokens_per_sec']:.1f}" if stats['tokens_per_sec'] is not None else "n/a"
+    prompt_eval = (f", prompt eval {stats['prompt_eval_duration'] / 1e9:.2f}s for {stats.get('prompt_eval_count', 0)} tokens"
+                   if 'prompt_eval_duration' in stats else "")
+    print(f"{model_name}: {stats['tokens']} tokens, first token after {ttft}, {rate} tokens/s{prompt_eval}"
+          f"{', stopped at end of JSON' if stats['stopped_early'] else ''}")
+    _report(progress_callback, "llm_generation", NUM_PREDICT, NUM_PREDICT, f"{stats['tokens']} tokens generated")
+    return text
+
+
+# Empty extraction result carrying an error, so the UI still has every field to render
+def _empty_result(error):
+    return {
+        "name": "",
+        "email": "",
+        "phone": "",
+        "education": [],
+        "experience": [],
+        "skills": [],
+        "error": error
+    }
+
+# Recover CV data from a response that is not valid schema-conforming JSON
+def repair_response(extracted_text, progress_callback=None):
+    # More thorough check for Python code patterns
+    code_indicators = [
+        "import ", "def ", "```", "class ", 
+        "print(", "return ", "function", 
+        "# Your code", "# This function", 
+        "if __name__", "for ", "while ",
+        "try:", "except:", " = function",
+        "@param", "params", "# Test"
+    ]
     
-    REQUIRED FORMAT (USE DOUBLE QUOTES, NOT SINGLE QUOTES):
-    {{
-      "name": "Real name from CV",
-      "email": "Real email from CV",
-      "phone": "Real phone from CV",
-      "education": ["Real education 1", "Real education 2"],
-      "experience": ["Real experience 1", "Real experience 2"],
-      "skills": ["Real skill 1", "Real skill 2"]
-    }}
+    for indicator in code_indicators:
+        if indicator in extracted_text:
+            print(f"Detected code indicator: '{indicator}' in response")
+            return {"error": "Model returned Python code instead of JSON", "raw_response": extracted_text[:200]}
     
-    CV TEXT TO EXTRACT FROM:
+    # Extra cleaning to handle potential code blocks
+    extracted_text = extracted_text.replace("```json", "").replace("```", "")
     
-    {text}
+    # Check if response contains our example data which would indicate the model just repeated our example
+    example_data_indicators = [
+        "Extracted Name Here", 
+        "actual.email@fromcv.com", 
+        "Real phone from CV",
+        "Actual education entry",
+        "Actual experience entry",
+        "Actual skill"
+    ]
     
-    REMINDER: RETURN ONLY THE JSON OBJECT WITH REAL DATA.
-    NO CODE BLOCKS, NO PYTHON CODE, NO FUNCTIONS, NO MARKDOWN.
-    YOUR ENTIRE RESPONSE SHOULD BE JUST THE JSON OBJECT AND NOTHING ELSE.
-    """
+    for indicator in example_data_indicators:
+        if indicator in extracted_text:
+            print(f"Model returned example data ({indicator}), rejecting response")
+            return {"error": "Model returned example data instead of extraction", "raw_response": extracted_text[:200]}
     
+    # Try to parse the JSON response
+    _report(progress_callback, "json_repair", 0, 1, "Parsing model output")
     try:
-        print("Running llama3 extraction with Ollama...")
-        model_name = "llama3"
-        
-        # Set a temperature parameter to reduce randomness and increase parameter settings
-        response = requests.post(
-            OLLAMA_API_URL,
-            json={
-                "model": model_name,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,  # Slight temperature to allow creativity but not too much
-                    "num_predict": 2048,  # Increase token limit for complete response
-                    "top_p": 0.9,        # Reduce randomness
-                    "top_k": 30          # Focus on more likely tokens
-                }
-            },
-            timeout=timeout
-        )
-        
-        # Use the same error-resistant JSON extraction logic
-        if response.status_code == 200:
+        # First, try to find a complete JSON object with improved regex
+        json_match = re.search(r'(\{(?:[^{}]|(?:\{[^{}]*\}))*\})', extracted_text)
+        if json_match:
+            json_str = json_match.group(1)
+            print(f"Found JSON pattern, length: {len(json_str)}")
+            
+            # Clean the JSON
+            json_str = json_str.replace("'", '"')  # Replace single quotes with double quotes
+            json_str = re.sub(r'([{,])\s*([a-zA-Z0-9_]+):', r'\1"\2":', json_str)  # Ensure property names are quoted
+            
+            # Fix trailing commas in arrays and objects
+            json_str = re.sub(r',\s*]', ']', json_str)
+            json_str = re.sub(r',\s*}', '}', json_str)
+            
             try:
-                result = response.json()
-                extracted_text = result.get("response", "")
-                print(f"Raw response length: {len(extracted_text)}")
-                print(f"Raw response first 100 chars: {extracted_text[:100]}")
-                
-                # More thorough check for Python code patterns
-                code_indicators = [
-                    "import ", "def ", "```", "class ", 
-                    "print(", "return ", "function", 
-                    "# Your code", "# This function", 
-                    "if __name__", "for ", "while ",
-                    "try:", "except:", " = function",
-                    "@param", "params", "# Test"
-                ]
-                
-                for indicator in code_indicators:
-                    if indicator in extracted_text:
-                        print(f"Detected code indicator: '{indicator}' in response")
-                        return {"error": "Model returned Python code instead of JSON", "raw_response": extracted_text[:200]}
+                parsed_data = json.loads(json_str)
                 
-                # Extra cleaning to handle potential code blocks
-                extracted_text = extracted_text.replace("```json", "").replace("```", "")
-                
-                # Check if response contains our example data which would indicate the model just repeated our example
-                example_data_indicators = [
-                    "Extracted Name Here", 
-                    "actual.email@fromcv.com", 
-                    "Real phone from CV",
-                    "Actual education entry",
-                    "Actual experience entry",
-                    "Actual skill"
-                ]
-                
-                for indicator in example_data_indicators:
-                    if indicator in extracted_text:
-                        print(f"Model returned example data ({indicator}), rejecting response")
-                        return {"error": "Model returned example data instead of extraction", "raw_response": extracted_text[:200]}
-                
-                # Try to parse the JSON response
-                try:
-                    # First, try to find a complete JSON object with improved regex
-                    json_match = re.search(r'(\{(?:[^{}]|(?:\{[^{}]*\}))*\})', extracted_text)
-                    if json_match:
-                        json_str = json_match.group(1)
-                        print(f"Found JSON pattern, length: {len(json_str)}")
-                        
-                        # Clean the JSON
-                        json_str = json_str.replace("'", '"')  # Replace single quotes with double quotes
-                        json_str = re.sub(r'([{,])\s*([a-zA-Z0-9_]+):', r'\1"\2":', json_str)  # Ensure property names are quoted
-                        
-                        # Fix trailing commas in arrays and objects
-                        json_str = re.sub(r',\s*]', ']', json_str)
-                        json_str = re.sub(r',\s*}', '}', json_str)
-                        
-                        try:
-                            parsed_data = json.loads(json_str)
-                            
-                            # Check if the parsed data has our default data
-                            if parsed_data.get("name") == "John Smith" and parsed_data.get("email") == "john@example.com":
-                                print("Detected default example values in parsed JSON, rejecting")
-                                return {"error": "Model returned example data instead of extraction", "raw_response": extracted_text[:200]}
-                                
-                            return parsed_data
-                        except json.JSONDecodeError as e:
-                            print(f"Still couldn't parse JSON after cleaning: {e}")
-                            print(f"Cleaned JSON first 100 chars: {json_str[:100]}")
-                    else:
-                        print("No complete JSON pattern found, trying to extract fields directly")
-                        
-                    # If we reach here, try to extract individual fields
-                    cv_data = {
-                        "name": "",
-                        "email": "",
-                        "phone": "",
-                        "education": [],
-                        "experience": [],
-                        "skills": []
-                    }
-                    
-                    # Extract fields with more robust patterns
-                    name_match = re.search(r'"name"\s*:\s*"([^"]+)"', extracted_text)
-                    if name_match:
-                        extracted_name = name_match.group(1)
-                        # Skip if it looks like example data
-                        if extracted_name != "John Smith" and extracted_name != "Extracted Name Here" and "Real name" not in extracted_name:
-                            cv_data["name"] = extracted_name
-                            print(f"Extracted name: {cv_data['name']}")
-                    
-                    email_match = re.search(r'"email"\s*:\s*"([^"]+)"', extracted_text)
-                    if email_match:
-                        extracted_email = email_match.group(1)
-                        # Skip if it looks like example data
-                        if extracted_email != "john@example.com" and extracted_email != "actual.email@fromcv.com" and "Real email" not in extracted_email:
-                            cv_data["email"] = extracted_email
-                            print(f"Extracted email: {cv_data['email']}")
+                # Check if the parsed data has our default data
+                if parsed_data.get("name") == "John Smith" and parsed_data.get("email") == "john@example.com":
+                    print("Detected default example values in parsed JSON, rejecting")
+                    return {"error": "Model returned example data instead of extraction", "raw_response": extracted_text[:200]}
                     
-                    phone_match = re.search(r'"phone"\s*:\s*"([^"]+)"', extracted_text)
-                    if phone_match:
-                        extracted_phone = phone_match.group(1)
-                        # Skip if it looks like example data
-                        if extracted_phone != "123-456-7890" and extracted_phone != "Real phone from CV" and "Real phone" not in extracted_phone:
-                            cv_data["phone"] = extracted_phone
-                            print(f"Extracted phone: {cv_data['phone']}")
-                    
-                    # Extract skills
-                    skills_match = re.search(r'"skills"\s*:\s*\[(.*?)\]', extracted_text, re.DOTALL)
-                    if skills_match:
-                        skills_text = skills_match.group(1)
-                        skills = re.findall(r'"([^"]+)"', skills_text)
-                        # Filter out any that look like example data
-                        filtered_skills = [s for s in skills if not s.startswith("Actual skill") and "Real skill" not in s]
-                        if len(filtered_skills) > 0:
-                            cv_data["skills"] = filtered_skills
-                            print(f"Extracted {len(filtered_skills)} skills")
-                    
-                    # Extract education as simple strings
-                    education_match = re.search(r'"education"\s*:\s*\[(.*?)\]', extracted_text, re.DOTALL)
-                    if education_match:
-                        education_text = education_match.group(1)
-                        education_items = re.findall(r'"([^"]+)"', education_text)
-                        # Filter out any that look like example data
-                        filtered_education = [e for e in education_items if not e.startswith("Actual education") and "Real education" not in e]
-                        if len(filtered_education) > 0:
-                            cv_data["education"] = filtered_education
-                            print(f"Extracted {len(filtered_education)} education items")
-                    
-                    # Extract experience as simple strings
-                    experience_match = re.search(r'"experience"\s*:\s*\[(.*?)\]', extracted_text, re.DOTALL)
-                    if experience_match:
-                        experience_text = experience_match.group(1)
-                        experience_items = re.findall(r'"([^"]+)"', experience_text)
-                        # Filter out any that look like example data
-                        filtered_experience = [e for e in experience_items if not e.startswith("Actual experience") and "Real experience" not in e]
-                        if len(filtered_experience) > 0:
-                            cv_data["experience"] = filtered_experience
-                            print(f"Extracted {len(filtered_experience)} experience items")
-                    
-                    # Check if we extracted anything useful
-                    if cv_data["name"] or cv_data["email"] or cv_data["phone"] or cv_data["skills"]:
-                        print("Successfully extracted some data using regex fallback")
-                        return cv_data
-                    else:
-                        print("Failed to extract any fields, response may be too incomplete")
-                        # Return a structured error but with empty fields to avoid breaking the UI
-                        cv_data["error"] = "Could not extract real data from CV"
-                        return cv_data
-                    
-                except Exception as parse_error:
-                    print(f"Error during JSON parsing/extraction: {str(parse_error)}")
-                    # Return empty fields with error to avoid breaking the UI
-                    return {
-                        "name": "",
-                        "email": "",
-                        "phone": "",
-                        "education": [],
-                        "experience": [],
-                        "skills": [],
-                        "error": f"JSON parsing error: {str(parse_error)}"
-                    }
-            except Exception as e:
-                print(f"Exception in processing response: {str(e)}")
-                # Return empty fields with error to avoid breaking the UI
-                return {
-                    "name": "",
-                    "email": "",
-                    "phone": "",
-                    "education": [],
-                    "experience": [],
-                    "skills": [],
-                    "error": str(e)
-                }
-        elif response.status_code == 404:
-            # Specifically handle 404 error (model not found)
-            print(f"Model '{model_name}' not found. Available models are:")
-            try:
-                models_response = requests.get("http://localhost:11434/api/tags")
-                if models_response.status_code == 200:
-                    models = models_response.json()
-                    print(models)
-                    return {"error": f"Model '{model_name}' not found. Please check model name."}
-                else:
-                    return {"error": "Model not found and couldn't retrieve available models."}
-            except:
-                return {"error": f"Model '{model_name}' not found. Please check if Ollama is running."}
+                return parsed_data
+            except json.JSONDecodeError as e:
+                print(f"Still couldn't parse JSON after cleaning: {e}")
+                print(f"Cleaned JSON first 100 chars: {json_str[:100]}")
         else:
-            return {"error": f"API request failed with status code {response.status_code}: {response.text}"}
-    except requests.exceptions.Timeout:
-        return {"error": "Request timed out. The model may be unavailable or overloaded."}
-    except requests.exceptions.ConnectionError:
-        return {"error": "Connection error. The Ollama server may not be running."}
-    except Exception as e:
-        return {"error": f"Unexpected error: {str(e)}"}
+            print("No complete JSON pattern found, trying to extract fields directly")
+            
+        # If we reach here, try to extract individual fields
+        cv_data = {
+            "name": "",
+            "email": "",
+            "phone": "",
+            "education": [],
+            "experience": [],
+            "skills": []
+        }
+        
+        # Extract fields with more robust patterns
+        name_match = re.search(r'"name"\s*:\s*"([^"]+)"', extracted_text)
+        if name_match:
+            extracted_name = name_match.group(1)
+            # Skip if it looks like example data
+            if extracted_name != "John Smith" and extracted_name != "Extracted Name Here" and "Real name" not in extracted_name:
+                cv_data["name"] = extracted_name
+                print(f"Extracted name: {cv_data['name']}")
+        
+        email_match = re.search(r'"email"\s*:\s*"([^"]+)"', extracted_text)
+        if email_match:
+            extracted_email = email_match.group(1)
+            # Skip if it looks like example data
+            if extracted_email != "john@example.com" and extracted_email != "actual.email@fromcv.com" and "Real email" not in extracted_email:
+                cv_data["email"] = extracted_email
+                print(f"Extracted email: {cv_data['email']}")
+        
+        phone_match = re.search(r'"phone"\s*:\s*"([^"]+)"', extracted_text)
+        if phone_match:
+            extracted_phone = phone_match.group(1)
+            # Skip if it looks like example data
+            if extracted_phone != "123-456-7890" and extracted_phone != "Real phone from CV" and "Real phone" not in extracted_phone:
+                cv_data["phone"] = extracted_phone
+                print(f"Extracted phone: {cv_data['phone']}")
+        
+        # Extract skills
+        skills_match = re.search(r'"skills"\s*:\s*\[(.*?)\]', extracted_text, re.DOTALL)
+        if skills_match:
+            skills_text = skills_match.group(1)
+            skills = re.findall(r'"([^"]+)"', skills_text)
+            # Filter out any that look like example data
+            filtered_skills = [s for s in skills if not s.startswith("Actual skill") and "Real skill" not in s]
+            if len(filtered_skills) > 0:
+                cv_data["skills"] = filtered_skills
+                print(f"Extracted {len(filtered_skills)} skills")
+        
+        # Extract education as simple strings
+        education_match = re.search(r'"education"\s*:\s*\[(.*?)\]', extracted_text, re.DOTALL)
+        if education_match:
+            education_text = education_match.group(1)
+            education_items = re.findall(r'"([^"]+)"', education_text)
+            # Filter out any that look like example data
+            filtered_education = [e for e in education_items if not e.startswith("Actual education") and "Real education" not in e]
+            if len(filtered_education) > 0:
+                cv_data["education"] = filtered_education
+                print(f"Extracted {len(filtered_education)} education items")
+        
+        # Extract experience as simple strings
+        experience_match = re.search(r'"experience"\s*:\s*\[(.*?)\]', extracted_text, re.DOTALL)
+        if experience_match:
+            experience_text = experience_match.group(1)
+            experience_items = re.findall(r'"([^"]+)"', experience_text)
+            # Filter out any that look like example data
+            filtered_experience = [e for e in experience_items if not e.startswith("Actual experience") and "Real experience" not in e]
+            if len(filtered_experience) > 0:
+                cv_data["experience"] = filtered_experience
+                print(f"Extracted {len(filtered_experience)} experience items")
+        
+        # Check if we extracted anything useful
+        if cv_data["name"] or cv_data["email"] or cv_data["phone"] or cv_data["skills"]:
+            print("Successfully extracted some data using regex fallback")
+            return cv_data
+        else:
+            print("Failed to extract any fields, response may be too incomplete")
+            # Return a structured error but with empty fields to avoid breaking the UI
+            cv_data["error"] = "Could not extract real data from CV"
+            return cv_data
+        
+    except Exception as parse_error:
+        print(f"Error during JSON parsing/extraction: {str(parse_error)}")
+        # Return empty fields with error to avoid breaking the UI
+        return _empty_result(f"JSON parsing error: {str(parse_error)}")
 
-# Function to extract CV data using Mistral via Ollama
-def run_mistral_extraction(text, timeout=DEFAULT_TIMEOUT):
-    prompt = f"""
-    EXTRACT INFORMATION FROM THIS CV AND FORMAT AS JSON.
-    
-    CRITICAL INSTRUCTIONS (FOLLOW PRECISELY):
-    1. YOU MUST RETURN ONLY A VALID JSON OBJECT WITH DOUBLE QUOTES
-    2. DO NOT RETURN ANY PYTHON CODE, FUNCTIONS, OR CLASSES
-    3. DO NOT USE CODE BLOCKS OR MARKDOWN FORMAT. NO ```
-    4. DO NOT RETURN IMPORT STATEMENTS
-    5. DO NOT SUGGEST CODE OR FUNCTIONS TO PROCESS THE CV
-    6. YOUR ENTIRE RESPONSE SHOULD BE *JUST* THE JSON OBJECT
-    7. ONLY EXTRACT REAL DATA FROM THE CV TEXT
-    8. DO NOT USE PLACEHOLDERS OR EXAMPLE DATA
-    9. FIELDS MISSING FROM THE CV SHOULD BE EMPTY STRINGS OR ARRAYS
-    
-    Expected fields:
-    - name: The person's full name 
-    - email: Email address from the CV
-    - phone: Phone number from the CV
-    - education: List of education entries
-    - experience: List of work experiences
-    - skills: List of skills mentioned
-    
-    REQUIRED FORMAT (USE DOUBLE QUOTES, NOT SINGLE QUOTES):
-    {{
-      "name": "Real name from CV",
-      "email": "Real email from CV",
-      "phone": "Real phone from CV",
-      "education": ["Real education 1", "Real education 2"],
-      "experience": ["Real experience 1", "Real experience 2"],
-      "skills": ["Real skill 1", "Real skill 2"]
-    }}
-    
-    CV TEXT TO EXTRACT FROM:
-    
-    {text}
-    
-    REMINDER: RETURN ONLY THE JSON OBJECT WITH REAL DATA.
-    NO CODE BLOCKS, NO PYTHON CODE, NO FUNCTIONS, NO MARKDOWN.
-    YOUR ENTIRE RESPONSE SHOULD BE JUST THE JSON OBJECT AND NOTHING ELSE.
-    """
+# Extract CV data with any model in the registry via Ollama.
+# timeout bounds the whole generation, not just the wait for each chunk; setting cancel_event abandons it.
+# With fields the model is only asked for those fields (see model_registry.system_prompt); the others come back empty.
+def run_extraction(text, model_id, timeout=None, progress_callback=None, cancel_event=None, fields=None):
+    spec = model_registry.get_model(model_id)
+    model_name = spec["model"]
+    if timeout is None:
+        timeout = model_registry.get_timeout(model_id)
+    deadline = time.time() + timeout
     
     try:
-        print("Running mistral extraction with Ollama...")
-        model_name = "mistral"
+        print(f"Running {model_id} extraction with Ollama...")
+        
+        # Keep prompt and answer inside the context window; a fixed num_predict overflows small models
+        options = model_registry.build_options(model_id)
+        prompt_tokens = chunking.prompt_overhead(model_id) + chunking.estimate_tokens(text)
+        options["num_predict"] = chunking.num_predict_for(model_id, prompt_tokens, options.get("num_predict", NUM_PREDICT))
         
         # Set a temperature parameter to reduce randomness and increase parameter settings
-        response = requests.post(
-            OLLAMA_API_URL,
-            json={
-                "model": model_name,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,  # Slight temperature to allow creativity but not too much
-                    "num_predict": 2048,  # Increase token limit for complete response
-                    "top_p": 0.9,        # Reduce randomness
-                    "top_k": 30          # Focus on more likely tokens
-                }
-            },
-            timeout=timeout
+        payload = {
+            "model": model_name,
+            "system": model_registry.system_prompt(model_id, fields),  # Fixed prefix, reused from Ollama's KV cache
+            "prompt": model_registry.build_prompt(model_id, text),
+            "stream": True,  # Stream tokens so we can report progress and stop at the end of the JSON
+            "options": options,
+            "keep_alive": model_manager.keep_alive_for(model_name)
+        }
+        if output_format(fields) is not None:
+            payload["format"] = output_format(fields)
+        response = ollama_client.generate(
+            payload,
+            timeout=timeout,
+            stream=True
         )
         
-        # Use the same error-resistant JSON extraction logic
         if response.status_code == 200:
+            model_manager.mark_loaded(model_name)
             try:
-                result = response.json()
-                extracted_text = result.get("response", "")
+                extracted_text = _read_response_text(response, model_name, progress_callback, deadline=deadline,
+                                                     cancel_event=cancel_event)
                 print(f"Raw response length: {len(extracted_text)}")
                 print(f"Raw response first 100 chars: {extracted_text[:100]}")
                 
-                # More thorough check for Python code patterns
-                code_indicators = [
-                    "import ", "def ", "```", "class ", 
-                    "print(", "return ", "function", 
-                    "# Your code", "# This function", 
-                    "if __name__", "for ", "while ",
-                    "try:", "except:", " = function",
-                    "@param", "params", "# Test"
-                ]
-                
-                for indicator in code_indicators:
-                    if indicator in extracted_text:
-                        print(f"Detected code indicator: '{indicator}' in response")
-                        return {"error": "Model returned Python code instead of JSON", "raw_response": extracted_text[:200]}
-                
-                # Extra cleaning to handle potential code blocks
-                extracted_text = extracted_text.replace("```json", "").replace("```", "")
-                
-                # Check if response contains our example data which would indicate the model just repeated our example
-                example_data_indicators = [
-                    "Extracted Name Here", 
-                    "actual.email@fromcv.com", 
-                    "Real phone from CV",
-                    "Actual education entry",
-                    "Actual experience entry",
-                    "Actual skill"
-                ]
-                
-                for indicator in example_data_indicators:
-                    if indicator in extracted_text:
-                        print(f"Model returned example data ({indicator}), rejecting response")
-                        return {"error": "Model returned example data instead of extraction", "raw_response": extracted_text[:200]}
-                
-                # Try to parse the JSON response
-                try:
-                    # First, try to find a complete JSON object with improved regex
-                    json_match = re.search(r'(\{(?:[^{}]|(?:\{[^{}]*\}))*\})', extracted_text)
-                    if json_match:
-                        json_str = json_match.group(1)
-                        print(f"Found JSON pattern, length: {len(json_str)}")
-                        
-                        # Clean the JSON
-                        json_str = json_str.replace("'", '"')  # Replace single quotes with double quotes
-                        json_str = re.sub(r'([{,])\s*([a-zA-Z0-9_]+):', r'\1"\2":', json_str)  # Ensure property names are quoted
-                        
-                        # Fix trailing commas in arrays and objects
-                        json_str = re.sub(r',\s*]', ']', json_str)
-                        json_str = re.sub(r',\s*}', '}', json_str)
-                        
-                        try:
-                            parsed_data = json.loads(json_str)
-                            
-                            # Check if the parsed data has our default data
-                            if parsed_data.get("name") == "John Smith" and parsed_data.get("email") == "john@example.com":
-                                print("Detected default example values in parsed JSON, rejecting")
-                                return {"error": "Model returned example data instead of extraction", "raw_response": extracted_text[:200]}
-                                
-                            return parsed_data
-                        except json.JSONDecodeError as e:
-                            print(f"Still couldn't parse JSON after cleaning: {e}")
-                            print(f"Cleaned JSON first 100 chars: {json_str[:100]}")
-                    else:
-                        print("No complete JSON pattern found, trying to extract fields directly")
-                        
-                    # If we reach here, try to extract individual fields
-                    cv_data = {
-                        "name": "",
-                        "email": "",
-                        "phone": "",
-                        "education": [],
-                        "experience": [],
-                        "skills": []
-                    }
-                    
-                    # Extract fields with more robust patterns
-                    name_match = re.search(r'"name"\s*:\s*"([^"]+)"', extracted_text)
-                    if name_match:
-                        extracted_name = name_match.group(1)
-                        # Skip if it looks like example data
-                        if extracted_name != "John Smith" and extracted_name != "Extracted Name Here" and "Real name" not in extracted_name:
-                            cv_data["name"] = extracted_name
-                            print(f"Extracted name: {cv_data['name']}")
-                    
-                    email_match = re.search(r'"email"\s*:\s*"([^"]+)"', extracted_text)
-                    if email_match:
-                        extracted_email = email_match.group(1)
-                        # Skip if it looks like example data
-                        if extracted_email != "john@example.com" and extracted_email != "actual.email@fromcv.com" and "Real email" not in extracted_email:
-                            cv_data["email"] = extracted_email
-                            print(f"Extracted email: {cv_data['email']}")
-                    
-                    phone_match = re.search(r'"phone"\s*:\s*"([^"]+)"', extracted_text)
-                    if phone_match:
-                        extracted_phone = phone_match.group(1)
-                        # Skip if it looks like example data
-                        if extracted_phone != "123-456-7890" and extracted_phone != "Real phone from CV" and "Real phone" not in extracted_phone:
-                            cv_data["phone"] = extracted_phone
-                            print(f"Extracted phone: {cv_data['phone']}")
-                    
-                    # Extract skills
-                    skills_match = re.search(r'"skills"\s*:\s*\[(.*?)\]', extracted_text, re.DOTALL)
-                    if skills_match:
-                        skills_text = skills_match.group(1)
-                        skills = re.findall(r'"([^"]+)"', skills_text)
-                        # Filter out any that look like example data
-                        filtered_skills = [s for s in skills if not s.startswith("Actual skill") and "Real skill" not in s]
-                        if len(filtered_skills) > 0:
-                            cv_data["skills"] = filtered_skills
-                            print(f"Extracted {len(filtered_skills)} skills")
-                    
-                    # Extract education as simple strings
-                    education_match = re.search(r'"education"\s*:\s*\[(.*?)\]', extracted_text, re.DOTALL)
-                    if education_match:
-                        education_text = education_match.group(1)
-                        education_items = re.findall(r'"([^"]+)"', education_text)
-                        # Filter out any that look like example data
-                        filtered_education = [e for e in education_items if not e.startswith("Actual education") and "Real education" not in e]
-                        if len(filtered_education) > 0:
-                            cv_data["education"] = filtered_education
-                            print(f"Extracted {len(filtered_education)} education items")
-                    
-                    # Extract experience as simple strings
-                    experience_match = re.search(r'"experience"\s*:\s*\[(.*?)\]', extracted_text, re.DOTALL)
-                    if experience_match:
-                        experience_text = experience_match.group(1)
-                        experience_items = re.findall(r'"([^"]+)"', experience_text)
-                        # Filter out any that look like example data
-                        filtered_experience = [e for e in experience_items if not e.startswith("Actual experience") and "Real experience" not in e]
-                        if len(filtered_experience) > 0:
-                            cv_data["experience"] = filtered_experience
-                            print(f"Extracted {len(filtered_experience)} experience items")
-                    
-                    # Check if we extracted anything useful
-                    if cv_data["name"] or cv_data["email"] or cv_data["phone"] or cv_data["skills"]:
-                        print("Successfully extracted some data using regex fallback")
-                        return cv_data
-                    else:
-                        print("Failed to extract any fields, response may be too incomplete")
-                        # Return a structured error but with empty fields to avoid breaking the UI
-                        cv_data["error"] = "Could not extract real data from CV"
-                        return cv_data
-                    
-                except Exception as parse_error:
-                    print(f"Error during JSON parsing/extraction: {str(parse_error)}")
-                    # Return empty fields with error to avoid breaking the UI
-                    return {
-                        "name": "",
-                        "email": "",
-                        "phone": "",
-                        "education": [],
-                        "experience": [],
-                        "skills": [],
-                        "error": f"JSON parsing error: {str(parse_error)}"
-                    }
+                # Constrained output is normally valid as-is; the repair chain only runs when it is not
+                structured_data = parse_structured_response(extracted_text, fields)
+                if structured_data is not None:
+                    return structured_data
+                return repair_response(extracted_text, progress_callback)
+            except (requests.exceptions.RequestException, ollama_client.GenerationCancelled):
+                raise
             except Exception as e:
                 print(f"Exception in processing response: {str(e)}")
                 # Return empty fields with error to avoid breaking the UI
-                return {
-                    "name": "",
-                    "email": "",
-                    "phone": "",
-                    "education": [],
-                    "experience": [],
-                    "skills": [],
-                    "error": str(e)
-                }
+                return _empty_result(str(e))
         elif response.status_code == 404:
             # Specifically handle 404 error (model not found)
             print(f"Model '{model_name}' not found. Available models are:")
             try:
-                models_response = requests.get("http://localhost:11434/api/tags")
-                if models_response.status_code == 200:
-                    models = models_response.json()
+                models = ollama_client.list_models()
+                if models is not None:
                     print(models)
-                    return {"error": f"Model '{model_name}' not found. Please check model name."}
+                    return {"error": f"Model '{model_name}' not found. Please check model name.", "error_type": ERROR_HTTP}
                 else:
-                    return {"error": "Model not found and couldn't retrieve available models."}
+                    return {"error": "Model not found and couldn't retrieve available models.", "error_type": ERROR_HTTP}
             except:
-                return {"error": f"Model '{model_name}' not found. Please check if Ollama is running."}
+                return {"error": f"Model '{model_name}' not found. Please check if Ollama is running.", "error_type": ERROR_HTTP}
         else:
-            return {"error": f"API request failed with status code {response.status_code}: {response.text}"}
+            return {"error": f"API request failed with status code {response.status_code}: {response.text}", "error_type": ERROR_HTTP}
     except requests.exceptions.Timeout:
-        return {"error": "Request timed out. The model may be unavailable or overloaded."}
-    except requests.exceptions.ConnectionError:
-        return {"error": "Connection error. The Ollama server may not be running."}
+        return {"error": "Request timed out. The model may be unavailable or overloaded.", "error_type": ERROR_TIMEOUT}
+    except requests.exceptions.RequestException:
+        return {"error": "Connection error. The Ollama server may not be running.", "error_type": ERROR_CONNECTION}
+    except ollama_client.GenerationCancelled:
+        return {"error": f"{model_id} generation cancelled", "error_type": ERROR_CANCELLED}
     except Exception as e:
         return {"error": f"Unexpected error: {str(e)}"}
 
-# Function to extract CV data using Phi via Ollama
-def run_phi2_extraction(text, timeout=DEFAULT_TIMEOUT):
-    prompt = f"""
-    EXTRACT INFORMATION FROM THIS CV AND FORMAT AS JSON.
-    
-    CRITICAL INSTRUCTIONS (FOLLOW PRECISELY):
-    1. YOU MUST RETURN ONLY A VALID JSON OBJECT WITH DOUBLE QUOTES
-    2. DO NOT RETURN ANY PYTHON CODE, FUNCTIONS, OR CLASSES
-    3. DO NOT USE CODE BLOCKS OR MARKDOWN FORMAT. NO ```
-    4. DO NOT RETURN IMPORT STATEMENTS
-    5. DO NOT SUGGEST CODE OR FUNCTIONS TO PROCESS THE CV
-    6. YOUR ENTIRE RESPONSE SHOULD BE *JUST* THE JSON OBJECT
-    7. ONLY EXTRACT REAL DATA FROM THE CV TEXT
-    8. DO NOT USE PLACEHOLDERS OR EXAMPLE DATA
-    9. FIELDS MISSING FROM THE CV SHOULD BE EMPTY STRINGS OR ARRAYS
-    
-    Expected fields:
-    - name: The person's full name 
-    - email: Email address from the CV
-    - phone: Phone number from the CV
-    - education: List of education entries
-    - experience: List of work experiences
-    - skills: List of skills mentioned
-    
-    REQUIRED FORMAT (USE DOUBLE QUOTES, NOT SINGLE QUOTES):
-    {{
-      "name": "Real name from CV",
-      "email": "Real email from CV",
-      "phone": "Real phone from CV",
-      "education": ["Real education 1", "Real education 2"],
-      "experience": ["Real experience 1", "Real experience 2"],
-      "skills": ["Real skill 1", "Real skill 2"]
-    }}
-    
-    CV TEXT TO EXTRACT FROM:
+# Run one extraction through the model's dispatcher, which sends concurrent requests to Ollama as a group
+# and caps how many run at once. Time spent waiting for a slot counts towards the timeout.
+# Returns (result, seconds the generation ran once it had a slot, None if it never got one); the queue wait
+# is left out so the model's latency is not confused with how busy the dispatcher was.
+def dispatch_extraction(text, model_id, timeout=None, progress_callback=None, cancel_event=None, fields=None):
+    if timeout is None:
+        timeout = model_registry.get_timeout(model_id)
+    queued_at = time.time()
+    try:
+        with dispatcher.slot(model_id, timeout=timeout):
+            if cancel_event is not None and cancel_event.is_set():
+                return {"error": f"{model_id} generation cancelled", "error_type": ERROR_CANCELLED}, None
+            started = time.time()
+            remaining = timeout - (started - queued_at)
+            if remaining <= 0:
+                # The wait for the slot used up the whole timeout: the model is busy, not failing
+                return {"error": f"No time left for {model_id} after waiting {started - queued_at:.1f}s for a slot",
+                        "error_type": ERROR_BUSY}, None
+            result = run_extraction(text, model_id, timeout=remaining,
+                                    progress_callback=progress_callback, cancel_event=cancel_event, fields=fields)
+            return result, time.time() - started
+    except dispatcher.QueueTimeout as e:
+        return {"error": str(e), "error_type": ERROR_BUSY}, None
+
+# Kept for callers of the per-model functions
+def run_llama3_extraction(text, timeout=DEFAULT_TIMEOUT, progress_callback=None):
+    return run_extraction(text, 'llama3', timeout=timeout, progress_callback=progress_callback)
+
+def run_mistral_extraction(text, timeout=DEFAULT_TIMEOUT, progress_callback=None):
+    return run_extraction(text, 'mistral', timeout=timeout, progress_callback=progress_callback)
+
+def run_phi2_extraction(text, timeout=DEFAULT_TIMEOUT, progress_callback=None):
+    return run_extraction(text, 'phi', timeout=timeout, progress_callback=progress_callback)
+
+# Race the preferred model against the fallbacks that come after it. The first fallback whose circuit is
+# closed starts once the preferred model has run longer than its hedge delay, or at once if it fails.
+# The first result without an error wins, as in _extract_text, and the other generation is cancelled: its
+# stream is closed at once, even while it waits for its next token, which frees its dispatcher slot.
+# Returns (winning model id or None, its result or the last error message, the model ids that were run).
+def _extract_hedged(text, model_name, fallback_models, deadline, progress_callback=None, fields=None,
+                    kind=resilience.FULL):
+    results = queue.Queue()
+    cancel = ollama_client.CancelEvent()
     
-    {text}
+    def race(model_id, callback):
+        timeout = min(resilience.adaptive_timeout(model_id, kind), resilience.remaining(deadline))
+        try:
+            result, elapsed = dispatch_extraction(text, model_id, timeout=timeout, progress_callback=callback,
+                                                  cancel_event=cancel, fields=fields)
+        except Exception as e:
+            result, elapsed = {"error": str(e), "error_type": ERROR_CONNECTION}, None
+        error_type = result.get("error_type") if isinstance(result, dict) and "error" in result else None
+        if error_type in AVAILABILITY_ERRORS:
+            resilience.record_failure(model_id)
+        elif error_type in (ERROR_CANCELLED, ERROR_BUSY):
+            resilience.record_cancelled(model_id)
+        else:
+            resilience.record_success(model_id, elapsed if error_type is None else None, kind)
+        results.put((model_id, result))
     
-    REMINDER: RETURN ONLY THE JSON OBJECT WITH REAL DATA.
-    NO CODE BLOCKS, NO PYTHON CODE, NO FUNCTIONS, NO MARKDOWN.
-    YOUR ENTIRE RESPONSE SHOULD BE JUST THE JSON OBJECT AND NOTHING ELSE.
-    """
+    def start(model_id, callback=None):
+        threading.Thread(target=race, args=(model_id, callback), name=f"hedge-{model_id}", daemon=True).start()
     
+    start(model_name, progress_callback)
+    tried = [model_name]
+    running = 1
+    backup = None
+    delay = resilience.hedge_delay(model_name, kind)
+    hedge_at = time.time() + delay
+    error_message = ""
     try:
-        print("Running phi extraction with Ollama...")
-        model_name = "phi"
-        
-        # Set a temperature parameter to reduce randomness and increase parameter settings
-        response = requests.post(
-            OLLAMA_API_URL,
-            json={
-                "model": model_name,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,  # Slight temperature to allow creativity but not too much
-                    "num_predict": 2048,  # Increase token limit for complete response
-                    "top_p": 0.9,        # Reduce randomness
-                    "top_k": 30          # Focus on more likely tokens
-                }
-            },
-            timeout=timeout
-        )
-        
-        # Use the same error-resistant JSON extraction logic
-        if response.status_code == 200:
-            try:
-                result = response.json()
-                extracted_text = result.get("response", "")
-                print(f"Raw response length: {len(extracted_text)}")
-                print(f"Raw response first 100 chars: {extracted_text[:100]}")
-                
-                # More thorough check for Python code patterns
-                code_indicators = [
-                    "import ", "def ", "```", "class ", 
-                    "print(", "return ", "function", 
-                    "# Your code", "# This function", 
-                    "if __name__", "for ", "while ",
-                    "try:", "except:", " = function",
-                    "@param", "params", "# Test"
-                ]
-                
-                for indicator in code_indicators:
-                    if indicator in extracted_text:
-                        print(f"Detected code indicator: '{indicator}' in response")
-                        return {"error": "Model returned Python code instead of JSON", "raw_response": extracted_text[:200]}
-                
-                # Extra cleaning to handle potential code blocks
-                extracted_text = extracted_text.replace("```json", "").replace("```", "")
-                
-                # Check if response contains our example data which would indicate the model just repeated our example
-                example_data_indicators = [
-                    "Extracted Name Here", 
-                    "actual.email@fromcv.com", 
-                    "Real phone from CV",
-                    "Actual education entry",
-                    "Actual experience entry",
-                    "Actual skill"
-                ]
-                
-                for indicator in example_data_indicators:
-                    if indicator in extracted_text:
-                        print(f"Model returned example data ({indicator}), rejecting response")
-                        return {"error": "Model returned example data instead of extraction", "raw_response": extracted_text[:200]}
-                
-                # Try to parse the JSON response
-                try:
-                    # First, try to find a complete JSON object with improved regex
-                    json_match = re.search(r'(\{(?:[^{}]|(?:\{[^{}]*\}))*\})', extracted_text)
-                    if json_match:
-                        json_str = json_match.group(1)
-                        print(f"Found JSON pattern, length: {len(json_str)}")
-                        
-                        # Clean the JSON
-                        json_str = json_str.replace("'", '"')  # Replace single quotes with double quotes
-                        json_str = re.sub(r'([{,])\s*([a-zA-Z0-9_]+):', r'\1"\2":', json_str)  # Ensure property names are quoted
-                        
-                        # Fix trailing commas in arrays and objects
-                        json_str = re.sub(r',\s*]', ']', json_str)
-                        json_str = re.sub(r',\s*}', '}', json_str)
-                        
-                        try:
-                            parsed_data = json.loads(json_str)
-                            
-                            # Check if the parsed data has our default data
-                            if parsed_data.get("name") == "John Smith" and parsed_data.get("email") == "john@example.com":
-                                print("Detected default example values in parsed JSON, rejecting")
-                                return {"error": "Model returned example data instead of extraction", "raw_response": extracted_text[:200]}
-                                
-                            return parsed_data
-                        except json.JSONDecodeError as e:
-                            print(f"Still couldn't parse JSON after cleaning: {e}")
-                            print(f"Cleaned JSON first 100 chars: {json_str[:100]}")
-                    else:
-                        print("No complete JSON pattern found, trying to extract fields directly")
-                        
-                    # If we reach here, try to extract individual fields
-                    cv_data = {
-                        "name": "",
-                        "email": "",
-                        "phone": "",
-                        "education": [],
-                        "experience": [],
-                        "skills": []
-                    }
-                    
-                    # Extract fields with more robust patterns
-                    name_match = re.search(r'"name"\s*:\s*"([^"]+)"', extracted_text)
-                    if name_match:
-                        extracted_name = name_match.group(1)
-                        # Skip if it looks like example data
-                        if extracted_name != "John Smith" and extracted_name != "Extracted Name Here" and "Real name" not in extracted_name:
-                            cv_data["name"] = extracted_name
-                            print(f"Extracted name: {cv_data['name']}")
-                    
-                    email_match = re.search(r'"email"\s*:\s*"([^"]+)"', extracted_text)
-                    if email_match:
-                        extracted_email = email_match.group(1)
-                        # Skip if it looks like example data
-                        if extracted_email != "john@example.com" and extracted_email != "actual.email@fromcv.com" and "Real email" not in extracted_email:
-                            cv_data["email"] = extracted_email
-                            print(f"Extracted email: {cv_data['email']}")
-                    
-                    phone_match = re.search(r'"phone"\s*:\s*"([^"]+)"', extracted_text)
-                    if phone_match:
-                        extracted_phone = phone_match.group(1)
-                        # Skip if it looks like example data
-                        if extracted_phone != "123-456-7890" and extracted_phone != "Real phone from CV" and "Real phone" not in extracted_phone:
-                            cv_data["phone"] = extracted_phone
-                            print(f"Extracted phone: {cv_data['phone']}")
-                    
-                    # Extract skills
-                    skills_match = re.search(r'"skills"\s*:\s*\[(.*?)\]', extracted_text, re.DOTALL)
-                    if skills_match:
-                        skills_text = skills_match.group(1)
-                        skills = re.findall(r'"([^"]+)"', skills_text)
-                        # Filter out any that look like example data
-                        filtered_skills = [s for s in skills if not s.startswith("Actual skill") and "Real skill" not in s]
-                        if len(filtered_skills) > 0:
-                            cv_data["skills"] = filtered_skills
-                            print(f"Extracted {len(filtered_skills)} skills")
-                    
-                    # Extract education as simple strings
-                    education_match = re.search(r'"education"\s*:\s*\[(.*?)\]', extracted_text, re.DOTALL)
-                    if education_match:
-                        education_text = education_match.group(1)
-                        education_items = re.findall(r'"([^"]+)"', education_text)
-                        # Filter out any that look like example data
-                        filtered_education = [e for e in education_items if not e.startswith("Actual education") and "Real education" not in e]
-                        if len(filtered_education) > 0:
-                            cv_data["education"] = filtered_education
-                            print(f"Extracted {len(filtered_education)} education items")
-                    
-                    # Extract experience as simple strings
-                    experience_match = re.search(r'"experience"\s*:\s*\[(.*?)\]', extracted_text, re.DOTALL)
-                    if experience_match:
-                        experience_text = experience_match.group(1)
-                        experience_items = re.findall(r'"([^"]+)"', experience_text)
-                        # Filter out any that look like example data
-                        filtered_experience = [e for e in experience_items if not e.startswith("Actual experience") and "Real experience" not in e]
-                        if len(filtered_experience) > 0:
-                            cv_data["experience"] = filtered_experience
-                            print(f"Extracted {len(filtered_experience)} experience items")
-                    
-                    # Check if we extracted anything useful
-                    if cv_data["name"] or cv_data["email"] or cv_data["phone"] or cv_data["skills"]:
-                        print("Successfully extracted some data using regex fallback")
-                        return cv_data
-                    else:
-                        print("Failed to extract any fields, response may be too incomplete")
-                        # Return a structured error but with empty fields to avoid breaking the UI
-                        cv_data["error"] = "Could not extract real data from CV"
-                        return cv_data
-                    
-                except Exception as parse_error:
-                    print(f"Error during JSON parsing/extraction: {str(parse_error)}")
-                    # Return empty fields with error to avoid breaking the UI
-                    return {
-                        "name": "",
-                        "email": "",
-                        "phone": "",
-                        "education": [],
-                        "experience": [],
-                        "skills": [],
-                        "error": f"JSON parsing error: {str(parse_error)}"
-                    }
-            except Exception as e:
-                print(f"Exception in processing response: {str(e)}")
-                # Return empty fields with error to avoid breaking the UI
-                return {
-                    "name": "",
-                    "email": "",
-                    "phone": "",
-                    "education": [],
-                    "experience": [],
-                    "skills": [],
-                    "error": str(e)
-                }
-        elif response.status_code == 404:
-            # Specifically handle 404 error (model not found)
-            print(f"Model '{model_name}' not found. Available models are:")
+        while running:
             try:
-                models_response = requests.get("http://localhost:11434/api/tags")
-                if models_response.status_code == 200:
-                    models = models_response.json()
-                    print(models)
-                    return {"error": f"Model '{model_name}' not found. Please check model name."}
-                else:
-                    return {"error": "Model not found and couldn't retrieve available models."}
-            except:
-                return {"error": f"Model '{model_name}' not found. Please check if Ollama is running."}
-        else:
-            return {"error": f"API request failed with status code {response.status_code}: {response.text}"}
-    except requests.exceptions.Timeout:
-        return {"error": "Request timed out. The model may be unavailable or overloaded."}
-    except requests.exceptions.ConnectionError:
-        return {"error": "Connection error. The Ollama server may not be running."}
-    except Exception as e:
-        return {"error": f"Unexpected error: {str(e)}"}
+                # Until the backup has started, wake up when it is due
+                wait = None if backup is not None else max(0.0, min(hedge_at, deadline) - time.time())
+                model_id, result = results.get(timeout=wait)
+            except queue.Empty:
+                model_id, result = None, None
+            
+            if result is not None:
+                running -= 1
+                if "error" not in result:
+                    return model_id, result, tried
+                error_message = result["error"]
+                print(f"Extraction error with {model_id}: {error_message}")
+            
+            if backup is None:
+                # Choosing only now keeps a half-open circuit's single trial for a request that is really sent
+                backup = ""
+                if resilience.remaining(deadline) > 0:
+                    backup = next((candidate for candidate in fallback_models if resilience.allow(candidate)), "")
+                if backup:
+                    reason = "failed" if result is not None else f"has no result after {delay:.1f}s"
+                    print(f"{model_name} {reason}, also trying {backup}")
+                    _report(progress_callback, "llm_generation", 0, NUM_PREDICT, f"Also trying {backup}")
+                    start(backup)
+                    tried.append(backup)
+                    running += 1
+        return None, error_message or "Extraction deadline exceeded", tried
+    finally:
+        # Closes the stream of a generation that is still running
+        cancel.set()
 
-# Function to select and run the appropriate LLM
-def extract_with_llm(text, model_name, max_retries=2):
-    # Define model-specific timeouts (larger models get more time)
-    model_timeouts = {
-        'llama3': 360,  # 6 minutes for the largest model
-        'mistral': 300, # 5 minutes for medium-sized model
-        'phi': 240      # 4 minutes for smallest model
-    }
+# Extract the parts of a CV (chunks or sections, as (text, fields) pairs) concurrently and merge their results.
+# Returns (merged result, id of the model that produced every part, or None when some part failed or the
+# parts came from different models).
+def _extract_parts(parts, model_name, max_retries, progress_callback, deadline, hedge):
+    print(f"Extracting {model_name} from {len(parts)} parts of the CV")
+    done = [0]
+    lock = threading.Lock()
     
-    # Get the appropriate timeout for this model
-    timeout = model_timeouts.get(model_name, DEFAULT_TIMEOUT)
-    print(f"Using {timeout} second timeout for {model_name} model")
+    def extract(part):
+        part_text, part_fields = part
+        result, used_model = _extract_text(part_text, model_name, max_retries, None, deadline, hedge, part_fields,
+                                           resilience.PART)
+        with lock:
+            done[0] += 1
+            finished = done[0]
+        _report(progress_callback, "llm_generation", finished, len(parts), f"{finished}/{len(parts)} parts extracted")
+        return result, used_model
     
-    # Try the requested model first
-    result = None
+    with ThreadPoolExecutor(max_workers=max(1, min(chunking.CHUNK_WORKERS, len(parts)))) as executor:
+        extracted = list(executor.map(extract, parts))
+    results = [result for result, _ in extracted]
+    models = {used_model for _, used_model in extracted}
+    errors = [result["error"] for result in results if "error" in result]
+    if len(errors) == len(results):
+        return _empty_result(f"All {len(parts)} parts failed. Last error: {errors[-1]}"), None
+    if errors:
+        print(f"{len(errors)} of {len(parts)} parts failed, merging the others")
+    elif len(models) > 1:
+        print(f"Parts were extracted by {', '.join(sorted(models))}")
+    return chunking.merge_results(results), models.pop() if len(models) == 1 else None
+
+# Route the sections of a CV (layout.segment_pdf) to the requests that need them, as (text, fields) pairs:
+# each list field is asked from its own sections only; fields without a section, and the contact fields
+# when contact_fields was not sure of them, are asked from the header and untyped sections. Sections no
+# field needs are left out. Long inputs are chunked to the model's budget.
+def _section_parts(sections, text, model_name, contact_known):
+    texts = {}
+    for section in sections:
+        if section["text"].strip():
+            texts.setdefault(section["type"], []).append(section["text"])
+    
+    wanted = []
+    for field in LIST_FIELDS:
+        if field in texts:
+            wanted.append(("\n".join(texts[field]), [field]))
+    missing = [field for field in LIST_FIELDS if field not in texts]
+    remaining_fields = ([] if contact_known else list(contact_fields.CONTACT_FIELDS)) + missing
+    if remaining_fields:
+        untyped = texts.get(layout.HEADER, [])
+        if missing:
+            untyped = untyped + texts.get(layout.OTHER, [])
+        wanted.append(("\n".join(untyped) or text, remaining_fields))
+    
+    budget = chunking.chunk_budget(model_name)
+    return [(chunk, fields) for part_text, fields in wanted for chunk in chunking.chunk_text(part_text, budget)]
+
+# Run the requested model on one text, falling back to the others.
+# The requested model gets max_retries extra attempts for bad output; a model that times out, cannot be
+# reached or has no free slot is left for the next one at once. Models whose circuit breaker is open are skipped, and nothing
+# is started once the deadline has passed. With hedge the first fallback races the requested model instead
+# of waiting for it to fail. kind (resilience.FULL or PART) picks the latencies timeouts adapt to.
+# Returns (result, id of the model that produced it or None on failure).
+def _extract_text(text, model_name, max_retries, progress_callback, deadline, hedge, fields=None,
+                  kind=resilience.FULL):
+    # Try the requested model first, then the others in order of reliability.
+    # Models already loaded in Ollama go first so a fallback does not also pay for a model load.
+    fallback_models = model_manager.prefer_loaded(model_registry.fallback_order(exclude=model_name))
+    candidates = [model_name] + fallback_models
     error_message = ""
     
-    # Try the requested model with retries
-    retries = 0
-    while retries <= max_retries:
-        try:
-            if model_name == 'llama3':
-                result = run_llama3_extraction(text, timeout=timeout)
-            elif model_name == 'mistral':
-                result = run_mistral_extraction(text, timeout=timeout)
-            elif model_name == 'phi':
-                # Always use run_phi2_extraction for 'phi'
-                result = run_phi2_extraction(text, timeout=timeout)
-            else:
-                raise ValueError(f'Invalid model name: {model_name}. Available models: llama3, mistral, phi')
-            
-            # Check if there was an error in the extraction
-            if result and isinstance(result, dict) and "error" in result:
-                error_message = result.get("error", "Unknown error")
-                print(f"Extraction error with {model_name}: {error_message}")
-                retries += 1
-                if retries <= max_retries:
-                    wait_time = 2 * retries
-                    print(f"Waiting {wait_time} seconds before retry {retries}/{max_retries}...")
-                    time.sleep(wait_time)
-                continue  # Try again with the same model
-            
-            # If we get here with a result, it means success
-            if result:
-                return result
-                
-        except Exception as e:
-            retries += 1
-            error_message = str(e)
-            print(f"Attempt {retries}/{max_retries+1} failed with error: {error_message}")
-            
-            if retries <= max_retries:
-                # Wait longer between each retry
-                wait_time = 2 * retries
-                print(f"Waiting {wait_time} seconds before retrying...")
-                time.sleep(wait_time)
-            
-    # If we're here, the requested model failed after all retries
-    # Try other models in order of reliability
-    fallback_models = ['llama3', 'mistral', 'phi']
-    if model_name in fallback_models:
-        fallback_models.remove(model_name)  # Don't try the already-failed model again
+    if hedge and fallback_models and resilience.allow(model_name):
+        winner, outcome, tried = _extract_hedged(text, model_name, fallback_models, deadline, progress_callback,
+                                                 fields, kind)
+        if winner is not None:
+            if winner != model_name:
+                print(f"Successfully extracted data using {winner} as fallback")
+            return outcome, winner
+        # The raced models have had their turn; go on with the rest in order
+        error_message = outcome
+        candidates = [candidate for candidate in fallback_models if candidate not in tried]
     
-    for fallback_model in fallback_models:
-        try:
-            print(f"Trying {fallback_model} as fallback after {model_name} failed with: {error_message}")
+    for candidate in candidates:
+        attempts = max_retries + 1 if candidate == model_name else 1
+        if candidate != model_name:
+            print(f"Trying {candidate} as fallback after {model_name} failed with: {error_message}")
+        
+        for attempt in range(attempts):
+            remaining = resilience.remaining(deadline)
+            if remaining <= 0:
+                return _empty_result(f"Extraction deadline exceeded. Last error: {error_message}"), None
+            if not resilience.allow(candidate):
+                print(f"Skipping {candidate}: circuit open after repeated failures")
+                error_message = error_message or f"{candidate} is unavailable"
+                break
             
-            if fallback_model == 'llama3':
-                result = run_llama3_extraction(text, timeout=model_timeouts['llama3'])
-            elif fallback_model == 'mistral':
-                result = run_mistral_extraction(text, timeout=model_timeouts['mistral'])
-            elif fallback_model == 'phi':
-                result = run_phi2_extraction(text, timeout=model_timeouts['phi'])
+            # Adapts to the model's recent p95 latency, and never runs past the deadline
+            timeout = min(resilience.adaptive_timeout(candidate, kind), remaining)
+            print(f"Using {timeout:.0f} second timeout for {candidate} model")
+            label = f"attempt {attempt + 1}/{attempts}" if candidate == model_name else "fallback"
+            _report(progress_callback, "llm_generation", 0, NUM_PREDICT, f"Waiting for {candidate} ({label})")
+            
+            try:
+                result, elapsed = dispatch_extraction(text, candidate, timeout=timeout,
+                                                      progress_callback=progress_callback, fields=fields)
+            except Exception as e:
+                result, elapsed = {"error": str(e), "error_type": ERROR_CONNECTION}, None
             
             # Check if there was an error in the extraction
-            if result and isinstance(result, dict) and "error" in result:
-                print(f"Fallback to {fallback_model} also failed with: {result.get('error')}")
-                continue  # Try the next model
+            if isinstance(result, dict) and "error" in result:
+                error_message = result["error"]
+                print(f"Extraction error with {candidate}: {error_message}")
+                if result.get("error_type") in AVAILABILITY_ERRORS:
+                    resilience.record_failure(candidate)
+                    break  # Retrying a model that is timing out only burns the budget
+                if result.get("error_type") == ERROR_BUSY:
+                    # Its queue is full, not broken: leave the breaker alone and let the next model take it
+                    resilience.record_cancelled(candidate)
+                    break
+                # Bad output: the model is up (which ends a half-open trial), try it again
+                resilience.record_success(candidate)
+                continue
             
-            # If we get here with a result, it means success with fallback
-            if result:
-                print(f"Successfully extracted data using {fallback_model} as fallback")
-                return result
-                
-        except Exception as e:
-            print(f"Fallback to {fallback_model} failed with exception: {str(e)}")
+            resilience.record_success(candidate, elapsed, kind)
+            if candidate != model_name:
+                print(f"Successfully extracted data using {candidate} as fallback")
+            return result, candidate
     
     # If we reach here, all models have failed
-    return {
-        "name": "",
-        "email": "",
-        "phone": "",
-        "education": [],
-        "experience": [],
-        "skills": [],
-        "error": f"All models failed. Last error: {error_message}"
-    } 
\ No newline at end of file
+    return _empty_result(f"All models failed. Last error: {error_message}"), None
+
+# Function to select and run the appropriate LLM, see _extract_text for retries and fallbacks.
+# The deadline (a time.time() value, resilience.JOB_DEADLINE from now by default) bounds all of them.
+# With hedge (HEDGE by default) the first fallback races the requested model instead of waiting for it to fail.
+# With chunk, a CV longer than the model's context budget is split at section boundaries, the chunks are
+# extracted concurrently and their results merged.
+# With fast_path, name, email and phone are first taken from the text with patterns (contact_fields); when all
+# three are confident the model is only asked for the lists, and the contact fields survive unusable output.
+# With sections from layout.segment_pdf, each field is extracted from the sections that hold it (see
+# _section_parts) instead of the whole text.
+def extract_with_llm(text, model_name, max_retries=2, progress_callback=None, use_cache=True, deadline=None,
+                     hedge=None, chunk=True, fast_path=True, sections=None):
+    # Raises ValueError for models that are not in the registry
+    model_registry.get_model(model_name)
+    
+    # Repeat uploads of the same CV are answered from the cache
+    if use_cache and result_cache is not None:
+        cached = result_cache.get(result_cache_key(text, model_name))
+        if cached is not None:
+            print(f"Result cache hit for {model_name}")
+            return dict(cached)
+    
+    if deadline is None:
+        deadline = resilience.make_deadline()
+    hedge = HEDGE if hedge is None else hedge
+    
+    contact = contact_fields.extract_contact_fields(text) if fast_path else None
+    fields = LIST_FIELDS if contact is not None and contact_fields.is_confident(contact) else None
+    if fields:
+        print(f"Contact fields found without the LLM: {', '.join(contact[field]['value'] for field in contact)}")
+    
+    if sections and any(section["type"] in LIST_FIELDS for section in sections):
+        parts = _section_parts(sections, text, model_name, contact_known=fields is not None)
+    elif chunk:
+        parts = [(part, fields) for part in chunking.chunk_text(text, chunking.chunk_budget(model_name))]
+    else:
+        parts = [(text, fields)]
+    
+    if len(parts) > 1:
+        # A merge missing some parts, or mixing models, is returned but not cached
+        result, used_model = _extract_parts(parts, model_name, max_retries, progress_callback, deadline, hedge)
+    else:
+        part_text, part_fields = parts[0]
+        # Sections of the CV take less time than the whole of it
+        kind = resilience.PART if part_text != text else resilience.FULL
+        result, used_model = _extract_text(part_text, model_name, max_retries, progress_callback, deadline, hedge,
+                                           part_fields, kind)
+    
+    if contact is not None:
+        result = contact_fields.apply_contact_fields(result, contact)
+    if use_cache and used_model is not None:
+        _cache_result(text, used_model, result)
+    return result
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+import ollama_client
+import model_registry
+
+# Extraction models loaded into Ollama at start-up: "default", "all", "none" or a comma-separated list of registry ids
+PRELOAD_MODELS = os.environ.get('OLLAMA_PRELOAD_MODELS', 'default')
+# keep_alive of preloaded models, also sent with their requests so they stay resident (-1: until Ollama restarts)
+PRELOAD_KEEP_ALIVE = ollama_client.parse_keep_alive(os.environ.get('OLLAMA_PRELOAD_KEEP_ALIVE', '-1'))
+# Seconds a /api/ps answer is trusted before Ollama is asked again
+PS_REFRESH_INTERVAL = float(os.environ.get('OLLAMA_PS_REFRESH', 10))
+
+_lock = threading.Lock()
+# Ollama model tags currently loaded, as last seen through /api/ps or a successful request
+_loaded = set()
+_loaded_checked_at = 0.0
+# Tags preloaded by us and kept resident with PRELOAD_KEEP_ALIVE
+_pinned = set()
+_preload_errors = {}
+
+
+def _full_tag(tag):
+    # /api/ps reports 'llama3:latest' for a model requested as 'llama3'
+    return tag if ':' in tag else tag + ':latest'
+
+
+def preload_model_ids():
+    """
+    Registry ids selected by OLLAMA_PRELOAD_MODELS.
+
+    Returns:
+        list: Registry ids to load at start-up
+    """
+    setting = PRELOAD_MODELS.strip().lower()
+    if setting in ('', 'none'):
+        return []
+    if setting == 'default':
+        return [model_registry.default_model()]
+    if setting == 'all':
+        return model_registry.model_ids()
+    return [model_id.strip() for model_id in PRELOAD_MODELS.split(',') if model_id.strip() in model_registry.MODELS]
+
+
+def preload(model_ids=None):
+    """
+    Load models into Ollama and pin them with PRELOAD_KEEP_ALIVE.
+
+    A generate request without a prompt makes Ollama load the model and return.
+    It carries the model's extraction options: Ollama loads a runner for a
+    given num_ctx, and a first real request with a different one would load
+    the model again.
+
+    Args:
+        model_ids (list, optional): Registry ids, preload_model_ids() if not given
+
+    Returns:
+        list: The registry ids that were loaded
+    """
+    loaded = []
+    for model_id in preload_model_ids() if model_ids is None else model_ids:
+        tag = model_registry.get_model(model_id)['model']
+        started = time.time()
+        try:
+            response = ollama_client.generate({"model": tag, "keep_alive": PRELOAD_KEEP_ALIVE,
+                                               "options": model_registry.build_options(model_id)},
+                                              timeout=model_registry.get_timeout(model_id))
+            if response.status_code != 200:
+                raise RuntimeError(f"status code {response.status_code}: {response.text[:200]}")
+        except Exception as e:
+            print(f"Could not preload {model_id}: {e}")
+            with _lock:
+                _preload_errors[model_id] = str(e)
+            continue
+        print(f"Preloaded {model_id} in {time.time() - started:.1f}s")
+        with _lock:
+            _pinned.add(_full_tag(tag))
+            _loaded.add(_full_tag(tag))
+            _preload_errors.pop(model_id, None)
+        loaded.append(model_id)
+    return loaded
+
+
+def preload_async(model_ids=None):
+    """
+    Run preload() in a background thread so start-up does not wait for Ollama.
+
+    Returns:
+        threading.Thread: The started thread
+    """
+    thread = threading.Thread(target=preload, args=(model_ids,), name='model-preload', daemon=True)
+    thread.start()
+    return thread
+
+
+def loaded_models(refresh=False):
+    """
+    Ollama model tags currently loaded.
+
+    Args:
+        refresh (bool): Ask /api/ps even if the last answer is recent
+
+    Returns:
+        set: Full model tags such as 'llama3:latest'
+    """
+    global _loaded_checked_at
+    with _lock:
+        stale = refresh or time.time() - _loaded_checked_at > PS_REFRESH_INTERVAL
+        if stale:
+            # Set before asking so a slow or failing Ollama is not polled by every caller
+            _loaded_checked_at = time.time()
+    if stale:
+        try:
+            names = ollama_client.running_models()
+        except Exception as e:
+            print(f"Could not list loaded models: {e}")
+            names = None
+        if names is not None:
+            with _lock:
+                _loaded.clear()
+                _loaded.update(_full_tag(name) for name in names)
+    with _lock:
+        return set(_loaded)
+
+
+def is_loaded(model_id):
+    """Whether the model of a registry id is loaded in Ollama."""
+    return _full_tag(model_registry.get_model(model_id)['model']) in loaded_models()
+
+
+def mark_loaded(tag):
+    """Record that a request to this model tag just succeeded, so it is loaded."""
+    with _lock:
+        _loaded.add(_full_tag(tag))
+
+
+def prefer_loaded(model_ids):
+    """
+    Order models so those already loaded come first, keeping the given order otherwise.
+
+    Args:
+        model_ids (list): Registry ids, e.g. model_registry.fallback_order()
+
+    Returns:
+        list: The same ids, loaded models first
+    """
+    loaded = loaded_models()
+    return sorted(model_ids, key=lambda model_id: _full_tag(model_registry.get_model(model_id)['model']) not in loaded)
+
+
+def keep_alive_for(tag):
+    """keep_alive to send with a request: preloaded models stay pinned, others use OLLAMA_KEEP_ALIVE."""
+    with _lock:
+        pinned = _full_tag(tag) in _pinned
+    return PRELOAD_KEEP_ALIVE if pinned else ollama_client.KEEP_ALIVE
+
+
+def status():
+    """
+    Model residency as shown in /metrics.
+
+    Returns:
+        dict: Loaded and pinned model tags, and preload errors by registry id
+    """
+    loaded = loaded_models()
+    with _lock:
+        return {
+            'loaded': sorted(loaded),
+            'pinned': sorted(_pinned),
+            'preload_errors': dict(_preload_errors),
+        }
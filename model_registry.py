@@ -0,0 +1,308 @@
+import hashlib
+import json
+import os
+import ollama_client
+
+# Maximum number of tokens a model may generate for one extraction
+NUM_PREDICT = 2048
+# Sampling options sent with every extraction request; a model's own 'options' are applied on top
+GENERATION_OPTIONS = {
+    "temperature": 0.1,  # Slight temperature to allow creativity but not too much
+    "num_predict": NUM_PREDICT,  # Increase token limit for complete response
+    "top_p": 0.9,        # Reduce randomness
+    "top_k": 30          # Focus on more likely tokens
+}
+
+# Instructions shared by all extraction models, sent as the system prompt. It never changes between
+# requests, so Ollama can reuse its KV cache for it and only evaluate the CV text that follows.
+EXTRACTION_SYSTEM_PROMPT = """EXTRACT INFORMATION FROM THE CV THE USER SENDS AND FORMAT AS JSON.
+
+CRITICAL INSTRUCTIONS (FOLLOW PRECISELY):
+1. YOU MUST RETURN ONLY A VALID JSON OBJECT WITH DOUBLE QUOTES
+2. DO NOT RETURN ANY PYTHON CODE, FUNCTIONS, OR CLASSES
+3. DO NOT USE CODE BLOCKS OR MARKDOWN FORMAT. NO ```
+4. DO NOT RETURN IMPORT STATEMENTS
+5. DO NOT SUGGEST CODE OR FUNCTIONS TO PROCESS THE CV
+6. YOUR ENTIRE RESPONSE SHOULD BE *JUST* THE JSON OBJECT
+7. ONLY EXTRACT REAL DATA FROM THE CV TEXT
+8. DO NOT USE PLACEHOLDERS OR EXAMPLE DATA
+9. FIELDS MISSING FROM THE CV SHOULD BE EMPTY STRINGS OR ARRAYS
+
+Expected fields:
+- name: The person's full name
+- email: Email address from the CV
+- phone: Phone number from the CV
+- education: List of education entries
+- experience: List of work experiences
+- skills: List of skills mentioned
+
+REQUIRED FORMAT (USE DOUBLE QUOTES, NOT SINGLE QUOTES):
+{
+  "name": "Real name from CV",
+  "email": "Real email from CV",
+  "phone": "Real phone from CV",
+  "education": ["Real education 1", "Real education 2"],
+  "experience": ["Real experience 1", "Real experience 2"],
+  "skills": ["Real skill 1", "Real skill 2"]
+}
+
+REMINDER: RETURN ONLY THE JSON OBJECT WITH REAL DATA.
+NO CODE BLOCKS, NO PYTHON CODE, NO FUNCTIONS, NO MARKDOWN.
+YOUR ENTIRE RESPONSE SHOULD BE JUST THE JSON OBJECT AND NOTHING ELSE."""
+
+# System prompt used when name, email and phone were already found by contact_fields and the
+# model only has to extract the lists
+EXTRACTION_LISTS_SYSTEM_PROMPT = """EXTRACT THE EDUCATION, EXPERIENCE AND SKILLS FROM THE CV THE USER SENDS AND FORMAT AS JSON.
+
+CRITICAL INSTRUCTIONS (FOLLOW PRECISELY):
+1. YOU MUST RETURN ONLY A VALID JSON OBJECT WITH DOUBLE QUOTES
+2. DO NOT RETURN ANY PYTHON CODE, FUNCTIONS, OR CLASSES
+3. DO NOT USE CODE BLOCKS OR MARKDOWN FORMAT. NO ```
+4. YOUR ENTIRE RESPONSE SHOULD BE *JUST* THE JSON OBJECT
+5. ONLY EXTRACT REAL DATA FROM THE CV TEXT
+6. DO NOT USE PLACEHOLDERS OR EXAMPLE DATA
+7. FIELDS MISSING FROM THE CV SHOULD BE EMPTY ARRAYS
+
+Expected fields:
+- education: List of education entries
+- experience: List of work experiences
+- skills: List of skills mentioned
+
+REQUIRED FORMAT (USE DOUBLE QUOTES, NOT SINGLE QUOTES):
+{
+  "education": ["Real education 1", "Real education 2"],
+  "experience": ["Real experience 1", "Real experience 2"],
+  "skills": ["Real skill 1", "Real skill 2"]
+}
+
+REMINDER: RETURN ONLY THE JSON OBJECT WITH REAL DATA.
+NO CODE BLOCKS, NO PYTHON CODE, NO FUNCTIONS, NO MARKDOWN."""
+
+# What each list field holds, for prompts that ask for a single field
+FIELD_DESCRIPTIONS = {
+    "education": "List of education entries (degrees, schools, certifications)",
+    "experience": "List of work experiences (positions, companies, projects)",
+    "skills": "List of skills mentioned",
+}
+
+# System prompt for one section of a CV (see layout.py) that only holds one list field; {field} and
+# {description} are filled from FIELD_DESCRIPTIONS, which keeps the prompt fixed per field
+SECTION_SYSTEM_PROMPT = """EXTRACT THE {FIELD} FROM THE CV SECTION THE USER SENDS AND FORMAT AS JSON.
+
+CRITICAL INSTRUCTIONS (FOLLOW PRECISELY):
+1. YOU MUST RETURN ONLY A VALID JSON OBJECT WITH DOUBLE QUOTES
+2. DO NOT RETURN ANY PYTHON CODE, FUNCTIONS, OR CLASSES
+3. DO NOT USE CODE BLOCKS OR MARKDOWN FORMAT. NO ```
+4. YOUR ENTIRE RESPONSE SHOULD BE *JUST* THE JSON OBJECT
+5. ONLY EXTRACT REAL DATA FROM THE CV TEXT
+6. DO NOT USE PLACEHOLDERS OR EXAMPLE DATA
+7. IF THE SECTION HOLDS NO {FIELD}, RETURN AN EMPTY ARRAY
+
+Expected field:
+- {field}: {description}
+
+REQUIRED FORMAT (USE DOUBLE QUOTES, NOT SINGLE QUOTES):
+{{
+  "{field}": ["Real {field} 1", "Real {field} 2"]
+}}
+
+REMINDER: RETURN ONLY THE JSON OBJECT WITH REAL DATA.
+NO CODE BLOCKS, NO PYTHON CODE, NO FUNCTIONS, NO MARKDOWN."""
+
+# Per-request prompt; the CV text comes last so everything before it is a shared prefix
+EXTRACTION_PROMPT = """CV TEXT TO EXTRACT FROM:
+
+{text}"""
+
+# Extraction models, in the order they are offered in the UI.
+#   model:            Ollama model tag (defaults to the registry id)
+#   display_name:     Name shown in the UI and charts
+#   system_prompt:    Fixed instructions sent as Ollama's system prompt (defaults to EXTRACTION_SYSTEM_PROMPT)
+#   lists_system_prompt: System prompt asking only for the list fields, used when the contact fields were
+#                     found without the LLM (defaults to EXTRACTION_LISTS_SYSTEM_PROMPT)
+#   section_system_prompt: System prompt for a section holding a single list field, with {field}, {FIELD}
+#                     and {description} placeholders (defaults to SECTION_SYSTEM_PROMPT)
+#   prompt_template:  Prompt with a {text} placeholder (defaults to EXTRACTION_PROMPT), keep {text} last
+#   options:          Ollama options applied on top of GENERATION_OPTIONS
+#   timeout:          Request timeout in seconds (OLLAMA_TIMEOUT_<MODEL> overrides it)
+#   context_length:   Context window in tokens, sent to Ollama as num_ctx
+#   fallback_priority: Order in which models are tried when another one fails (lower first)
+#   concurrency:      Generations sent to the model at the same time (defaults to CV_EXTRACTOR_MODEL_CONCURRENCY)
+MODELS = {
+    'phi': {
+        'display_name': 'Phi-2',
+        'timeout': 240,  # 4 minutes for smallest model
+        'context_length': 2048,
+        'fallback_priority': 3,
+    },
+    'llama3': {
+        'display_name': 'LLaMA 3',
+        'timeout': 360,  # 6 minutes for the largest model
+        'context_length': 8192,
+        'fallback_priority': 1,
+    },
+    'mistral': {
+        'display_name': 'Mistral',
+        'timeout': 300,  # 5 minutes for medium-sized model
+        'context_length': 8192,
+        'fallback_priority': 2,
+    },
+}
+
+# Defaults for fields a registry entry leaves out
+MODEL_DEFAULTS = {
+    'system_prompt': EXTRACTION_SYSTEM_PROMPT,
+    'lists_system_prompt': EXTRACTION_LISTS_SYSTEM_PROMPT,
+    'section_system_prompt': SECTION_SYSTEM_PROMPT,
+    'prompt_template': EXTRACTION_PROMPT,
+    'options': {},
+    'timeout': ollama_client.DEFAULT_TIMEOUT,
+    'context_length': 2048,
+    'fallback_priority': 100,
+    'concurrency': None,
+}
+
+
+def register_model(model_id, **spec):
+    """
+    Add or replace an extraction model.
+
+    Args:
+        model_id (str): Registry id, used in forms, result file names and evaluation
+        **spec: Any of the fields documented on MODELS
+    """
+    entry = dict(MODEL_DEFAULTS)
+    entry.update(spec)
+    entry.setdefault('model', model_id)
+    entry.setdefault('display_name', model_id)
+    entry['id'] = model_id
+    MODELS[model_id] = entry
+
+
+def load_models_file(path):
+    """
+    Register models from a JSON file mapping registry ids to MODELS-style entries.
+
+    An entry with "enabled": false removes that model instead.
+
+    Args:
+        path (str): Path of the JSON file
+    """
+    with open(path, 'r') as f:
+        entries = json.load(f)
+    for model_id, spec in entries.items():
+        if spec.pop('enabled', True) is False:
+            MODELS.pop(model_id, None)
+        else:
+            register_model(model_id, **{**MODELS.get(model_id, {}), **spec})
+
+
+def get_model(model_id):
+    """
+    Look up a registered model.
+
+    Args:
+        model_id (str): Registry id
+
+    Returns:
+        dict: The complete registry entry
+
+    Raises:
+        ValueError: If the model is not registered
+    """
+    if model_id not in MODELS:
+        raise ValueError(f'Invalid model name: {model_id}. Available models: {", ".join(MODELS)}')
+    return MODELS[model_id]
+
+
+def model_ids():
+    """Registry ids in UI order."""
+    return list(MODELS)
+
+
+def display_names():
+    """Map of registry id to display name."""
+    return {model_id: spec['display_name'] for model_id, spec in MODELS.items()}
+
+
+def default_model():
+    """Model used when none is chosen: Phi-2, the smallest, if it is registered."""
+    return 'phi' if 'phi' in MODELS else next(iter(MODELS))
+
+
+def fallback_order(exclude=None):
+    """
+    Registry ids in the order they should be tried as fallbacks.
+
+    Args:
+        exclude (str, optional): A model to leave out, usually the one that just failed
+
+    Returns:
+        list: Registry ids sorted by fallback_priority
+    """
+    ordered = sorted(MODELS, key=lambda model_id: MODELS[model_id]['fallback_priority'])
+    return [model_id for model_id in ordered if model_id != exclude]
+
+
+def system_prompt(model_id, fields=None):
+    """
+    The system prompt asking a model for some of the CV fields.
+
+    Args:
+        model_id (str): Registry id of the model
+        fields (list, optional): The fields wanted, all of them if not given
+
+    Returns:
+        str: The section prompt for a single list field, the lists prompt for
+        several list fields, otherwise the full extraction prompt
+    """
+    spec = get_model(model_id)
+    if fields and all(field in FIELD_DESCRIPTIONS for field in fields):
+        if len(fields) == 1:
+            field = fields[0]
+            return spec['section_system_prompt'].format(field=field, FIELD=field.upper(),
+                                                        description=FIELD_DESCRIPTIONS[field])
+        return spec['lists_system_prompt']
+    return spec['system_prompt']
+
+
+def build_prompt(model_id, text):
+    """Fill the model's prompt template with the CV text."""
+    return get_model(model_id)['prompt_template'].format(text=text)
+
+
+def build_options(model_id):
+    """Ollama options for a model: GENERATION_OPTIONS, the model's own options and its context length."""
+    spec = get_model(model_id)
+    options = dict(GENERATION_OPTIONS)
+    options.update(spec['options'])
+    options['num_ctx'] = spec['context_length']
+    return options
+
+
+def get_timeout(model_id):
+    """Request timeout for a model, honouring OLLAMA_TIMEOUT_<MODEL> overrides."""
+    spec = get_model(model_id)
+    return ollama_client.get_timeout(spec['model'], default=spec['timeout'])
+
+
+def model_fingerprint(model_id):
+    """
+    Hash of everything in a model's entry that affects its output.
+
+    Used in cache keys so that editing a prompt or option invalidates old results.
+    """
+    spec = get_model(model_id)
+    payload = json.dumps([spec['model'], spec['system_prompt'], spec['lists_system_prompt'],
+                          spec['section_system_prompt'], spec['prompt_template'], build_options(model_id)],
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Fill in defaults for the built-in entries
+for _model_id, _spec in list(MODELS.items()):
+    register_model(_model_id, **_spec)
+
+# Extra or overriding models, e.g. {"qwen2.5-1.5b": {"model": "qwen2.5:1.5b", "display_name": "Qwen 2.5 1.5B"}}
+if os.environ.get('CV_EXTRACTOR_MODELS_FILE'):
+    load_models_file(os.environ['CV_EXTRACTOR_MODELS_FILE'])
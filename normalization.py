@@ -0,0 +1,155 @@
+import math
+import os
+import re
+import unicodedata
+from chunking import estimate_tokens
+from pdf_processing import PAGE_BREAK
+
+# Clean the extracted text before it is sent to the LLM (CV_EXTRACTOR_NORMALIZE_TEXT=0 sends it as extracted)
+NORMALIZE_TEXT = os.environ.get('CV_EXTRACTOR_NORMALIZE_TEXT', '1') == '1'
+# Headers and footers are looked for in this many non-empty lines at the top and bottom of each page
+FURNITURE_LINES = 3
+# A line is page furniture when it sits at the edge of at least this share of the pages (and of two pages)
+FURNITURE_PAGE_SHARE = 0.5
+
+# Characters that carry no text: soft hyphens, zero-width spaces and joiners, byte order marks
+INVISIBLE_PATTERN = re.compile(r"[\u00ad\u200b-\u200d\u2060\ufeff]")
+SPACE_PATTERN = re.compile(r"\s+")
+# List markers at the start of a line; dashes and asterisks only when followed by a space
+BULLET_PATTERN = re.compile(r"^(?:[•●○◦▪▫■□◆◇♦►▸▹▶➢➤➔→✓✔✗❖⦿∙·‣⁃]\s*|[-–—*]\s+)+")
+# "Page 2", "Page 2 of 3", "p. 2", "- 2 -"
+PAGE_NUMBER_PATTERN = re.compile(
+    r"^(?:[-–—]\s*)?(?:(?:page|pg\.?|p\.)\s*\d{1,3}(?:\s*(?:/|of|sur|de)\s*\d{1,3})?|\d{1,3}(?=\s*[-–—]))(?:\s*[-–—])?$",
+    re.IGNORECASE)
+# "2 / 3", "2 of 3": also how dates ("06/21") and ratings ("4/5") are written, see is_page_fraction
+PAGE_FRACTION_PATTERN = re.compile(r"^(\d{1,3})\s*(?:/|of)\s*(\d{1,3})$", re.IGNORECASE)
+# A letter, a hyphen at the end of the line, and the word going on on the next line (possibly after a page break)
+HYPHENATED_PATTERN = re.compile(r"([^\W\d_])-\n+([^\W\d_])")
+BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+
+
+def furniture_key(line):
+    """Compare lines ignoring case, spacing and numbers, so "Page 1" and "Page 2" match."""
+    return re.sub(r"\d+", "#", SPACE_PATTERN.sub(" ", line).strip().casefold())
+
+
+def find_page_furniture(pages):
+    """
+    Lines repeated at the top or bottom of the pages: running headers, footers and page numbers.
+
+    Args:
+        pages (list): Text of each page
+
+    Returns:
+        set: furniture_key of each repeated line; empty for single-page documents
+    """
+    if len(pages) < 2:
+        return set()
+    counts = {}
+    for page in pages:
+        lines = [line for line in page.splitlines() if line.strip()]
+        for key in {furniture_key(line) for line in lines[:FURNITURE_LINES] + lines[-FURNITURE_LINES:]}:
+            counts[key] = counts.get(key, 0) + 1
+    needed = max(2, math.ceil(len(pages) * FURNITURE_PAGE_SHARE))
+    return {key for key, count in counts.items() if count >= needed}
+
+
+def is_page_fraction(line, page_count):
+    """Whether a bare "n / m" line numbers the pages: m is the document's page count and n one of its pages."""
+    match = PAGE_FRACTION_PATTERN.match(line)
+    if match is None or not page_count:
+        return False
+    page, pages = int(match.group(1)), int(match.group(2))
+    return pages == page_count and 1 <= page <= pages
+
+
+def is_noise(line):
+    """
+    Whether a line carries no content.
+
+    True for lines without any letter or digit (rules, dot leaders, stray
+    punctuation) and for OCR debris made of three or more isolated characters
+    such as "i | , '".
+    """
+    if not any(c.isalnum() for c in line):
+        return True
+    words = line.split()
+    return len(words) >= 3 and all(len(word) == 1 for word in words)
+
+
+def _dehyphenate(match):
+    # Only rejoin words cut by a line break; a capital on the next line starts a new word ("Jean-\nPierre")
+    if match.group(2).islower():
+        return match.group(1) + match.group(2)
+    return match.group(0)
+
+
+def clean_text(text, furniture=(), page_count=None):
+    """
+    Strip what the model does not need from extracted text.
+
+    Unicode is NFKC-normalised (ligatures, non-breaking and full-width
+    spaces) and invisible characters are removed; each line loses its list
+    marker and runs of whitespace; page numbers, noise lines and every
+    occurrence of a furniture line after the first are dropped; words
+    hyphenated across lines are rejoined and blank lines collapsed to one.
+    Bare "n / m" lines are only taken for page numbers when the page count
+    is known (see is_page_fraction).
+
+    Args:
+        text (str): Extracted text, or the text of one layout section
+        furniture (set, optional): Keys from find_page_furniture
+        page_count (int, optional): Pages of the document the text comes from
+
+    Returns:
+        str: The cleaned text
+    """
+    text = INVISIBLE_PATTERN.sub("", unicodedata.normalize('NFKC', text))
+    lines = []
+    seen_furniture = set()
+    for line in text.splitlines():
+        line = BULLET_PATTERN.sub("", SPACE_PATTERN.sub(" ", line).strip())
+        if not line:
+            lines.append("")
+            continue
+        if PAGE_NUMBER_PATTERN.match(line) or is_page_fraction(line, page_count) or is_noise(line):
+            continue
+        key = furniture_key(line)
+        if key in furniture:
+            # The first occurrence is kept: a running header often carries the candidate's name
+            if key in seen_furniture:
+                continue
+            seen_furniture.add(key)
+        lines.append(line)
+    text = HYPHENATED_PATTERN.sub(_dehyphenate, "\n".join(lines))
+    return BLANK_LINES_PATTERN.sub("\n\n", text).strip()
+
+
+def normalize_document(text):
+    """
+    Clean the text of a whole document as returned by pdf_processing.extract_text.
+
+    Page furniture is found from the page breaks the text still carries,
+    then the text is cleaned as one piece (see clean_text) so that words
+    hyphenated across a page break are rejoined too.
+
+    Args:
+        text (str): Extracted text, pages separated by PAGE_BREAK
+
+    Returns:
+        tuple: (cleaned text, report) where the report holds the estimated
+        'tokens_before' and 'tokens_after', the 'lines_removed', and the
+        'furniture' keys and 'pages' count for cleaning the document's layout sections
+    """
+    pages = text.split(PAGE_BREAK)
+    furniture = find_page_furniture(pages)
+    cleaned = clean_text(text.replace(PAGE_BREAK, "\n"), furniture, len(pages))
+    report = {
+        'tokens_before': estimate_tokens(text),
+        'tokens_after': estimate_tokens(cleaned),
+        'lines_removed': len([line for line in text.splitlines() if line.strip()])
+                         - len([line for line in cleaned.splitlines() if line.strip()]),
+        'furniture': sorted(furniture),
+        'pages': len(pages),
+    }
+    return cleaned, report
@@ -0,0 +1,426 @@
+import json
+import os
+import socket
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+
+# Ollama generate endpoint; docker-compose points this at the ollama container
+OLLAMA_API_URL = os.environ.get('OLLAMA_API_URL', 'http://localhost:11434/api/generate')
+# Root of the Ollama server, used for the other endpoints (/api/tags, /api/chat, ...)
+OLLAMA_BASE_URL = os.environ.get('OLLAMA_BASE_URL', OLLAMA_API_URL.split('/api/')[0]).rstrip('/')
+# Keep-alive connections held open to Ollama; should cover every thread that can call it at once
+POOL_SIZE = int(os.environ.get('OLLAMA_POOL_SIZE', 32))
+
+# How long Ollama keeps a model loaded after a request ("30m", "1h", seconds, or -1 for forever)
+def parse_keep_alive(value):
+    """Ollama takes keep_alive as a duration string ("30m") or a number of seconds (-1 for forever)."""
+    return int(value) if value.lstrip('-').isdigit() else value
+
+KEEP_ALIVE = parse_keep_alive(os.environ.get('OLLAMA_KEEP_ALIVE', '30m'))
+# Chunks read past the end of the JSON object while waiting for Ollama's final chunk, which carries
+# the prompt-eval and load timings; any non-whitespace text ends the stream right away
+JSON_END_GRACE_CHUNKS = 2
+
+# A generation whose model load took longer than this (seconds) counts as a cold start
+COLD_START_THRESHOLD = 1.0
+
+# Timeout settings
+DEFAULT_TIMEOUT = 300  # 5 minutes as a default
+# Timeouts for models that are not extraction models (those declare theirs in model_registry),
+# overridable with OLLAMA_TIMEOUT_<MODEL>
+MODEL_TIMEOUTS = {
+    'llava': 30,    # Per page OCR request
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the process-wide requests session used for every Ollama call.
+
+    Returns:
+        requests.Session: A session with a keep-alive connection pool of POOL_SIZE
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def reset_session():
+    """
+    Drop the shared session so the next call opens new connections.
+
+    Needed in forked worker processes, whose inherited connections belong to the parent.
+    """
+    global _session
+    _session = None
+
+
+def api_url(path):
+    """
+    Build the URL of an Ollama endpoint.
+
+    Args:
+        path (str): Endpoint path such as '/api/tags'
+
+    Returns:
+        str: The full URL
+    """
+    return OLLAMA_BASE_URL + path
+
+
+def get_timeout(model_name, default=None):
+    """
+    Return the request timeout for a model.
+
+    Args:
+        model_name (str): The Ollama model name
+        default (float, optional): Timeout to use when neither the environment
+            nor MODEL_TIMEOUTS has one, DEFAULT_TIMEOUT if not given
+
+    Returns:
+        float: Timeout in seconds
+    """
+    env_name = 'OLLAMA_TIMEOUT_' + ''.join(c if c.isalnum() else '_' for c in model_name).upper()
+    if env_name in os.environ:
+        return float(os.environ[env_name])
+    if model_name in MODEL_TIMEOUTS:
+        return MODEL_TIMEOUTS[model_name]
+    return default if default is not None else DEFAULT_TIMEOUT
+
+
+def generate(payload, timeout=None, stream=False):
+    """
+    POST a request to /api/generate over the shared connection pool.
+
+    Args:
+        payload (dict): The JSON body; must contain 'model'. 'keep_alive' defaults to KEEP_ALIVE
+        timeout (float, optional): Seconds to wait, defaults to the model's timeout
+        stream (bool): Whether to read the response body incrementally
+
+    Returns:
+        requests.Response: The raw response
+    """
+    if timeout is None:
+        timeout = get_timeout(payload['model'])
+    payload.setdefault('keep_alive', KEEP_ALIVE)
+    return get_session().post(OLLAMA_API_URL, json=payload, timeout=timeout, stream=stream)
+
+
+def list_models(timeout=10):
+    """
+    List the models installed in Ollama (/api/tags).
+
+    Args:
+        timeout (float): Seconds to wait
+
+    Returns:
+        dict: The decoded response, or None if the request failed
+    """
+    response = get_session().get(api_url('/api/tags'), timeout=timeout)
+    if response.status_code != 200:
+        return None
+    return response.json()
+
+
+def running_models(timeout=5):
+    """
+    List the models currently loaded in Ollama (/api/ps).
+
+    Args:
+        timeout (float): Seconds to wait
+
+    Returns:
+        list: Model names such as 'llama3:latest', or None if the request failed
+    """
+    response = get_session().get(api_url('/api/ps'), timeout=timeout)
+    if response.status_code != 200:
+        return None
+    return [model['name'] for model in response.json().get('models', [])]
+
+
+class JsonObjectTracker:
+    """
+    Follow streamed text and detect when the first top-level JSON object is complete.
+
+    Braces are counted outside of double-quoted strings, honouring backslash
+    escapes, so braces inside values do not end the object early.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.complete = False
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, fragment):
+        """
+        Consume the next piece of generated text.
+
+        Args:
+            fragment (str): Newly generated text
+
+        Returns:
+            bool: True once the first top-level object has been closed
+        """
+        if self.complete:
+            return True
+        for char in fragment:
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self.started:
+                self._in_string = True
+            elif char == '{':
+                self.started = True
+                self.depth += 1
+            elif char == '}' and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+                    return True
+        return False
+
+
+class GenerationCancelled(Exception):
+    """A streamed generation was abandoned by its caller."""
+
+
+def _abort(response):
+    # close() alone does not wake a thread blocked reading the socket; shutting the socket down does
+    sock = getattr(getattr(response.raw, '_connection', None), 'sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+class CancelEvent(threading.Event):
+    """
+    Cancellation flag that also drops the streams read under it.
+
+    A plain threading.Event is only checked between streamed chunks, so a
+    generation stalled before its next chunk would hold its connection (and
+    its dispatcher slot) until the read timeout. Setting a CancelEvent
+    closes every response read_stream is reading with it at once.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._responses = set()
+        self._responses_lock = threading.Lock()
+
+    def watch(self, response):
+        """Close the response when the event is set (at once if it already is)."""
+        with self._responses_lock:
+            if not self.is_set():
+                self._responses.add(response)
+                return
+        _abort(response)
+
+    def unwatch(self, response):
+        with self._responses_lock:
+            self._responses.discard(response)
+
+    def set(self):
+        with self._responses_lock:
+            super().set()
+            responses, self._responses = self._responses, set()
+        for response in responses:
+            _abort(response)
+
+
+def read_stream(response, stop_at_json_end=True, on_token=None, deadline=None, cancel_event=None):
+    """
+    Read a streamed /api/generate response (one JSON object per line).
+
+    Args:
+        response (requests.Response): A response opened with stream=True
+        stop_at_json_end (bool): Close the stream, which makes Ollama stop
+            generating, once a complete top-level JSON object has arrived (after
+            at most JSON_END_GRACE_CHUNKS whitespace chunks)
+        on_token (callable, optional): Called as on_token(tokens_so_far) for every chunk
+        deadline (float, optional): time.time() by which generation must be done; the
+            stream is closed and requests.exceptions.Timeout raised when it passes (as
+            it is when the response's read timeout expires between chunks)
+        cancel_event (threading.Event, optional): When set, the stream is closed and
+            GenerationCancelled raised; a CancelEvent also interrupts a read waiting for
+            the next chunk
+
+    Returns:
+        tuple: (generated text, stats dict with time_to_first_token, tokens,
+        tokens_per_sec, total_time, stopped_early and Ollama's own counters when available)
+    """
+    # response.elapsed is the time until the headers arrived, so this approximates when the request was sent
+    started = time.time() - response.elapsed.total_seconds()
+    first_token_at = None
+    last_token_at = None
+    tracker = JsonObjectTracker() if stop_at_json_end else None
+    chunks = []
+    tokens = 0
+    trailing = 0
+    final = {}
+    stopped_early = False
+    if isinstance(cancel_event, CancelEvent):
+        cancel_event.watch(response)
+
+    try:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            if deadline is not None and time.time() > deadline:
+                raise requests.exceptions.Timeout("Generation did not finish before its deadline")
+            if cancel_event is not None and cancel_event.is_set():
+                raise GenerationCancelled("Generation cancelled")
+            chunk = json.loads(line)
+            fragment = chunk.get('response', '')
+            if tracker is not None and tracker.complete:
+                if chunk.get('done'):
+                    final = chunk
+                    break
+                trailing += 1
+                if fragment.strip() or trailing > JSON_END_GRACE_CHUNKS:
+                    stopped_early = True
+                    break
+                continue
+            if fragment:
+                last_token_at = time.time()
+                if first_token_at is None:
+                    first_token_at = last_token_at
+                chunks.append(fragment)
+                tokens += 1
+                if on_token:
+                    on_token(tokens)
+            if chunk.get('done'):
+                final = chunk
+                break
+            if tracker is not None and fragment:
+                tracker.feed(fragment)
+    except Exception as e:
+        # A stream closed by the cancel event fails in whatever read it was blocked in
+        if cancel_event is not None and cancel_event.is_set():
+            raise GenerationCancelled("Generation cancelled") from None
+        # requests reports a read timeout in the middle of the body as a ConnectionError; a stalled
+        # model is not an unreachable one
+        if isinstance(e, requests.exceptions.ConnectionError) and any(
+                isinstance(arg, ReadTimeoutError) for arg in e.args):
+            raise requests.exceptions.Timeout(f"Generation stalled: {e}") from None
+        raise
+    finally:
+        if isinstance(cancel_event, CancelEvent):
+            cancel_event.unwatch(response)
+        # Closing an unfinished stream drops the connection, which cancels the generation in Ollama
+        response.close()
+
+    generation_time = (last_token_at - first_token_at) if first_token_at and last_token_at else 0.0
+    stats = {
+        'time_to_first_token': (first_token_at - started) if first_token_at else None,
+        'tokens': tokens,
+        'tokens_per_sec': tokens / generation_time if generation_time > 0 else None,
+        'total_time': time.time() - started,
+        'stopped_early': stopped_early,
+    }
+    for key in ('prompt_eval_count', 'prompt_eval_duration', 'eval_count', 'eval_duration', 'load_duration'):
+        if key in final:
+            stats[key] = final[key]
+    return ''.join(chunks), stats
+
+
+_generation_totals = {}
+_generation_lock = threading.Lock()
+
+
+def record_generation(model_name, stats):
+    """
+    Add the stats of one generation to the per-model totals shown in /metrics.
+
+    Args:
+        model_name (str): The model that generated
+        stats (dict): Stats returned by read_stream
+    """
+    with _generation_lock:
+        totals = _generation_totals.setdefault(model_name, {
+            'generations': 0, 'stopped_early': 0, 'tokens': 0,
+            'time_to_first_token_sum': 0.0, 'time_to_first_token_count': 0,
+            'tokens_per_sec_sum': 0.0, 'tokens_per_sec_count': 0, 'total_time_sum': 0.0,
+            'prompt_eval_count_sum': 0, 'prompt_eval_duration_sum': 0, 'prompt_eval_samples': 0,
+            'load_duration_sum': 0, 'load_samples': 0, 'cold_starts': 0,
+        })
+        totals['generations'] += 1
+        totals['stopped_early'] += int(stats['stopped_early'])
+        totals['tokens'] += stats['tokens']
+        totals['total_time_sum'] += stats['total_time']
+        if stats['time_to_first_token'] is not None:
+            totals['time_to_first_token_sum'] += stats['time_to_first_token']
+            totals['time_to_first_token_count'] += 1
+        if stats['tokens_per_sec'] is not None:
+            totals['tokens_per_sec_sum'] += stats['tokens_per_sec']
+            totals['tokens_per_sec_count'] += 1
+        # Ollama only reports these in its final chunk (durations in nanoseconds)
+        if 'prompt_eval_duration' in stats:
+            totals['prompt_eval_count_sum'] += stats.get('prompt_eval_count', 0)
+            totals['prompt_eval_duration_sum'] += stats['prompt_eval_duration']
+            totals['prompt_eval_samples'] += 1
+        if 'load_duration' in stats:
+            totals['load_duration_sum'] += stats['load_duration']
+            totals['load_samples'] += 1
+            if stats['load_duration'] / 1e9 > COLD_START_THRESHOLD:
+                totals['cold_starts'] += 1
+
+
+def reset_generation_metrics():
+    """Forget the recorded generations, e.g. so a benchmark only measures its own runs."""
+    with _generation_lock:
+        _generation_totals.clear()
+
+
+def generation_metrics():
+    """
+    Summarize the recorded generations per model.
+
+    Returns:
+        dict: For each model, the number of generations, how many stopped early,
+        and the average time to first token, tokens/sec, total time, prompt
+        tokens evaluated, prompt-eval time, model load time and the number of cold starts
+    """
+    with _generation_lock:
+        summary = {}
+        for model_name, totals in _generation_totals.items():
+            count = totals['generations']
+            summary[model_name] = {
+                'generations': count,
+                'stopped_early': totals['stopped_early'],
+                'tokens': totals['tokens'],
+                'avg_time_to_first_token': (totals['time_to_first_token_sum'] / totals['time_to_first_token_count']
+                                            if totals['time_to_first_token_count'] else None),
+                'avg_tokens_per_sec': (totals['tokens_per_sec_sum'] / totals['tokens_per_sec_count']
+                                       if totals['tokens_per_sec_count'] else None),
+                'avg_total_time': totals['total_time_sum'] / count if count else None,
+                'avg_prompt_eval_tokens': (totals['prompt_eval_count_sum'] / totals['prompt_eval_samples']
+                                           if totals['prompt_eval_samples'] else None),
+                'avg_prompt_eval_time': (totals['prompt_eval_duration_sum'] / totals['prompt_eval_samples'] / 1e9
+                                         if totals['prompt_eval_samples'] else None),
+                'avg_load_time': (totals['load_duration_sum'] / totals['load_samples'] / 1e9
+                                  if totals['load_samples'] else None),
+                'cold_starts': totals['cold_starts'],
+            }
+        return summary
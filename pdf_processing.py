@@ -6,127 +6,336 @@ import requests
 import os
 import base64
 import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from cache import create_cache, make_cache_key
+import ollama_client
+
+# Number of processes used to run Tesseract on scanned pages in parallel (0 or 1 disables the pool)
+OCR_WORKERS = int(os.environ.get('CV_EXTRACTOR_OCR_WORKERS', os.cpu_count() or 1))
+_ocr_pool = None
+
+# Page rendering for OCR: resolution (72 is PyMuPDF's default), color mode, and the
+# image format used when a page has to be sent over HTTP
+OCR_DPI = int(os.environ.get('CV_EXTRACTOR_OCR_DPI', 72))
+OCR_GRAYSCALE = os.environ.get('CV_EXTRACTOR_OCR_GRAYSCALE', '0') == '1'
+OCR_IMAGE_FORMAT = os.environ.get('CV_EXTRACTOR_OCR_IMAGE_FORMAT', 'png')
+
+# Maximum number of page OCR requests in flight to Ollama at once
+OCR_LLM_CONCURRENCY = int(os.environ.get('CV_EXTRACTOR_OCR_LLM_CONCURRENCY', 4))
+_ocr_llm_pool = None
+
+# Separator between the pages of the extracted text, so later stages can tell the pages apart
+PAGE_BREAK = "\f"
+
+# Text of already-processed pages, keyed by page content hash, extraction engine and the rendering settings.
+# Persisted on disk so re-uploaded scans are never OCR'd twice.
+def _create_page_cache():
+    return create_cache('page_text', memory_entries=1024, disk_entries=100000)
+
+page_cache = _create_page_cache()
+
+# Prepare a forked worker process (e.g. a pipeline text worker) to run extract_text: the parent's
+# pools, SQLite connection and HTTP connections must not be used from the child
+def init_worker_process(ocr_workers=None):
+    global _ocr_pool, _ocr_llm_pool, page_cache, OCR_WORKERS
+    _ocr_pool = None
+    _ocr_llm_pool = None
+    if ocr_workers is not None:
+        OCR_WORKERS = ocr_workers
+    page_cache = _create_page_cache()
+    ollama_client.reset_session()
+
+# Hash of what a page displays: its content streams plus every embedded image.
+# Documents that are not PDFs (e.g. PNG uploads) have no content streams, so their rendering is hashed instead.
+def page_content_hash(page):
+    digest = hashlib.sha256()
+    if page.parent.is_pdf:
+        digest.update(page.read_contents())
+        for image in page.get_images(full=True):
+            digest.update(page.parent.xref_stream_raw(image[0]) or b"")
+    else:
+        digest.update(page.get_pixmap().samples)
+    return digest.hexdigest()
+
+# Cache key of a page's text. Pages are OCR'd as rendered, so a different resolution or color mode
+# must not be answered with text read from the old rendering.
+def _page_cache_key(page_hash, engine):
+    return make_cache_key(page_hash, engine, OCR_DPI, OCR_GRAYSCALE)
+
+# Look up the cached text of a page for an extraction engine ("tesseract" or an OCR model name)
+def get_cached_page(page_hash, engine):
+    if page_cache is None:
+        return None
+    return page_cache.get(_page_cache_key(page_hash, engine))
+
+# Remember the text of a page and how it was obtained ("native", "tesseract" or an OCR model name)
+def cache_page(page_hash, engine, text, method):
+    if page_cache is not None:
+        page_cache.set(_page_cache_key(page_hash, engine), {"text": text, "method": method})
+
+# Report progress of a pipeline stage if the caller asked for it
+def _report(progress_callback, stage, done, total, message=""):
+    if progress_callback:
+        progress_callback(stage, done, total, message)
 
 # Function to extract text from text-based PDFs
-def extract_text_from_pdf(file_path):
+def extract_text_from_pdf(file_path, progress_callback=None):
     text = ""
     with fitz.open(file_path) as doc:
-        for page in doc:
+        for page_num, page in enumerate(doc):
             text += page.get_text()
+            _report(progress_callback, "text_extraction", page_num + 1, len(doc), f"Read page {page_num + 1}/{len(doc)}")
     return text
 
+# Minimum number of characters for a page to count as having a text layer
+PAGE_TEXT_THRESHOLD = 10
+# Share of the page area that images must cover before a page with some text is treated as (partly) scanned
+SCAN_IMAGE_COVERAGE = 0.5
+
+# How a page is routed by extract_text
+NATIVE = "native"        # The text layer is all there is, no OCR needed
+NEEDS_OCR = "needs_ocr"  # No usable text layer, the page is a scan
+MIXED = "mixed"          # Some text, but most of the page is an image that may hold more
+
 # Function to determine if a PDF page contains text
-def has_text(page):
-    text = page.get_text()
-    return len(text.strip()) > 10  # Arbitrary threshold
+def has_text(page, text=None):
+    if text is None:
+        text = page.get_text()
+    return len(text.strip()) > PAGE_TEXT_THRESHOLD  # Arbitrary threshold
 
-# Function to extract text from image-based PDFs using Tesseract OCR
-def extract_text_from_image_pdf_tesseract(file_path):
-    text = ""
-    with fitz.open(file_path) as doc:
-        for page in doc:
-            if not has_text(page):  # If the page doesn't have text, use OCR
-                pix = page.get_pixmap()
-                img = Image.open(io.BytesIO(pix.tobytes()))
-                text += pytesseract.image_to_string(img)
-            else:
-                text += page.get_text()
-    return text
+# Fraction of the page covered by images
+def image_coverage(page):
+    page_area = abs(page.rect)
+    if not page_area:
+        return 0.0
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return min(1.0, covered / page_area)
 
-# Function to extract text from image-based PDFs using a multimodal LLM via Ollama
-def extract_text_from_image_pdf_llm(file_path, model_name="llava"):
-    text = ""
-    OLLAMA_API_URL = "http://localhost:11434/api/generate"
+# Decide how a page should be extracted, given the text already read from it
+def classify_page(page, text):
+    if not has_text(page, text):
+        return NEEDS_OCR
+    if image_coverage(page) >= SCAN_IMAGE_COVERAGE:
+        return MIXED
+    return NATIVE
+
+# Render a page for OCR, entirely in memory
+def render_page(page, dpi=None, grayscale=None):
+    dpi = OCR_DPI if dpi is None else dpi
+    grayscale = OCR_GRAYSCALE if grayscale is None else grayscale
+    colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+    return page.get_pixmap(dpi=dpi, colorspace=colorspace, alpha=False)
+
+# Raw pixels of a page as a picklable (mode, size, samples) tuple.
+# pix.samples is one copy of the pixel buffer; nothing is PNG-encoded. (A zero-copy view via
+# pix.samples_mv is not used because PyMuPDF refuses to free a pixmap whose buffer is still exported.)
+def render_page_raw(page, dpi=None, grayscale=None):
+    pix = render_page(page, dpi, grayscale)
+    mode = "L" if pix.n == 1 else "RGB"
+    return mode, (pix.width, pix.height), pix.samples
+
+# Wrap raw pixels as a PIL image without copying them again
+def raw_to_image(raw):
+    mode, size, samples = raw
+    return Image.frombuffer(mode, size, samples, "raw", mode, 0, 1)
+
+# Encode raw pixels for transports that need a file format (e.g. the Ollama images field)
+def encode_raw_image(raw, image_format=None, quality=85):
+    image_format = (image_format or OCR_IMAGE_FORMAT).upper()
+    buffer = io.BytesIO()
+    if image_format == "JPEG":
+        raw_to_image(raw).save(buffer, format="JPEG", quality=quality)
+    else:
+        raw_to_image(raw).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+# OCR a single page with Tesseract
+def ocr_page_tesseract(page):
+    return pytesseract.image_to_string(raw_to_image(render_page_raw(page)))
+
+# Run Tesseract on raw page pixels (executed in the OCR worker processes)
+def _tesseract_raw(raw):
+    try:
+        return pytesseract.image_to_string(raw_to_image(raw)), "tesseract"
+    except Exception as e:
+        # Some pytesseract exceptions cannot be pickled back to the parent and would break the pool
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+# Shared process pool for Tesseract, created on first use
+def get_ocr_pool():
+    global _ocr_pool
+    if _ocr_pool is None:
+        _ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+    return _ocr_pool
+
+# Shared thread pool that bounds how many OCR requests are in flight to Ollama at once
+def get_ocr_llm_pool():
+    global _ocr_llm_pool
+    if _ocr_llm_pool is None:
+        _ocr_llm_pool = ThreadPoolExecutor(max_workers=OCR_LLM_CONCURRENCY, thread_name_prefix="ocr-llm")
+    return _ocr_llm_pool
+
+# OCR raw page pixels with a multimodal LLM via Ollama, falling back to Tesseract.
+# Thread-safe: it only touches the pixel buffer, never the fitz document.
+# page_num (0-based) only names the page in log messages. Returns the text and the engine that produced it.
+def _ocr_image_llm(raw, model_name="llava", page_num=None):
+    where = f" for page {page_num}" if page_num is not None else ""
+    img_base64 = base64.b64encode(encode_raw_image(raw)).decode('utf-8')
+    prompt = """
+    This is a page from a CV/resume. 
+    Perform OCR to extract all the text from this image.
+    Return only the extracted text, no additional comments.
+    """
+    
+    try:
+        response = ollama_client.generate({
+            "model": model_name,
+            "prompt": prompt,
+            "images": [img_base64],
+            "stream": False
+        })
+        
+        if response.status_code == 200:
+            result = response.json()
+            return result.get("response", ""), model_name
+        print(f"Ollama OCR request{where} failed with status code {response.status_code}, using Tesseract")
+    except requests.exceptions.RequestException as e:
+        print(f"Error calling Ollama API{where}: {e}")
     
-    # Create a temp directory if it doesn't exist
-    temp_dir = "temp_images"
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
+    # Fallback to Tesseract OCR
+    return _tesseract_raw(raw)
+
+# OCR a single page with a multimodal LLM via Ollama, falling back to Tesseract.
+# Returns the text and the engine that produced it.
+def ocr_page_llm(page, page_num, model_name="llava"):
+    return _ocr_image_llm(render_page_raw(page), model_name, page_num)
+
+# Compare lines ignoring case and spacing, since OCR wraps and spaces text differently from the text layer
+def _comparable(text):
+    return " ".join(text.split()).casefold()
+
+# Text of a page that has a text layer and was also OCR'd: the native text, which is exact, followed by
+# the OCR lines it does not already hold (text that only exists in the page's images)
+def merge_ocr_text(native_text, ocr_text):
+    known = _comparable(native_text)
+    extra = [line for line in ocr_text.splitlines() if line.strip() and _comparable(line) not in known]
+    if not extra:
+        return native_text
+    return native_text.rstrip("\n") + "\n" + "\n".join(extra) + "\n"
+
+# Keep the native text if OCR found nothing, add only what OCR found beyond it otherwise, then cache the page text
+def _finish_ocr(page_hash, engine, page_text, method, native_text):
+    if not page_text.strip() and native_text:
+        page_text, method = native_text, "native"
+    elif native_text.strip():
+        page_text = merge_ocr_text(native_text, page_text)
+    # A Tesseract fallback is stored under its own key so the OCR model is tried again next time
+    cache_page(page_hash, method if method == "tesseract" else engine, page_text, method)
+    return page_text
+
+# OCR a page with the given engine ("tesseract" or an OCR model name), reusing cached results.
+# native_text is what the text layer already gave us; it is kept if OCR fails, and OCR only adds the lines it lacks.
+def ocr_page(page, page_num, engine, native_text=""):
+    page_hash = page_content_hash(page)
+    cached = get_cached_page(page_hash, engine)
+    if cached is not None:
+        return cached["text"]
     
+    try:
+        if engine == "tesseract":
+            page_text, method = ocr_page_tesseract(page), "tesseract"
+        else:
+            page_text, method = ocr_page_llm(page, page_num, engine)
+    except Exception as e:
+        print(f"Error processing page {page_num}: {e}")
+        # Continue with the text we have from the page
+        return native_text or f"[Error processing page {page_num}]"
+    
+    return _finish_ocr(page_hash, engine, page_text, method, native_text)
+
+# OCR several pages concurrently. Pages are rendered here, in the calling thread, because fitz
+# documents are not thread-safe and cannot be sent to another process; only the raw pixels are
+# handed to the pool. Results are written back into page_texts by page index, so order is preserved.
+def ocr_pages_concurrent(doc, page_nums, page_texts, engine, progress_callback=None):
+    global _ocr_pool
+    if engine == "tesseract":
+        submit = lambda raw, page_num: get_ocr_pool().submit(_tesseract_raw, raw)
+    else:
+        submit = lambda raw, page_num: get_ocr_llm_pool().submit(_ocr_image_llm, raw, engine, page_num)
+    
+    pending = {}
+    done = 0
+    for page_num in page_nums:
+        page = doc[page_num]
+        page_hash = page_content_hash(page)
+        cached = get_cached_page(page_hash, engine)
+        if cached is not None:
+            page_texts[page_num] = cached["text"]
+            done += 1
+            _report(progress_callback, "ocr", done, len(page_nums), f"OCR page {page_num + 1} ({done}/{len(page_nums)}, cached)")
+            continue
+        future = submit(render_page_raw(page), page_num)
+        pending[future] = (page_num, page_hash)
+    
+    for future in as_completed(pending):
+        page_num, page_hash = pending[future]
+        native_text = page_texts[page_num]
+        try:
+            page_text, method = future.result()
+            page_texts[page_num] = _finish_ocr(page_hash, engine, page_text, method, native_text)
+        except BrokenProcessPool as e:
+            # A worker died (e.g. killed by the OOM killer); start a fresh pool next time
+            _ocr_pool = None
+            print(f"Error processing page {page_num}: {e}")
+            page_texts[page_num] = native_text or f"[Error processing page {page_num}]"
+        except Exception as e:
+            print(f"Error processing page {page_num}: {e}")
+            page_texts[page_num] = native_text or f"[Error processing page {page_num}]"
+        done += 1
+        _report(progress_callback, "ocr", done, len(page_nums), f"OCR page {page_num + 1} ({done}/{len(page_nums)}, {engine})")
+
+# Extract every page in one pass over the document: pages with a usable text layer are read directly,
+# only scanned or mixed pages are sent to the OCR engine
+def _extract_pages(file_path, engine, progress_callback=None):
     with fitz.open(file_path) as doc:
+        page_texts = []
+        pages_to_ocr = []
         for page_num, page in enumerate(doc):
-            if not has_text(page):  # If the page doesn't have text, use OCR
-                try:
-                    # Save the page as an image
-                    pix = page.get_pixmap()
-                    img_path = os.path.join(temp_dir, f"temp_image_{page_num}.png")
-                    pix.save(img_path)
-                    
-                    # Convert the image to a base64 string
-                    with open(img_path, "rb") as img_file:
-                        img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
-                    
-                    # Call the multimodal LLM via Ollama
-                    prompt = f"""
-                    This is a page from a CV/resume. 
-                    Perform OCR to extract all the text from this image.
-                    Return only the extracted text, no additional comments.
-                    
-                    <image>
-                    data:image/png;base64,{img_base64}
-                    </image>
-                    """
-                    
-                    try:
-                        response = requests.post(
-                            OLLAMA_API_URL,
-                            json={
-                                "model": model_name,
-                                "prompt": prompt,
-                                "stream": False
-                            },
-                            timeout=30  # Add timeout
-                        )
-                        
-                        if response.status_code == 200:
-                            result = response.json()
-                            page_text = result.get("response", "")
-                            text += page_text
-                        else:
-                            # Fallback to Tesseract OCR if the LLM call fails
-                            img = Image.open(img_path)
-                            text += pytesseract.image_to_string(img)
-                    except requests.exceptions.RequestException as e:
-                        print(f"Error calling Ollama API: {e}")
-                        # Fallback to Tesseract OCR
-                        img = Image.open(img_path)
-                        text += pytesseract.image_to_string(img)
-                    
-                    # Clean up temporary image file
-                    if os.path.exists(img_path):
-                        os.remove(img_path)
-                except Exception as e:
-                    print(f"Error processing page {page_num}: {e}")
-                    # Continue with the text we have from the page
-                    text += page.get_text() or f"[Error processing page {page_num}]"
-            else:
-                text += page.get_text()
+            page_text = page.get_text()
+            page_texts.append(page_text)
+            if classify_page(page, page_text) != NATIVE:
+                pages_to_ocr.append(page_num)
+            _report(progress_callback, "text_extraction", page_num + 1, len(doc), f"Read page {page_num + 1}/{len(doc)}")
+        
+        concurrency = OCR_WORKERS if engine == "tesseract" else OCR_LLM_CONCURRENCY
+        if concurrency > 1 and len(pages_to_ocr) > 1:
+            ocr_pages_concurrent(doc, pages_to_ocr, page_texts, engine, progress_callback)
+        else:
+            for done, page_num in enumerate(pages_to_ocr, start=1):
+                page_texts[page_num] = ocr_page(doc[page_num], page_num, engine, page_texts[page_num])
+                _report(progress_callback, "ocr", done, len(pages_to_ocr), f"OCR page {page_num + 1} ({done}/{len(pages_to_ocr)}, {engine})")
     
-    return text
+    return PAGE_BREAK.join(page_texts)
+
+# Function to extract text from image-based PDFs using Tesseract OCR
+def extract_text_from_image_pdf_tesseract(file_path, progress_callback=None):
+    return _extract_pages(file_path, "tesseract", progress_callback)
 
-# Function to extract text from a PDF, choosing the appropriate method
-def extract_text(file_path, use_mistral_ocr=True, ocr_model="llava"):
+# Function to extract text from image-based PDFs using a multimodal LLM via Ollama
+def extract_text_from_image_pdf_llm(file_path, model_name="llava", progress_callback=None):
+    return _extract_pages(file_path, model_name, progress_callback)
+
+# Function to extract text from a PDF, choosing the appropriate method for each page
+def extract_text(file_path, use_mistral_ocr=True, ocr_model="llava", progress_callback=None):
     try:
         # Check if file exists
         if not os.path.exists(file_path):
             return f"Error: File not found: {file_path}"
-            
-        # First, try to extract text directly
-        text = extract_text_from_pdf(file_path)
-        
-        # If we didn't get much text, it's probably an image-based PDF
-        if len(text.strip()) < 100:  # Arbitrary threshold
-            if use_mistral_ocr:
-                try:
-                    return extract_text_from_image_pdf_llm(file_path, ocr_model)
-                except Exception as e:
-                    print(f"Error using LLM OCR: {e}")
-                    print("Falling back to Tesseract OCR")
-                    return extract_text_from_image_pdf_tesseract(file_path)
-            else:
-                return extract_text_from_image_pdf_tesseract(file_path)
         
-        return text
+        engine = ocr_model if use_mistral_ocr else "tesseract"
+        return _extract_pages(file_path, engine, progress_callback)
     except Exception as e:
         print(f"Error extracting text: {e}")
-        return f"Error extracting text: {e}" 
\ No newline at end of file
+        return f"Error extracting text: {e}"
@@ -0,0 +1,298 @@
+import atexit
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pdf_processing
+import layout
+import normalization
+
+# Processes parsing documents (text extraction and OCR) at the same time
+TEXT_WORKERS = int(os.environ.get('CV_EXTRACTOR_TEXT_WORKERS', 2))
+# Documents in the LLM stage at the same time; the dispatcher limits how many of them each model runs
+LLM_WORKERS = int(os.environ.get('CV_EXTRACTOR_LLM_WORKERS', 8))
+# Parsed documents that may wait for an LLM worker; submit() blocks once this many are waiting
+PIPELINE_QUEUE_SIZE = int(os.environ.get('CV_EXTRACTOR_PIPELINE_QUEUE', 4))
+
+# Start method of the text worker processes. Forking a process that already runs threads (Flask, jobs,
+# dispatchers, model preloading) can copy a lock another thread holds into the child, which then deadlocks.
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Pipeline stages, named like the progress stages reported by pdf_processing and llm_integration
+TEXT_STAGE = 'text_extraction'
+NORMALIZATION_STAGE = 'normalization'
+LLM_STAGE = 'llm_generation'
+
+
+class StageError(Exception):
+    """A document failed in one stage of the pipeline."""
+
+    def __init__(self, stage, error):
+        super().__init__(f"{stage} failed: {error}")
+        self.stage = stage
+        self.error = str(error)
+
+
+# Progress reports of the text worker processes go through this queue to the parent
+_progress_queue = None
+
+
+def _init_text_worker(progress_queue, ocr_workers):
+    global _progress_queue
+    # Ctrl+C is handled by the parent, which lets the documents in flight finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _progress_queue = progress_queue
+    pdf_processing.init_worker_process(ocr_workers)
+
+
+def _extract_text_worker(doc_id, file_path, use_ocr, ocr_model, report_progress):
+    def report(stage, done, total, message=''):
+        _progress_queue.put((doc_id, stage, done, total, message))
+
+    started = time.time()
+    try:
+        text = pdf_processing.extract_text(file_path, use_mistral_ocr=use_ocr, ocr_model=ocr_model,
+                                           progress_callback=report if report_progress else None)
+    except Exception as e:
+        # Library exceptions do not always unpickle in the parent; send a plain error instead
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+    sections = None
+    if layout.LAYOUT_SECTIONS:
+        try:
+            sections = layout.segment_pdf(file_path)
+        except Exception as e:
+            # Sections only make extraction cheaper; the whole text still works without them
+            print(f"Could not segment {file_path}: {e}")
+    normalized = None
+    if normalization.NORMALIZE_TEXT:
+        text, normalized = normalization.normalize_document(text)
+        if sections:
+            furniture = set(normalized['furniture'])
+            for section in sections:
+                section['text'] = normalization.clean_text(section['text'], furniture, normalized['pages'])
+        if report_progress:
+            report(NORMALIZATION_STAGE, 1, 1,
+                   f"Text normalized: ~{normalized['tokens_before']} -> ~{normalized['tokens_after']} tokens")
+    return text, sections, normalized, time.time() - started
+
+
+class ExtractionPipeline:
+    """
+    Two-stage document pipeline: a process pool extracts text, LLM worker threads generate.
+
+    Parsed documents wait in a queue for a free LLM worker. At most
+    text_workers + queue_size documents are being parsed or waiting at any
+    time; submit() blocks beyond that, so producers cannot run ahead of the
+    LLM. While one document is generating, the next ones are already parsed.
+
+    Args:
+        text_workers (int, optional): Processes running pdf_processing.extract_text
+        llm_workers (int, optional): Threads running the LLM step
+        queue_size (int, optional): Parsed documents that may wait for an LLM worker
+    """
+
+    def __init__(self, text_workers=None, llm_workers=None, queue_size=None):
+        self.text_workers = max(1, text_workers or TEXT_WORKERS)
+        self.llm_workers = max(1, llm_workers or LLM_WORKERS)
+        self.queue_size = max(0, queue_size if queue_size is not None else PIPELINE_QUEUE_SIZE)
+        self._slots = threading.BoundedSemaphore(self.text_workers + self.queue_size)
+        self._llm_queue = queue.Queue()
+        self._context = multiprocessing.get_context(START_METHOD)
+        self._progress_queue = self._context.Queue()
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._threads = []
+        self._next_id = 0
+        self._counts = {'submitted': 0, 'parsing': 0, 'waiting': 0, 'generating': 0, 'completed': 0, 'failed': 0,
+                        'tokens_before': 0, 'tokens_after': 0}
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # Share the OCR processes between the text workers instead of multiplying them
+                ocr_workers = max(1, pdf_processing.OCR_WORKERS // self.text_workers)
+                self._pool = ProcessPoolExecutor(max_workers=self.text_workers, mp_context=self._context,
+                                                 initializer=_init_text_worker,
+                                                 initargs=(self._progress_queue, ocr_workers))
+            if not self._threads:
+                for i in range(self.llm_workers):
+                    self._threads.append(threading.Thread(target=self._llm_worker, name=f'pipeline-llm-{i}', daemon=True))
+                self._threads.append(threading.Thread(target=self._relay_progress, name='pipeline-progress', daemon=True))
+                for thread in self._threads:
+                    thread.start()
+            return self._pool
+
+    def _reset_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+
+    def _count(self, **changes):
+        with self._lock:
+            for name, amount in changes.items():
+                self._counts[name] += amount
+
+    def submit(self, file_path, llm_func, use_ocr=False, ocr_model='llava', progress_callback=None):
+        """
+        Queue a document; blocks while the text stage and its queue are full.
+
+        Args:
+            file_path (str): The PDF or image to process
+            llm_func (callable): Called as llm_func(text, progress_callback, sections) by an LLM
+                worker; sections come from layout.segment_pdf and may be None
+            use_ocr (bool): Whether to use the multimodal OCR model for scanned pages
+            ocr_model (str): OCR model used when use_ocr is set
+            progress_callback (callable, optional): Called as progress_callback(stage, done, total, message)
+                from both stages
+
+        Returns:
+            concurrent.futures.Future: Resolves to a dict with 'text', 'sections', 'normalization'
+            (the report of normalization.normalize_document, None when disabled), 'result' (the
+            return value of llm_func), 'text_time' and 'llm_time', or raises StageError
+        """
+        self._slots.acquire()
+        future = Future()
+        with self._lock:
+            doc_id = self._next_id
+            self._next_id += 1
+            if progress_callback:
+                self._callbacks[doc_id] = progress_callback
+        self._count(submitted=1, parsing=1)
+
+        try:
+            pool = self._get_pool()
+            try:
+                text_future = pool.submit(_extract_text_worker, doc_id, file_path, use_ocr, ocr_model,
+                                          progress_callback is not None)
+            except BrokenProcessPool:
+                # A worker died earlier; start a fresh pool and try once more
+                self._reset_pool(pool)
+                pool = self._get_pool()
+                text_future = pool.submit(_extract_text_worker, doc_id, file_path, use_ocr, ocr_model,
+                                          progress_callback is not None)
+        except BaseException:
+            # The document never reached the text stage: give its slot back and take it out of the counts
+            with self._lock:
+                self._callbacks.pop(doc_id, None)
+            self._count(submitted=-1, parsing=-1)
+            self._slots.release()
+            raise
+        text_future.add_done_callback(lambda f: self._text_done(doc_id, pool, f, future, llm_func))
+        return future
+
+    def _fail(self, doc_id, future, error):
+        with self._lock:
+            self._callbacks.pop(doc_id, None)
+            self._counts['failed'] += 1
+        future.set_exception(error)
+
+    def _text_done(self, doc_id, pool, text_future, future, llm_func):
+        self._count(parsing=-1)
+        try:
+            text, sections, normalized, text_time = text_future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._reset_pool(pool)
+            self._slots.release()
+            self._fail(doc_id, future, StageError(TEXT_STAGE, e))
+            return
+        if normalized:
+            self._count(tokens_before=normalized['tokens_before'], tokens_after=normalized['tokens_after'])
+        self._count(waiting=1)
+        self._llm_queue.put((doc_id, future, text, sections, normalized, text_time, llm_func))
+
+    def _llm_worker(self):
+        while True:
+            item = self._llm_queue.get()
+            if item is None:
+                return
+            doc_id, future, text, sections, normalized, text_time, llm_func = item
+            # Taking a document off the queue lets the text stage parse the next one
+            self._slots.release()
+            self._count(waiting=-1, generating=1)
+            started = time.time()
+            try:
+                result = llm_func(text, self._callbacks.get(doc_id), sections)
+            except Exception as e:
+                self._fail(doc_id, future, StageError(LLM_STAGE, e))
+            else:
+                with self._lock:
+                    self._callbacks.pop(doc_id, None)
+                    self._counts['completed'] += 1
+                future.set_result({'text': text, 'sections': sections, 'normalization': normalized, 'result': result,
+                                   'text_time': text_time, 'llm_time': time.time() - started})
+            finally:
+                self._count(generating=-1)
+
+    def _relay_progress(self):
+        while True:
+            item = self._progress_queue.get()
+            if item is None:
+                return
+            doc_id, stage, done, total, message = item
+            callback = self._callbacks.get(doc_id)
+            if callback:
+                try:
+                    callback(stage, done, total, message)
+                except Exception as e:
+                    print(f"Progress callback failed: {e}")
+
+    def stats(self):
+        """
+        Current load of each stage.
+
+        Returns:
+            dict: Documents submitted, parsing, waiting for the LLM, generating,
+            completed and failed, the estimated prompt tokens of the parsed documents
+            before and after normalization, plus the configured limits
+        """
+        with self._lock:
+            stats = dict(self._counts)
+        stats.update(text_workers=self.text_workers, llm_workers=self.llm_workers, queue_size=self.queue_size)
+        return stats
+
+    def shutdown(self, wait=True):
+        """
+        Stop the workers once the documents already submitted are done.
+
+        Args:
+            wait (bool): Whether to block until they are
+        """
+        with self._lock:
+            pool, threads = self._pool, self._threads
+            self._pool, self._threads = None, []
+        if pool is not None:
+            pool.shutdown(wait=wait)
+        for _ in range(len(threads) - 1):
+            self._llm_queue.put(None)
+        if threads:
+            self._progress_queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """
+    Return the process-wide pipeline used by the web application.
+
+    Returns:
+        ExtractionPipeline: Configured from CV_EXTRACTOR_TEXT_WORKERS,
+        CV_EXTRACTOR_LLM_WORKERS and CV_EXTRACTOR_PIPELINE_QUEUE
+    """
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = ExtractionPipeline()
+                atexit.register(_pipeline.shutdown)
+    return _pipeline
@@ -0,0 +1,224 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+import model_registry
+
+# Consecutive availability failures (timeouts, connection errors, HTTP errors) that open a model's circuit
+BREAKER_FAILURES = int(os.environ.get('CV_EXTRACTOR_BREAKER_FAILURES', 3))
+# Seconds an open circuit rejects requests before one trial request is let through
+BREAKER_RESET = float(os.environ.get('CV_EXTRACTOR_BREAKER_RESET', 60))
+# Adaptive timeout: this multiple of the model's observed p95 latency, never below MIN_TIMEOUT
+# and never above the model's configured timeout
+TIMEOUT_PERCENTILE = 95
+TIMEOUT_MULTIPLIER = float(os.environ.get('CV_EXTRACTOR_TIMEOUT_MULTIPLIER', 2.0))
+MIN_TIMEOUT = float(os.environ.get('CV_EXTRACTOR_MIN_TIMEOUT', 30))
+# Successful generations remembered per model and kind of request, and how many are needed before timeouts adapt
+LATENCY_WINDOW = 100
+MIN_LATENCY_SAMPLES = 5
+# Budget in seconds for one CV's LLM work, across every retry and fallback model
+JOB_DEADLINE = float(os.environ.get('CV_EXTRACTOR_JOB_DEADLINE', 600))
+# Hedged extraction starts the backup model once the preferred one has run longer than this percentile
+# of its recent latencies, or HEDGE_DELAY seconds until enough generations have been observed
+HEDGE_PERCENTILE = float(os.environ.get('CV_EXTRACTOR_HEDGE_PERCENTILE', 90))
+HEDGE_DELAY = float(os.environ.get('CV_EXTRACTOR_HEDGE_DELAY', 60))
+
+# Circuit states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Kinds of request, whose latencies are tracked apart: a whole CV, or one chunk or section of it,
+# which is much shorter and would otherwise pull the whole-CV timeout down
+FULL = 'full'
+PART = 'part'
+
+
+class CircuitBreaker:
+    """
+    Stop sending requests to a model that keeps failing.
+
+    After BREAKER_FAILURES consecutive failures the circuit opens and
+    allow() returns False. After BREAKER_RESET seconds one trial request is
+    allowed (half open); its success closes the circuit, its failure opens
+    it again.
+    """
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.failure_threshold = failure_threshold or BREAKER_FAILURES
+        self.reset_timeout = reset_timeout or BREAKER_RESET
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial_running = False
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def release(self):
+        """Forget a request that ended without telling whether the model works (e.g. it was cancelled)."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    print(f"Circuit opened after {self.failures} consecutive failures")
+                self.state = OPEN
+                self.opened_at = time.time()
+            self._trial_running = False
+
+    def as_dict(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'opened_at': self.opened_at}
+
+
+class LatencyTracker:
+    """Sliding window of successful generation times for one model."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        """The pct-th percentile (nearest rank), or None until MIN_LATENCY_SAMPLES have been recorded."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        rank = max(1, math.ceil(pct / 100 * len(samples)))
+        return samples[rank - 1]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+_breakers = {}
+_latencies = {}
+_state_lock = threading.Lock()
+
+
+def get_breaker(model_id):
+    with _state_lock:
+        if model_id not in _breakers:
+            _breakers[model_id] = CircuitBreaker()
+        return _breakers[model_id]
+
+
+def get_latency(model_id, kind=FULL):
+    with _state_lock:
+        if (model_id, kind) not in _latencies:
+            _latencies[(model_id, kind)] = LatencyTracker()
+        return _latencies[(model_id, kind)]
+
+
+def allow(model_id):
+    """Whether a request may be sent to the model now (its circuit is not open)."""
+    return get_breaker(model_id).allow()
+
+
+def record_success(model_id, seconds=None, kind=FULL):
+    """
+    The model answered; close the circuit and, for a usable generation, learn its latency.
+
+    Args:
+        model_id (str): Registry id of the model
+        seconds (float, optional): How long the generation ran once it had a dispatcher slot
+        kind (str): FULL or PART, the kind of request the latency is learnt for
+    """
+    get_breaker(model_id).record_success()
+    if seconds is not None:
+        get_latency(model_id, kind).record(seconds)
+
+
+def record_failure(model_id):
+    """The model timed out or could not be reached."""
+    get_breaker(model_id).record_failure()
+
+
+def record_cancelled(model_id):
+    """The request was abandoned before the model answered, e.g. the losing side of a hedged extraction."""
+    get_breaker(model_id).release()
+
+
+def adaptive_timeout(model_id, kind=FULL):
+    """
+    Total time allowed for one generation of a kind of request by a model.
+
+    Returns:
+        float: TIMEOUT_MULTIPLIER times the observed p95 latency, kept between
+        MIN_TIMEOUT and the model's configured timeout (the configured timeout
+        until enough generations have been observed)
+    """
+    configured = model_registry.get_timeout(model_id)
+    p95 = get_latency(model_id, kind).percentile(TIMEOUT_PERCENTILE)
+    if p95 is None:
+        return configured
+    return min(configured, max(MIN_TIMEOUT, p95 * TIMEOUT_MULTIPLIER))
+
+
+def hedge_delay(model_id, kind=FULL):
+    """
+    Seconds to wait for a model before a hedged extraction also starts the next one.
+
+    Returns:
+        float: The HEDGE_PERCENTILE of the model's recent latencies for this kind
+        of request, HEDGE_DELAY until enough generations have been observed
+    """
+    latency = get_latency(model_id, kind).percentile(HEDGE_PERCENTILE)
+    return HEDGE_DELAY if latency is None else latency
+
+
+def make_deadline(budget=None):
+    """Absolute time by which a job's LLM work must be done, JOB_DEADLINE seconds from now by default."""
+    return time.time() + (JOB_DEADLINE if budget is None else budget)
+
+
+def remaining(deadline):
+    """Seconds left before the deadline (never negative)."""
+    return max(0.0, deadline - time.time())
+
+
+def status():
+    """
+    Circuit state and latency of every model seen so far, as shown in /metrics.
+
+    Returns:
+        dict: Per model id, the circuit state and, per kind of request, the
+        recent p95 latency and current adaptive timeout
+    """
+    with _state_lock:
+        model_ids = sorted(set(_breakers) | {model_id for model_id, _ in _latencies})
+    summary = {}
+    for model_id in model_ids:
+        entry = get_breaker(model_id).as_dict()
+        for kind in (FULL, PART):
+            latency = get_latency(model_id, kind)
+            entry[kind] = {'samples': len(latency), 'p95_latency': latency.percentile(TIMEOUT_PERCENTILE)}
+            if model_id in model_registry.MODELS:
+                entry[kind]['timeout'] = adaptive_timeout(model_id, kind)
+        summary[model_id] = entry
+    return summary
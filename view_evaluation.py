@@ -5,6 +5,7 @@ import io
 import base64
 from jinja2 import Template
 from run_evaluation import run_evaluation
+import model_registry
 
 def create_html_report(evaluation_results):
     """
@@ -267,7 +268,7 @@ def create_html_report(evaluation_results):
     generation_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
     # Model display names
-    model_names = {'phi': 'Phi-2', 'llama3': 'LLaMA 3', 'mistral': 'Mistral'}
+    model_names = model_registry.display_names()
     
     # Render the template
     html = template.render(